@@ -0,0 +1,30 @@
+from fastapi import Request
+
+from lib.db.consistency import ReadYourWrites, request_consistency, parse_lsn, format_lsn
+
+# client passes WAL position from response of its write to see this write in following reads
+MIN_LSN_HEADER = 'X-Min-Lsn'
+WAL_LSN_HEADER = 'X-Wal-Lsn'
+
+
+async def read_your_writes(request: Request, call_next):
+    """Middleware: reads go to replicas which have replayed X-Min-Lsn, writes return X-Wal-Lsn"""
+    state = ReadYourWrites()
+
+    header = request.headers.get(MIN_LSN_HEADER)
+    if header:
+        try:
+            state.min_lsn = parse_lsn(header)
+        except ValueError:
+            pass
+
+    token = request_consistency.set(state)
+    try:
+        response = await call_next(request)
+    finally:
+        request_consistency.reset(token)
+
+    if state.write_lsn is not None:
+        response.headers[WAL_LSN_HEADER] = format_lsn(state.write_lsn)
+
+    return response
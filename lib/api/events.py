@@ -3,19 +3,26 @@ from fastapi import APIRouter, HTTPException
 
 from lib.models.events import RCreateEvent, Event, EDecision
 from lib.db import Database
-from lib.sql.event import insert_event, get_one_event
+from lib.db.consistency import remember_write_lsn
+from lib.modules.occurrences import OccurrenceMaterializer
+from lib.sql.event import insert_event, insert_many_events, get_one_event
 from lib.sql.participation import accept_participation
 
 router = APIRouter(
     prefix='/event'
 )
 
+MAX_BULK_EVENTS = 10_000
+
 
 @router.post('/')
 async def create_event(event_create_request: RCreateEvent) -> Event:
     async with Database().connect() as connection:
         try:
-            event = await insert_event(connection, event_create_request)
+            event = await insert_event(
+                connection, event_create_request, materialize_until=OccurrenceMaterializer().horizon
+            )
+            await remember_write_lsn(connection)
         except exc.UniqueViolationError:
             return HTTPException(status_code=400, detail='Event already exists')
         except exc.ForeignKeyViolationError:
@@ -24,10 +31,31 @@ async def create_event(event_create_request: RCreateEvent) -> Event:
     return event
 
 
+@router.post('/bulk')
+async def create_many_events(event_create_requests: list[RCreateEvent]) -> list[Event]:
+    """Creates all events or none of them, events are returned in order of requests"""
+    if len(event_create_requests) > MAX_BULK_EVENTS:
+        raise HTTPException(status_code=400, detail=f'Too many events, at most {MAX_BULK_EVENTS} allowed')
+
+    async with Database().connect() as connection:
+        try:
+            events = await insert_many_events(
+                connection, event_create_requests, materialize_until=OccurrenceMaterializer().horizon
+            )
+            await remember_write_lsn(connection)
+        except exc.UniqueViolationError:
+            raise HTTPException(status_code=400, detail='Event or participant is duplicated')
+        except exc.ForeignKeyViolationError:
+            raise HTTPException(status_code=400, detail='User not found')
+
+    return events
+
+
 @router.post('/{event_id}/accept')
 async def accept_event_by_user(event_id: int, user_login: str, decision: EDecision):
     async with Database().connect() as connection:
         await accept_participation(connection, event_id, user_login, decision)
+        await remember_write_lsn(connection)
 
 
 @router.get('/{event_id}')
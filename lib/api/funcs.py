@@ -1,77 +1,54 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 
-from lib.models.funcs import RCalcFreeTime, FreeTime
-from lib.sql.funcs import get_users_busy_time
+from lib.models.funcs import RCalcFreeTime, RCalcFreeSlots, FreeTime
+from lib.sql.funcs import get_users_busy_time, BUSY_TIME_PERIOD
 from lib.db import Database
-from datetime import datetime
+from lib.util.free_time import find_free_slot, find_free_slots
 
 router = APIRouter(
     prefix='/funcs'
 )
 
-
-class IterUsersTimes:
-    def __init__(self, connection, request: RCalcFreeTime, stop_after_iterations=5):
-        self.connection = connection
-        self.request = request
-        self.stop_after_iteration = stop_after_iterations
-        self.start_time = request.start_calc_from
-        self.values = []
-
-    def __aiter__(self):
-        return self
-
-    async def preload(self):
-        if self.values:
-            raise RuntimeError('Already loaded data')
-
-        self.stop_after_iteration -= 1
-        self.values = await get_users_busy_time(self.connection, self.request.user_logins, self.start_time)
-
-    async def __anext__(self) -> tuple[datetime, datetime]:
-        if self.values:
-            value = self.values.pop(0)
-            self.start_time = value[1]
-            return value
-
-        self.stop_after_iteration -= 1
-        if self.stop_after_iteration:
-            raise StopAsyncIteration
-
-        self.values = await get_users_busy_time(self.connection, self.request.user_logins, self.start_time)
-        if not self.values:
-            raise StopAsyncIteration
-
-        value = self.values.pop(0)
-        self.start_time = value[1]
-        return value
+MAX_SEARCH_PERIOD = BUSY_TIME_PERIOD * 13
 
 
 @router.post('/calc_free_slot')
 async def calculate_free_slot(request: RCalcFreeTime):
+    end_period = request.start_calc_from + BUSY_TIME_PERIOD
+
     async with Database().connect(read_only=True) as connection:
-        busy_times = IterUsersTimes(connection, request, stop_after_iterations=5)
-        await busy_times.preload()
+        busy_times = await get_users_busy_time(
+            connection, request.user_logins, request.start_calc_from, end_period
+        )
 
-        try:
-            first = await busy_times.__anext__()
-        except StopAsyncIteration:
-            first = None
+    slot = find_free_slot(busy_times, request.event_duration, request.start_calc_from, end_period)
+    if slot is None:
+        return FreeTime()
 
-        if not first or first[0] - request.start_calc_from >= request.event_duration:
-            return FreeTime(
-                start=request.start_calc_from,
-                end=request.start_calc_from + request.event_duration
-            )
+    return FreeTime(start=slot[0], end=slot[1])
 
-        prev_end = first[1]
-        async for time_start, time_end in busy_times:
-            if prev_end < time_start and time_start - prev_end >= request.event_duration:
-                return FreeTime(
-                    start=prev_end,
-                    end=prev_end + request.event_duration,
-                )
 
-            prev_end = max(prev_end, time_end)
+@router.post('/calc_free_slots')
+async def calculate_free_slots(request: RCalcFreeSlots) -> list[FreeTime]:
+    end_period = request.search_until or request.start_calc_from + BUSY_TIME_PERIOD
+    if end_period <= request.start_calc_from:
+        raise HTTPException(status_code=400, detail='search_until should be greater than start_calc_from')
 
-    return FreeTime()
+    if end_period - request.start_calc_from > MAX_SEARCH_PERIOD:
+        raise HTTPException(status_code=400, detail=f'search period should be less than {MAX_SEARCH_PERIOD.days} days')
+
+    async with Database().connect(read_only=True) as connection:
+        busy_times = await get_users_busy_time(
+            connection, request.user_logins, request.start_calc_from, end_period
+        )
+
+    slots = find_free_slots(
+        busy_times,
+        request.event_duration,
+        request.start_calc_from,
+        end_period,
+        count=request.count,
+        granularity=request.granularity,
+    )
+
+    return [FreeTime(start=start, end=end) for start, end in slots]
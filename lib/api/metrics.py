@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from lib.db import Database
+from lib.db.metrics import render_metrics, PROMETHEUS_CONTENT_TYPE
+from lib.db.statements import get_statements_stats
+
+router = APIRouter()
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics of database pools and statements in Prometheus text format"""
+    return PlainTextResponse(
+        render_metrics(Database().pool, get_statements_stats()),
+        media_type=PROMETHEUS_CONTENT_TYPE,
+    )
@@ -0,0 +1,15 @@
+import math
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from lib.db.breaker import PoolUnavailableError
+
+
+async def pool_unavailable(request: Request, exc: PoolUnavailableError):
+    """Exception handler: request is rejected with 503 if no database pool can serve it now"""
+    return JSONResponse(
+        status_code=503,
+        content={'detail': str(exc)},
+        headers={'Retry-After': str(math.ceil(exc.retry_after))},
+    )
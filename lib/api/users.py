@@ -1,12 +1,23 @@
 from datetime import datetime
+from typing import AsyncIterator, Optional
 
 import asyncpg.exceptions as exc
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 
+from lib.models.events import EventsPage, UsersEvents
 from lib.models.users import UserFull
 from lib.db import Database
+from lib.db.consistency import remember_write_lsn
 from lib.sql.user import insert_user, get_one_user
-from lib.sql.event import get_user_events as sql_get_user_events
+from lib.sql.event import (
+    get_user_events as sql_get_user_events,
+    get_events_by_users,
+    get_user_events_page,
+    iterate_user_events,
+    EventKey,
+)
+from lib.util.cursor import encode_cursor, decode_cursor
 
 from logging import getLogger
 
@@ -18,6 +29,11 @@ router = APIRouter(
 
 
 USER_EXISTS = HTTPException(status_code=400, detail='User already exists')
+INVALID_INTERVAL = HTTPException(status_code=400, detail='time_from should not be greater than time_to')
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+MAX_PAGE_LIMIT = 1000
+MAX_LOGINS = 100
 
 
 @router.post('/', status_code=201)
@@ -28,6 +44,7 @@ async def create_user(user: UserFull):
     try:
         async with Database().connect() as connection:
             await insert_user(connection, user)
+            await remember_write_lsn(connection)
     except exc.UniqueViolationError:
         return HTTPException(status_code=400, detail='User already exists')
     except Exception as e:
@@ -35,8 +52,56 @@ async def create_user(user: UserFull):
         return HTTPException(status_code=500)
 
 
+@router.get('/events')
+async def get_users_events(time_from: datetime, time_to: datetime, logins: list[str] = Query(...)) -> UsersEvents:
+    """Returns events of several users at once, shared events are returned once"""
+    if time_from > time_to:
+        raise INVALID_INTERVAL
+
+    logins = set(logins)
+    if not logins or len(logins) > MAX_LOGINS:
+        raise HTTPException(status_code=400, detail=f'From 1 to {MAX_LOGINS} logins should be passed')
+
+    async with Database().connect(read_only=True) as connection:
+        events, by_user = await get_events_by_users(connection, logins, time_from, time_to)
+
+    return UsersEvents(events=events, users=by_user)
+
+
+async def stream_user_events(
+        login: str, time_from: datetime, time_to: datetime, after: Optional[EventKey] = None
+) -> AsyncIterator[str]:
+    async with Database().connect(read_only=True) as connection:
+        async for event in iterate_user_events(connection, login, time_from, time_to, after=after):
+            yield event.json() + '\n'
+
+
 @router.get('/{login}/events')
-async def get_user_events(login: str, time_from: datetime, time_to: datetime):
+async def get_user_events(
+        login: str,
+        time_from: datetime,
+        time_to: datetime,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        request: Request = None,
+):
+    """Returns events sorted by start, with `Accept: application/x-ndjson` events are streamed one per line
+
+    If limit or cursor is passed, returns page of events and cursor of the next page.
+    """
+    if time_from > time_to:
+        raise INVALID_INTERVAL
+
+    after = None
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Cursor is not valid')
+
+    if limit is not None and not (1 <= limit <= MAX_PAGE_LIMIT):
+        raise HTTPException(status_code=400, detail=f'Limit should be in [1, {MAX_PAGE_LIMIT}]')
+
     async with Database().connect(read_only=True) as connection:
         try:
             await get_one_user(connection, login, full=False)
@@ -46,6 +111,17 @@ async def get_user_events(login: str, time_from: datetime, time_to: datetime):
             logger.exception('failed to load user')
             return HTTPException(status_code=500)
 
+        if request is not None and NDJSON_MEDIA_TYPE in request.headers.get('accept', ''):
+            return StreamingResponse(
+                stream_user_events(login, time_from, time_to, after), media_type=NDJSON_MEDIA_TYPE
+            )
+
+        if limit is not None or after is not None:
+            events, next_key = await get_user_events_page(
+                connection, login, time_from, time_to, limit or MAX_PAGE_LIMIT, after
+            )
+            return EventsPage(events=events, next_cursor=encode_cursor(*next_key) if next_key else None)
+
         events = await sql_get_user_events(connection, login, time_from, time_to)
 
     return events
@@ -1,12 +1,13 @@
+import itertools
 from typing import Optional
-from abc import abstractmethod
+from abc import ABC, abstractmethod
 import random
 
 
-class BalancerPolicy:
+class BalancerPolicy(ABC):
     """
-        Implements greedy balancer policy for pool manager
-        Returns less loaded pool
+        Base balancer policy for pool manager
+        Collects candidate pools, subclasses choose one of them
     """
     def __init__(self, pool_manager):
         self._pool_manager = pool_manager
@@ -15,7 +16,8 @@ class BalancerPolicy:
             self,
             read_only: bool,
             fallback_master: Optional[bool] = None,
-            master_as_replica_weight: Optional[float] = None
+            master_as_replica_weight: Optional[float] = None,
+            min_lsn: Optional[int] = None,
     ):
         if not read_only and master_as_replica_weight is not None:
             raise ValueError(
@@ -32,14 +34,15 @@ class BalancerPolicy:
             read_only=read_only,
             fallback_master=fallback_master or choose_master_as_replica,
             choose_master_as_replica=choose_master_as_replica,
+            min_lsn=min_lsn,
         )
 
-    @abstractmethod
     async def _get_pool(
             self,
             read_only: bool,
             fallback_master: Optional[bool] = None,
-            choose_master_as_replica: bool = False
+            choose_master_as_replica: bool = False,
+            min_lsn: Optional[int] = None,
     ):
         candidates = []
         if read_only:
@@ -48,9 +51,17 @@ class BalancerPolicy:
                     fallback_master=fallback_master
                 )
             )
+            if min_lsn is not None:
+                # read your writes, replicas which have not replayed them yet are skipped
+                candidates = [
+                    candidate
+                    for candidate in candidates
+                    if self._pool_manager.pool_has_replayed(candidate, min_lsn)
+                ]
 
         if (
             not read_only or
+            not candidates or
             (
                 choose_master_as_replica and
                 self._pool_manager.master_pool_count > 0
@@ -58,6 +69,26 @@ class BalancerPolicy:
         ):
             candidates.extend(await self._pool_manager.get_master_pools())
 
+        if len(candidates) == 1:
+            return candidates[0]
+
+        return self._choose(candidates)
+
+    @abstractmethod
+    def _choose(self, candidates: list):
+        """Returns one of candidate pools, there are at least two of them"""
+
+    def _latency(self, pool) -> float:
+        # pool without measurements yet is considered fast, so it gets traffic and measurements
+        return self._pool_manager.get_last_response_time(pool) or 0.
+
+
+class GreedyBalancerPolicy(BalancerPolicy):
+    """
+        Implements greedy balancer policy for pool manager
+        Returns less loaded pool
+    """
+    def _choose(self, candidates: list):
         fat_pool = max(candidates, key=self._pool_manager.get_pool_freesize)
         max_freesize = self._pool_manager.get_pool_freesize(fat_pool)
 
@@ -66,3 +97,48 @@ class BalancerPolicy:
             for candidate in candidates
             if self._pool_manager.get_pool_freesize(candidate) == max_freesize
         ])
+
+
+class LeastLatencyBalancerPolicy(BalancerPolicy):
+    """
+        Returns pool with the least median response time among pools having free connections
+    """
+    def _choose(self, candidates: list):
+        free = [
+            candidate
+            for candidate in candidates
+            if self._pool_manager.get_pool_freesize(candidate) > 0
+        ]
+        return min(free or candidates, key=self._latency)
+
+
+class PowerOfTwoChoicesBalancerPolicy(BalancerPolicy):
+    """
+        Picks two random pools and returns one with less median response time per free connection
+    """
+    def _score(self, pool) -> float:
+        return self._latency(pool) / (self._pool_manager.get_pool_freesize(pool) + 1)
+
+    def _choose(self, candidates: list):
+        first, second = random.sample(candidates, 2)
+        return first if self._score(first) <= self._score(second) else second
+
+
+class RoundRobinBalancerPolicy(BalancerPolicy):
+    """
+        Returns pools in turn
+    """
+    def __init__(self, pool_manager):
+        super().__init__(pool_manager)
+        self._counter = itertools.count()
+
+    def _choose(self, candidates: list):
+        return candidates[next(self._counter) % len(candidates)]
+
+
+BALANCER_POLICIES: dict[str, type[BalancerPolicy]] = {
+    'greedy': GreedyBalancerPolicy,
+    'least_latency': LeastLatencyBalancerPolicy,
+    'power_of_two': PowerOfTwoChoicesBalancerPolicy,
+    'round_robin': RoundRobinBalancerPolicy,
+}
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import Optional
+
+import asyncpg
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 5.
+
+# errors which mean host or connection to it is broken, not a failed query
+CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.AdminShutdownError,
+    asyncpg.exceptions.TooManyConnectionsError,
+)
+
+
+def is_host_failure(error: BaseException) -> bool:
+    # asyncio.TimeoutError is OSError since python 3.11, but waiting for connection of busy pool is not a host failure
+    return isinstance(error, CONNECTION_ERRORS) and not isinstance(error, asyncio.TimeoutError)
+
+
+class PoolUnavailableError(Exception):
+    """No pool can serve the request now, request should be retried in retry_after seconds"""
+
+    def __init__(self, message: str, retry_after: float = 1.):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+        Stops sending requests to host after failure_threshold failures in a row.
+        After reset_timeout breaker is half open: exactly one trial request is let through,
+        its result closes breaker or opens it again, other requests are not sent to host till then
+    """
+    __slots__ = (
+        'failure_threshold',
+        'reset_timeout',
+        'failures',
+        'opened_at',
+        'trial',
+    )
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # trial request of half open breaker is not finished
+        self.trial = False
+
+    @property
+    def is_closed(self) -> bool:
+        return self.opened_at is None
+
+    @property
+    def is_open(self) -> bool:
+        """Requests are not sent to host: it failed recently or its trial request is not finished"""
+        return not self.is_closed and (self.trial or self.retry_in() > 0)
+
+    def retry_in(self) -> float:
+        """Seconds till requests are let through again, while trial request runs it is not known"""
+        if self.is_closed:
+            return 0.
+        if self.trial:
+            return self.reset_timeout
+        return max(0., self.opened_at + self.reset_timeout - time.monotonic())
+
+    def allow_request(self) -> bool:
+        """Request goes to host, in half open state it becomes the trial request"""
+        if self.is_closed:
+            return True
+        if self.is_open:
+            return False
+        self.trial = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial = False
+        if self.failures >= self.failure_threshold:
+            # reopened if failed in half open state
+            self.opened_at = time.monotonic()
+
+    def cancel_trial(self):
+        """Trial request finished without result (timeout, cancellation), next request becomes the trial one"""
+        self.trial = False
@@ -0,0 +1,51 @@
+from contextvars import ContextVar
+from typing import Optional
+
+from asyncpg import Connection
+
+
+class ReadYourWrites:
+    """WAL positions of current request
+
+    min_lsn: replica should have replayed it to serve reads of request, otherwise master is used
+    write_lsn: position on master after writes of request
+    """
+    __slots__ = ('min_lsn', 'write_lsn')
+
+    def __init__(self, min_lsn: Optional[int] = None):
+        self.min_lsn = min_lsn
+        self.write_lsn: Optional[int] = None
+
+
+request_consistency: ContextVar[Optional[ReadYourWrites]] = ContextVar('request_consistency', default=None)
+
+
+def parse_lsn(value: str) -> int:
+    """Parses LSN in postgres text format (16/B374D848)"""
+    high, sep, low = value.strip().partition('/')
+    if not sep or not high or not low:
+        raise ValueError(f'invalid LSN {value!r}')
+
+    high, low = int(high, 16), int(low, 16)
+    if not 0 <= high <= 0xFFFFFFFF or not 0 <= low <= 0xFFFFFFFF:
+        raise ValueError(f'invalid LSN {value!r}')
+
+    return (high << 32) | low
+
+
+def format_lsn(lsn: int) -> str:
+    return f'{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}'
+
+
+def get_min_lsn() -> Optional[int]:
+    state = request_consistency.get()
+    return state.min_lsn if state is not None else None
+
+
+async def remember_write_lsn(connection: Connection):
+    """Remembers WAL position after writes of current request, nothing is done outside of request"""
+    state = request_consistency.get()
+    if state is None:
+        return
+
+    state.write_lsn = await connection.fetchval('SELECT pg_current_wal_lsn()')
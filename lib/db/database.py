@@ -3,7 +3,10 @@ import os
 from typing import Optional
 from asyncpg import Connection
 
+from lib.db.balancer_policy import BALANCER_POLICIES
+from lib.db.consistency import get_min_lsn
 from lib.db.pool import PoolManager
+from lib.db.statements import EStatementMode, set_statement_mode
 from lib.util.module import BaseModule, SingletonModule
 
 
@@ -21,6 +24,23 @@ class Database(BaseModule, metaclass=SingletonModule):
             'max_size': {'type': 'integer', 'default': 10},
             'timeout': {'type': 'integer', 'default': 30},
             'master_as_replica_weight': {'type': 'float', 'default': 0.5},
+            'max_refresh_delay': {'type': 'float', 'default': 10.0},  # seconds
+            # file to share results of hosts checks between worker processes, only one of them checks hosts
+            'health_state_path': {'type': 'string', 'nullable': True, 'default': None},
+            'max_replica_lag': {'type': 'float', 'nullable': True, 'default': 10.0},  # seconds
+            # seconds to wait for available master or replica before request fails, null - till timeout
+            'pool_wait_timeout': {'type': 'float', 'nullable': True, 'default': 1.0},
+            # requests waiting for connection of one host, others are rejected at once, null - no limit
+            'max_waiting': {'type': 'integer', 'nullable': True, 'default': None},
+            # failed connections in a row after which host is not used for breaker_reset_timeout seconds
+            'breaker_failures': {'type': 'integer', 'default': 5},
+            'breaker_reset_timeout': {'type': 'float', 'default': 5.0},
+            'balancer_policy': {'type': 'string', 'allowed': list(BALANCER_POLICIES), 'default': 'greedy'},
+            'prepared_statements': {
+                'type': 'string',
+                'allowed': [mode.value for mode in EStatementMode],
+                'default': EStatementMode.named.value,
+            },
         }
     }
 
@@ -40,13 +60,36 @@ class Database(BaseModule, metaclass=SingletonModule):
         self.max_size: int = self.config['max_size']
         self.timeout: int = self.config['timeout']
         self.master_as_replica_weight: float = self.config['master_as_replica_weight']
+        self.max_refresh_delay: float = self.config.get('max_refresh_delay', 10.0)
+        self.health_state_path: Optional[str] = self.config.get('health_state_path')
+        self.max_replica_lag: Optional[float] = self.config.get('max_replica_lag')
+        self.balancer_policy: str = self.config.get('balancer_policy', 'greedy')
+        self.pool_wait_timeout: Optional[float] = self.config.get('pool_wait_timeout', 1.0)
+        self.max_waiting: Optional[int] = self.config.get('max_waiting')
+        self.breaker_failures: int = self.config.get('breaker_failures', 5)
+        self.breaker_reset_timeout: float = self.config.get('breaker_reset_timeout', 5.0)
+        self.prepared_statements = EStatementMode(self.config.get('prepared_statements', EStatementMode.named))
+
+        set_statement_mode(self.prepared_statements)
+        pool_factory_kwargs = {'min_size': self.min_size, 'max_size': self.max_size}
+        if self.prepared_statements == EStatementMode.unnamed:
+            # pgbouncer in transaction mode can not keep statements asyncpg prepares for its cache
+            pool_factory_kwargs['statement_cache_size'] = 0
 
         self.pool: Optional[PoolManager] = PoolManager(
             self.dsn,
-            pool_factory_kwargs={'min_size': self.min_size, 'max_size': self.max_size},
+            pool_factory_kwargs=pool_factory_kwargs,
             fallback_master=True,
             master_as_replica_weight=self.master_as_replica_weight,
             acquire_timeout=self.timeout,
+            balancer_policy=BALANCER_POLICIES[self.balancer_policy],
+            max_replica_lag=self.max_replica_lag,
+            max_refresh_delay=self.max_refresh_delay,
+            shared_state_path=self.health_state_path,
+            pool_wait_timeout=self.pool_wait_timeout,
+            max_waiting=self.max_waiting,
+            breaker_failures=self.breaker_failures,
+            breaker_reset_timeout=self.breaker_reset_timeout,
             loop=loop,
         )
 
@@ -54,8 +97,11 @@ class Database(BaseModule, metaclass=SingletonModule):
     def dsn(self):
         return f'postgresql://{self.user}:{self.password}@{",".join("%s:%s" % (host, self.port) for host in self.hosts)}/{self.dbname}'
 
-    def connect(self, read_only=False) -> Connection:
-        return self.pool.acquire(read_only=read_only, timeout=self.timeout)
+    def connect(self, read_only=False, min_lsn: Optional[int] = None) -> Connection:
+        """Read only connection is given from replica which has replayed min_lsn (from request if not passed)"""
+        if read_only and min_lsn is None:
+            min_lsn = get_min_lsn()
+        return self.pool.acquire(read_only=read_only, timeout=self.timeout, min_lsn=min_lsn)
 
     async def close(self):
         await self.pool.close()
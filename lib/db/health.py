@@ -0,0 +1,108 @@
+import fcntl
+import json
+import os
+import time
+from logging import getLogger
+from typing import Optional
+
+logger = getLogger('asyncpg.pool')
+
+DEFAULT_BACKOFF_FACTOR = 2.
+
+
+def next_check_delay(
+        delay: float, min_delay: float, max_delay: float, stable: bool, factor: float = DEFAULT_BACKOFF_FACTOR
+) -> float:
+    """Delay before next check: grows while host state is stable, resets to min_delay after changes and failures"""
+    if not stable:
+        return min_delay
+    return min(max(delay, min_delay) * factor, max_delay)
+
+
+def replica_lag(replayed_all: bool, receiving: bool, replay_age: Optional[float]) -> float:
+    """
+        Replay lag of replica in seconds.
+        Replay timestamp does not change while master has no writes, so replica which replayed all received WAL
+        is not lagging, but only while it receives WAL: a stalled or disconnected replica has replayed all it got too
+    """
+    if replayed_all and receiving:
+        return 0.
+    if replay_age is None:
+        # nothing is replayed since start of replica
+        return 0. if receiving else float('inf')
+    return replay_age
+
+
+class SharedCheckState:
+    """
+        Results of pool checks shared by processes through a file
+        Process holding the lock checks hosts and writes results, other processes only read them
+    """
+    __slots__ = (
+        '_path',
+        '_lock_path',
+        '_lock_fd',
+        '_states',
+    )
+
+    def __init__(self, path: str):
+        self._path = path
+        self._lock_path = f'{path}.lock'
+        self._lock_fd: Optional[int] = None
+        # states written by this process while it is leader
+        self._states: dict[str, dict] = {}
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_fd is not None
+
+    def try_lead(self) -> bool:
+        """Takes the lock if no other process holds it, the lock is held till close or process exit"""
+        if self._lock_fd is not None:
+            return True
+
+        fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+
+        logger.info('process %s checks database hosts for all workers', os.getpid())
+        self._lock_fd = fd
+        return True
+
+    def write(self, dsn: str, is_master: Optional[bool], lag: Optional[float], lsn: Optional[int],
+              response_time: Optional[float]):
+        """Writes result of check of host, is_master is None if host is not available"""
+        self._states[dsn] = {
+            'is_master': is_master,
+            'lag': lag,
+            'lsn': lsn,
+            'response_time': response_time,
+            'checked_at': time.time(),
+        }
+
+        tmp_path = f'{self._path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._states, f)
+        os.replace(tmp_path, self._path)
+
+    def read(self, dsn: str, max_age: float) -> Optional[dict]:
+        """Returns result of check of host if it is not older than max_age seconds"""
+        try:
+            with open(self._path) as f:
+                state = json.load(f).get(dsn)
+        except (OSError, ValueError):
+            return None
+
+        if state is None or time.time() - state['checked_at'] > max_age:
+            return None
+
+        return state
+
+    def close(self):
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
@@ -0,0 +1,245 @@
+import bisect
+import time
+import weakref
+from typing import Iterable, Optional
+
+# seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30.)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+
+class Histogram:
+    __slots__ = (
+        'buckets',
+        'counts',
+        'sum',
+        'count',
+    )
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # counts[i] - observations in (buckets[i - 1], buckets[i]], last one is for values above all buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterable[tuple[str, int]]:
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield format_value(bound), total
+        yield '+Inf', self.count
+
+
+class HostMetrics:
+    __slots__ = (
+        'acquire_time',
+        'hold_time',
+        'statement_time',
+        'acquire_timeouts',
+        'waiting',
+        'shed',
+    )
+
+    def __init__(self):
+        self.acquire_time = Histogram()
+        self.hold_time = Histogram()
+        # only queries of statements registry are timed
+        self.statement_time = Histogram()
+        self.acquire_timeouts = 0
+        # requests waiting for connection from pool of host
+        self.waiting = 0
+        # requests rejected because too many requests wait for connection
+        self.shed = 0
+
+
+class PoolMetrics:
+    """Metrics of PoolManager: time of choosing pool, per host time of waiting for connection,
+    time connection is held, time of queries and timeouts"""
+    __slots__ = (
+        'select_time',
+        'select_timeouts',
+        '_hosts',
+        '_acquired_at',
+    )
+
+    def __init__(self):
+        self.select_time = Histogram()
+        self.select_timeouts = 0
+        self._hosts: dict[str, HostMetrics] = {}
+        # raw connection -> time it was acquired
+        self._acquired_at: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    @property
+    def hosts(self) -> dict[str, HostMetrics]:
+        return self._hosts
+
+    def host(self, host: str) -> HostMetrics:
+        metrics = self._hosts.get(host)
+        if metrics is None:
+            metrics = self._hosts[host] = HostMetrics()
+        return metrics
+
+    def connection_acquired(self, host: str, connection, wait: float):
+        metrics = self.host(host)
+        metrics.acquire_time.observe(wait)
+
+        raw_connection = raw_connection_of(connection)
+        self._acquired_at[raw_connection] = time.monotonic()
+        _connection_hosts[raw_connection] = metrics
+
+    def connection_released(self, host: str, connection):
+        acquired_at = self._acquired_at.pop(raw_connection_of(connection), None)
+        if acquired_at is not None:
+            self.host(host).hold_time.observe(time.monotonic() - acquired_at)
+
+
+# connection -> metrics of its host, to record time of queries where only connection is known
+_connection_hosts: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def raw_connection_of(connection):
+    # connection from pool is a proxy, which is new on every acquire
+    # noinspection PyProtectedMember
+    return getattr(connection, '_con', None) or connection
+
+
+def observe_statement(connection, elapsed: float):
+    try:
+        metrics = _connection_hosts.get(raw_connection_of(connection))
+    except TypeError:
+        # object can not be referenced weakly, it is not a connection from pool
+        return
+
+    if metrics is not None:
+        metrics.statement_time.observe(elapsed)
+
+
+def format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(str(value))}"' for key, value in labels.items()) + '}'
+
+
+class PrometheusWriter:
+    """Writes metrics in Prometheus text exposition format"""
+    __slots__ = ('_lines', '_described')
+
+    def __init__(self):
+        self._lines: list[str] = []
+        self._described: set[str] = set()
+
+    def _describe(self, name: str, kind: str, help_text: str):
+        if name in self._described:
+            return
+        self._described.add(name)
+        self._lines.append(f'# HELP {name} {help_text}')
+        self._lines.append(f'# TYPE {name} {kind}')
+
+    def gauge(self, name: str, help_text: str, value: Optional[float], **labels):
+        self._describe(name, 'gauge', help_text)
+        if value is not None:
+            self._lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+    def counter(self, name: str, help_text: str, value: float, **labels):
+        self._describe(name, 'counter', help_text)
+        self._lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram, **labels):
+        self._describe(name, 'histogram', help_text)
+        for bound, count in histogram.cumulative():
+            self._lines.append(f'{name}_bucket{format_labels({**labels, "le": bound})} {count}')
+        self._lines.append(f'{name}_sum{format_labels(labels)} {format_value(histogram.sum)}')
+        self._lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+
+    def render(self) -> str:
+        return '\n'.join(self._lines) + '\n'
+
+
+def render_metrics(pool_manager, statements: Optional[dict] = None) -> str:
+    """Renders metrics of pool manager and statements stats (lib.db.statements) in Prometheus text format"""
+    writer = PrometheusWriter()
+    metrics: PoolMetrics = pool_manager.metrics
+
+    writer.histogram(
+        'db_pool_select_seconds', 'Time of choosing pool, including waiting for available master or replica',
+        metrics.select_time,
+    )
+    writer.counter('db_pool_select_timeouts_total', 'Timeouts while choosing pool', metrics.select_timeouts)
+
+    pools = [(pool_manager.get_pool_host(pool), pool) for pool in pool_manager.pools if pool is not None]
+    for host, pool in pools:
+        writer.gauge('db_pool_connections', 'Connections of pool', pool.get_size() - pool.get_idle_size(),
+                     host=host, state='used')
+        writer.gauge('db_pool_connections', 'Connections of pool', pool.get_idle_size(), host=host, state='idle')
+    for host, pool in pools:
+        writer.gauge('db_pool_free', 'Connections which can be acquired without waiting',
+                     pool_manager.get_pool_freesize(pool), host=host)
+    for host, pool in pools:
+        writer.gauge('db_pool_max_connections', 'Max size of pool', pool.get_max_size(), host=host)
+    for host, pool in pools:
+        writer.gauge('db_pool_available', 'Pool is used for queries with the role', int(pool_manager.pool_is_master(pool)),
+                     host=host, role='master')
+        writer.gauge('db_pool_available', 'Pool is used for queries with the role', int(pool_manager.pool_is_replica(pool)),
+                     host=host, role='replica')
+    for host, pool in pools:
+        writer.gauge('db_pool_breaker_open', 'Connections to host fail, pool is not used',
+                     int(not pool_manager.pool_is_allowed(pool)), host=host)
+    for host, pool in pools:
+        writer.gauge('db_replica_lag_seconds', 'Replay lag of replica', pool_manager.get_replica_lag(pool), host=host)
+    for host, pool in pools:
+        writer.gauge('db_pool_response_seconds', 'Median response time of host checks',
+                     pool_manager.get_last_response_time(pool), host=host)
+
+    hosts = sorted(metrics.hosts.items())
+    for host, host_metrics in hosts:
+        writer.gauge('db_pool_waiting', 'Requests waiting for connection', host_metrics.waiting, host=host)
+    for host, host_metrics in hosts:
+        writer.counter('db_pool_acquire_timeouts_total', 'Timeouts while waiting for connection',
+                       host_metrics.acquire_timeouts, host=host)
+    for host, host_metrics in hosts:
+        writer.counter('db_pool_shed_total', 'Requests rejected because too many requests wait for connection',
+                       host_metrics.shed, host=host)
+    for host, host_metrics in hosts:
+        writer.histogram('db_pool_acquire_seconds', 'Time of waiting for connection from pool',
+                         host_metrics.acquire_time, host=host)
+    for host, host_metrics in hosts:
+        writer.histogram('db_pool_hold_seconds', 'Time connection is held by request',
+                         host_metrics.hold_time, host=host)
+    for host, host_metrics in hosts:
+        writer.histogram('db_statement_seconds', 'Time of queries of statements registry, other queries are not timed',
+                         host_metrics.statement_time, host=host)
+
+    statements = sorted((statements or {}).items())
+    for name, stats in statements:
+        writer.counter('db_statement_calls_total', 'Calls of statement', stats.calls, statement=name)
+    for name, stats in statements:
+        writer.counter('db_statement_errors_total', 'Failed calls of statement', stats.errors, statement=name)
+    for name, stats in statements:
+        writer.counter('db_statement_prepares_total', 'Statement is prepared on connection', stats.prepares,
+                       statement=name)
+    for name, stats in statements:
+        writer.counter('db_statement_seconds_total', 'Total time of statement calls', stats.total_time,
+                       statement=name)
+    for name, stats in statements:
+        writer.gauge('db_statement_max_seconds', 'Max time of statement call', stats.max_time, statement=name)
+
+    return writer.render()
@@ -1,20 +1,30 @@
 import asyncio
+import time
 from typing import Union, Optional
 from types import MappingProxyType
 from collections import defaultdict
 
 import asyncpg
 from async_timeout import timeout as timeout_context
-from lib.db.balancer_policy import BalancerPolicy
+from lib.db.balancer_policy import BalancerPolicy, GreedyBalancerPolicy
+from lib.db.breaker import (
+    CircuitBreaker, PoolUnavailableError, DEFAULT_FAILURE_THRESHOLD, DEFAULT_RESET_TIMEOUT, is_host_failure,
+)
+from lib.db.health import SharedCheckState, next_check_delay, replica_lag
+from lib.db.metrics import PoolMetrics
 from lib.db.utils import Stopwatch, Dsn, split_dsn
 from itertools import chain
 from logging import getLogger
 
 DEFAULT_REFRESH_DELAY = 1
+DEFAULT_MAX_REFRESH_DELAY = 10
 DEFAULT_REFRESH_TIMEOUT = 30
 DEFAULT_ACQUIRE_TIMEOUT = 1.0
 DEFAULT_MASTER_AS_REPLICA_WEIGHT = 0.
 DEFAULT_STOPWATCH_WINDOW_SIZE = 128
+DEFAULT_MAX_REPLICA_LAG = None
+DEFAULT_POOL_WAIT_TIMEOUT = None
+DEFAULT_MAX_WAITING = None
 
 
 logger = getLogger('asyncpg.pool')
@@ -28,6 +38,7 @@ class PoolAcquireContext:
             fallback_master: Optional[bool],
             master_as_replica_weight: Optional[float],
             timeout: float,
+            min_lsn: Optional[int] = None,
             **kwargs,
     ):
         self.pool_manager = pool_manager
@@ -35,37 +46,88 @@ class PoolAcquireContext:
         self.fallback_master = fallback_master
         self.master_as_replica_weight = master_as_replica_weight
         self.timeout = timeout
+        self.min_lsn = min_lsn
         self.kwargs = kwargs
         self.pool = None
         self.context = None
+        self.connection = None
+        # request is the trial one of half open breaker of pool
+        self.trial = False
+
+    async def _acquire(self, acquire_connection):
+        metrics = self.pool_manager.metrics
+        try:
+            async with timeout_context(self.timeout):
+                started_at = time.monotonic()
+                while True:
+                    pool = await self.pool_manager.balancer.get_pool(
+                        read_only=self.read_only,
+                        fallback_master=self.fallback_master,
+                        master_as_replica_weight=self.master_as_replica_weight,
+                        min_lsn=self.min_lsn,
+                    )
+
+                    host = self.pool_manager.get_pool_host(pool)
+                    host_metrics = metrics.host(host)
+                    max_waiting = self.pool_manager.max_waiting
+                    if max_waiting is not None and host_metrics.waiting >= max_waiting:
+                        host_metrics.shed += 1
+                        raise PoolUnavailableError(f'Too many requests wait for connection to {host}')
+
+                    # trial request of half open pool may be sent by other request while this one was choosing
+                    if self.pool_manager.claim_pool(pool):
+                        self.pool = pool
+                        self.trial = self.pool_manager.pool_in_trial(pool)
+                        break
+                metrics.select_time.observe(time.monotonic() - started_at)
+
+                started_at = time.monotonic()
+                host_metrics.waiting += 1
+                try:
+                    connection = await acquire_connection()
+                except BaseException as error:
+                    await self.pool_manager.report_pool_result(self.pool, error, self.trial)
+                    raise
+                finally:
+                    host_metrics.waiting -= 1
+
+                metrics.connection_acquired(self.host, connection, time.monotonic() - started_at)
+                return connection
+        except asyncio.TimeoutError:
+            if self.pool is None:
+                metrics.select_timeouts += 1
+            else:
+                metrics.host(self.host).acquire_timeouts += 1
+            raise
+
+    @property
+    def host(self) -> str:
+        return self.pool_manager.get_pool_host(self.pool)
 
     async def acquire_from_pool_connection(self):
-        async with timeout_context(self.timeout):
-            self.pool = await self.pool_manager.balancer.get_pool(
-                read_only=self.read_only,
-                fallback_master=self.fallback_master,
-                master_as_replica_weight=self.master_as_replica_weight
-            )
-            connection = await self.pool_manager.acquire_from_pool(
-                self.pool, **self.kwargs
-            )
-            self.pool_manager.register_connection(connection, self.pool)
-            return connection
+        connection = await self._acquire(
+            lambda: self.pool_manager.acquire_from_pool(self.pool, **self.kwargs)
+        )
+        # connection is released without context, so getting it is the result of request
+        await self.pool_manager.report_pool_result(self.pool, None, self.trial)
+        self.pool_manager.register_connection(connection, self.pool)
+        return connection
 
     async def __aenter__(self):
-        async with timeout_context(self.timeout):
-            self.pool = await self.pool_manager.balancer.get_pool(
-                read_only=self.read_only,
-                fallback_master=self.fallback_master,
-                master_as_replica_weight=self.master_as_replica_weight,
-            )
+        def acquire_connection():
             self.context = self.pool_manager.acquire_from_pool(
                 self.pool,
                 **self.kwargs,
             )
-            return await self.context.__aenter__()
+            return self.context.__aenter__()
+
+        self.connection = await self._acquire(acquire_connection)
+        return self.connection
 
     async def __aexit__(self, *exc):
+        self.pool_manager.metrics.connection_released(self.host, self.connection)
+
+        await self.pool_manager.report_pool_result(self.pool, exc[1] if exc else None, self.trial)
         await self.context.__aexit__(*exc)
 
     def __await__(self):
@@ -80,18 +142,32 @@ class PoolManager:
         '_dsn',
         '_dsn_ready_event',
         '_dsn_check_cond',
+        '_unchecked_dsn',
         '_pools',
         '_acquire_timeout',
         '_refresh_timeout',
         '_refresh_delay',
+        '_max_refresh_delay',
+        '_shared_state',
+        '_shared_response_time',
         '_fallback_master',
         '_master_as_replica_weight',
+        '_max_replica_lag',
+        '_replica_lag',
+        '_replica_lsn',
         '_balancer',
         '_master_pool_set',
         '_replica_pool_set',
         '_master_cond',
         '_replica_cond',
         '_unmanaged_connections',
+        '_metrics',
+        '_pool_hosts',
+        '_pool_wait_timeout',
+        '_max_waiting',
+        '_breaker_failures',
+        '_breaker_reset_timeout',
+        '_breakers',
         '_stopwatch',
         '_refresh_role_tasks',
         '_closing',
@@ -103,11 +179,19 @@ class PoolManager:
             dsn: str,
             acquire_timeout: Union[float, int] = DEFAULT_ACQUIRE_TIMEOUT,
             refresh_delay: Union[float, int] = DEFAULT_REFRESH_DELAY,
+            max_refresh_delay: Union[float, int] = DEFAULT_MAX_REFRESH_DELAY,
             refresh_timeout: Union[float, int] = DEFAULT_REFRESH_TIMEOUT,
             fallback_master: bool = False,
             master_as_replica_weight: float = DEFAULT_MASTER_AS_REPLICA_WEIGHT,
             stopwatch_window_size: int = DEFAULT_STOPWATCH_WINDOW_SIZE,
             pool_factory_kwargs: Optional[dict] = None,
+            balancer_policy: type[BalancerPolicy] = GreedyBalancerPolicy,
+            max_replica_lag: Optional[float] = DEFAULT_MAX_REPLICA_LAG,
+            shared_state_path: Optional[str] = None,
+            pool_wait_timeout: Optional[float] = DEFAULT_POOL_WAIT_TIMEOUT,
+            max_waiting: Optional[int] = DEFAULT_MAX_WAITING,
+            breaker_failures: int = DEFAULT_FAILURE_THRESHOLD,
+            breaker_reset_timeout: float = DEFAULT_RESET_TIMEOUT,
             loop: asyncio.AbstractEventLoop = None,
     ):
         if loop is None:
@@ -121,18 +205,37 @@ class PoolManager:
         self._dsn: list[Dsn] = split_dsn(dsn)
         self._dsn_ready_event = defaultdict(lambda: asyncio.Event())
         self._dsn_check_cond = defaultdict(lambda: asyncio.Condition())
+        # hosts not checked even once yet, till then requests wait for pools without pool_wait_timeout
+        self._unchecked_dsn: set[Dsn] = set(self._dsn)
         self._pools: list[Optional[asyncpg.Pool]] = [None] * len(self._dsn)
         self._acquire_timeout = acquire_timeout
         self._refresh_delay = refresh_delay
+        self._max_refresh_delay = max(refresh_delay, max_refresh_delay)
+        # results of checks are shared with other processes using the same file
+        self._shared_state = SharedCheckState(shared_state_path) if shared_state_path else None
+        self._shared_response_time = {}
         self._refresh_timeout = refresh_timeout
         self._fallback_master = fallback_master
         self._master_as_replica_weight = master_as_replica_weight
-        self._balancer = BalancerPolicy(self)
+        # replicas lagging more than max_replica_lag seconds are not used
+        self._max_replica_lag = max_replica_lag
+        self._replica_lag: dict[asyncpg.Pool, float] = {}
+        self._replica_lsn: dict[asyncpg.Pool, Optional[int]] = {}
+        self._balancer = balancer_policy(self)
         self._master_pool_set = set()
         self._replica_pool_set = set()
         self._master_cond = asyncio.Condition()
         self._replica_cond = asyncio.Condition()
         self._unmanaged_connections = {}
+        self._metrics = PoolMetrics()
+        self._pool_hosts = {}
+        # how long to wait for master or replica to appear, None - till acquire timeout
+        self._pool_wait_timeout = pool_wait_timeout
+        # requests waiting for connection of one pool, others are rejected, None - no limit
+        self._max_waiting = max_waiting
+        self._breaker_failures = breaker_failures
+        self._breaker_reset_timeout = breaker_reset_timeout
+        self._breakers: dict[asyncpg.Pool, CircuitBreaker] = {}
         self._stopwatch = Stopwatch(window_size=stopwatch_window_size)
         self._refresh_role_tasks = [
             loop.create_task(self._check_pool_task(index))
@@ -173,6 +276,14 @@ class PoolManager:
     def balancer(self) -> BalancerPolicy:
         return self._balancer
 
+    @property
+    def metrics(self) -> PoolMetrics:
+        return self._metrics
+
+    @property
+    def max_waiting(self) -> Optional[int]:
+        return self._max_waiting
+
     @property
     def closing(self) -> bool:
         return self._closing
@@ -203,6 +314,22 @@ class PoolManager:
         read_only = await connection.fetchrow('SHOW transaction_read_only')
         return read_only[0] == 'off'
 
+    # noinspection PyMethodMayBeStatic
+    async def _get_replication_state(self, connection) -> tuple[float, Optional[int]]:
+        """Returns replay lag in seconds and replayed WAL position of replica"""
+        # WAL receiver has no row while it is not running, roles without pg_read_all_stats see no status
+        row = await connection.fetchrow(
+            '''
+                SELECT coalesce(pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn(), false) AS replayed_all,
+                       coalesce(
+                           (SELECT coalesce(status = 'streaming', true) FROM pg_stat_wal_receiver), false
+                       ) AS receiving,
+                       extract(epoch FROM now() - pg_last_xact_replay_timestamp())::float8 AS replay_age,
+                       pg_last_wal_replay_lsn() AS lsn
+            '''
+        )
+        return replica_lag(row['replayed_all'], row['receiving'], row['replay_age']), row['lsn']
+
     async def _pool_factory(self, dsn: Dsn) -> asyncpg.Pool:
         return await asyncpg.create_pool(str(dsn), **self.pool_factory_kwargs)
 
@@ -216,6 +343,7 @@ class PoolManager:
             fallback_master: Optional[bool] = None,
             master_as_replica_weight: Optional[float] = None,
             timeout: Optional[float] = None,
+            min_lsn: Optional[int] = None,
             **kwargs,
     ) -> PoolAcquireContext:
         if not read_only and fallback_master:
@@ -247,6 +375,7 @@ class PoolManager:
             fallback_master=fallback_master,
             master_as_replica_weight=master_as_replica_weight,
             timeout=timeout,
+            min_lsn=min_lsn if read_only else None,
             **kwargs,
         )
 
@@ -262,6 +391,7 @@ class PoolManager:
             fallback_master: Optional[bool] = None,
             master_as_replica_weight: Optional[float] = None,
             timeout: Optional[float] = None,
+            min_lsn: Optional[int] = None,
             **kwargs,
     ):
         return self.acquire(
@@ -269,6 +399,7 @@ class PoolManager:
             fallback_master=fallback_master,
             master_as_replica_weight=master_as_replica_weight,
             timeout=timeout,
+            min_lsn=min_lsn,
             **kwargs,
         )
 
@@ -279,6 +410,7 @@ class PoolManager:
                 f"{connection!r} is not a member of this pool",
             )
         pool = self._unmanaged_connections.pop(connection)
+        self._metrics.connection_released(self.get_pool_host(pool), connection)
         await self.release_to_pool(connection, pool, **kwargs)
 
     async def close(self):
@@ -363,18 +495,45 @@ class PoolManager:
             await self._replica_cond.wait_for(predicate)
 
     async def get_master_pools(self) -> list:
-        if not self._master_pool_set:
-            async with self._master_cond:
-                await self._master_cond.wait()
-        return list(self._master_pool_set)
+        return await self._wait_pools(self._master_pool_set, self._master_cond, 'master')
 
     async def get_replica_pools(self, fallback_master: bool = False) -> list[PoolAcquireContext]:
-        if not self._replica_pool_set:
-            if fallback_master:
-                return await self.get_master_pools()
-            async with self._replica_cond:
-                await self._replica_cond.wait()
-        return list(self._replica_pool_set)
+        if fallback_master and not self._allowed_pools(self._replica_pool_set):
+            return await self.get_master_pools()
+        return await self._wait_pools(self._replica_pool_set, self._replica_cond, 'replica')
+
+    def _allowed_pools(self, pools: set) -> list:
+        return [pool for pool in pools if self.pool_is_allowed(pool)]
+
+    async def _wait_pools(self, pools: set, cond: asyncio.Condition, role: str) -> list:
+        """Returns pools of role with closed breakers, waits for them at most pool_wait_timeout"""
+        loop = asyncio.get_running_loop()
+        deadline = None
+
+        while True:
+            allowed = self._allowed_pools(pools)
+            if allowed:
+                return allowed
+
+            # on start pools are created and checked for a while, requests fail fast only after hosts are checked
+            if deadline is None and self._pool_wait_timeout is not None and not self._unchecked_dsn:
+                deadline = loop.time() + self._pool_wait_timeout
+
+            # open breakers let requests through after timeout, breakers waiting for trial request are notified
+            timeout = min(
+                (self._breakers[pool].retry_in() for pool in pools if not self._breakers[pool].trial), default=None
+            )
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise PoolUnavailableError(f'No available {role} pool', retry_after=max(timeout or 0., 1.))
+                timeout = remaining if timeout is None else min(timeout, remaining)
+
+            async with cond:
+                try:
+                    await asyncio.wait_for(cond.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
 
     def pool_is_master(self, pool) -> bool:
         return pool in self._master_pool_set
@@ -382,16 +541,82 @@ class PoolManager:
     def pool_is_replica(self, pool) -> bool:
         return pool in self._replica_pool_set
 
+    def _breaker(self, pool) -> CircuitBreaker:
+        breaker = self._breakers.get(pool)
+        if breaker is None:
+            breaker = self._breakers[pool] = CircuitBreaker(self._breaker_failures, self._breaker_reset_timeout)
+        return breaker
+
+    def pool_is_allowed(self, pool) -> bool:
+        """Breaker of pool lets requests through"""
+        breaker = self._breakers.get(pool)
+        return breaker is None or not breaker.is_open
+
+    def claim_pool(self, pool) -> bool:
+        """Request is sent to chosen pool if its breaker lets it through, in half open state as the trial one"""
+        breaker = self._breakers.get(pool)
+        return breaker is None or breaker.allow_request()
+
+    def pool_in_trial(self, pool) -> bool:
+        breaker = self._breakers.get(pool)
+        return breaker is not None and breaker.trial
+
+    async def report_pool_result(self, pool, error: Optional[BaseException], trial: bool = False):
+        """
+            Records result of request to breaker of pool: connection errors are failures of host,
+            other errors are answers of host, timeouts and cancellation say nothing about it
+        """
+        if error is not None and is_host_failure(error):
+            breaker = self._breaker(pool)
+            was_closed = breaker.is_closed
+            breaker.record_failure()
+            if not breaker.is_closed and (was_closed or trial):
+                logger.warning(
+                    "Connections to %s fail, pool is not used for %.1f seconds",
+                    self.get_pool_host(pool), breaker.reset_timeout,
+                )
+        elif error is None or (isinstance(error, Exception) and not isinstance(error, asyncio.TimeoutError)):
+            breaker = self._breakers.get(pool)
+            if breaker is None or (breaker.is_closed and not breaker.failures):
+                return
+            breaker.record_success()
+        elif trial:
+            self._breakers[pool].cancel_trial()
+        else:
+            return
+
+        # requests waiting for available pool check breakers again
+        for cond in (self._master_cond, self._replica_cond):
+            async with cond:
+                cond.notify_all()
+
+    def get_pool_host(self, pool) -> str:
+        return self._pool_hosts.get(pool, 'unknown')
+
     def register_connection(self, connection, pool):
         self._unmanaged_connections[connection] = pool
 
     def get_last_response_time(self, pool) -> Optional[float]:
-        return self._stopwatch.get_time(pool)
+        response_time = self._stopwatch.get_time(pool)
+        if response_time is None:
+            return self._shared_response_time.get(pool)
+        return response_time
+
+    def get_replica_lag(self, pool) -> Optional[float]:
+        return self._replica_lag.get(pool)
+
+    def pool_has_replayed(self, pool, lsn: int) -> bool:
+        """Checks that writes till lsn are visible in pool, master has all writes"""
+        if pool in self._master_pool_set:
+            return True
+        replayed = self._replica_lsn.get(pool)
+        return replayed is not None and replayed >= lsn
 
     # noinspection PyMethodMayBeStatic
     def _prepare_pool_factory_kwargs(self, kwargs: dict) -> dict:
-        kwargs['min_size'] = kwargs.get('min_size', 1) + 1
-        kwargs['max_size'] = kwargs.get('max_size', 10) + 1
+        # hosts are checked with separate connections, all connections of pool are for requests
+        kwargs.setdefault('min_size', 1)
+        kwargs.setdefault('max_size', 10)
         return kwargs
 
     async def _clear(self):
@@ -416,6 +641,13 @@ class PoolManager:
         self._unmanaged_connections.clear()
         self._master_pool_set.clear()
         self._replica_pool_set.clear()
+        self._replica_lag.clear()
+        self._replica_lsn.clear()
+        self._shared_response_time.clear()
+        self._breakers.clear()
+
+        if self._shared_state is not None:
+            self._shared_state.close()
 
     async def _check_pool_task(self, index: int):
         logger.debug("Starting pool task")
@@ -423,58 +655,84 @@ class PoolManager:
         censored_dsn = str(dsn.with_(password="******"))
         pool = await self._wait_creating_pool(dsn)
         self._pools[index] = pool
+        self._pool_hosts[pool] = f'{dsn.host}:{dsn.port}'
 
         logger.debug("Setting dsn=%r event", censored_dsn)
         sys_connection = None
-        while not self._closing:
-            try:
-                # Не использовать async with self.acquire_from_pool(pool)
-                # из-за большого таймаута
-                logger.debug(
-                    "Acquiring connection for checking dsn=%r", censored_dsn,
-                )
-                async with timeout_context(self._refresh_timeout):
-                    sys_connection = await self.acquire_from_pool(pool)
-
-                logger.debug("Checking dsn=%r", censored_dsn)
-                await self._periodic_pool_check(pool, dsn, sys_connection)
-            except asyncio.TimeoutError:
-                logger.warning(
-                    "Creating system connection failed for dsn=%r",
-                    censored_dsn,
-                )
-            except asyncio.CancelledError as cancelled_error:
-                if self._closing:
-                    raise cancelled_error from None
-                logger.warning(
-                    "Cancelled error for dsn=%r",
-                    censored_dsn,
-                    exc_info=True,
-                )
-                self._remove_pool_from_master_set(pool, dsn)
-                self._remove_pool_from_replica_set(pool, dsn)
-            except Exception:
-                logger.warning(
-                    "Database is not available with exception for dsn=%r",
-                    censored_dsn,
-                    exc_info=True,
-                )
-                self._remove_pool_from_master_set(pool, dsn)
-                self._remove_pool_from_replica_set(pool, dsn)
-            finally:
-                if sys_connection is not None:
-                    try:
-                        await self.release_to_pool(sys_connection, pool)
-                    except Exception:
-                        logger.warning(
-                            "Release connection to pool with exception for dsn=%r",
-                            censored_dsn,
-                            exc_info=True,
-                        )
-                    sys_connection = None
-                await self._notify_about_pool_has_checked(dsn)
-
-            await asyncio.sleep(self._refresh_delay)
+        delay = self._refresh_delay
+        try:
+            while not self._closing:
+                stable = False
+                try:
+                    if self._shared_state is not None and not self._shared_state.try_lead():
+                        stable = await self._apply_shared_state(pool, dsn)
+                    else:
+                        async with timeout_context(self._refresh_timeout):
+                            if sys_connection is None or self.is_connection_closed(sys_connection):
+                                # connection is not from pool, so checks do not take connections of requests
+                                logger.debug(
+                                    "Connecting for checking dsn=%r", censored_dsn,
+                                )
+                                sys_connection = await self._connection_factory(dsn)
+
+                            logger.debug("Checking dsn=%r", censored_dsn)
+                            stable = await self._refresh_pool_role(pool, dsn, sys_connection)
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        "Periodic pool check failed for dsn=%r",
+                        censored_dsn,
+                    )
+                    sys_connection = await self._close_sys_connection(sys_connection, censored_dsn)
+                    self._mark_pool_unavailable(pool, dsn)
+                except asyncio.CancelledError as cancelled_error:
+                    # task itself is cancelled (not only the check), e.g. when event loop is closed without close(),
+                    # it is known only since python 3.11
+                    cancelling = getattr(asyncio.current_task(), 'cancelling', None)
+                    if self._closing or (cancelling is not None and cancelling()):
+                        raise cancelled_error from None
+                    logger.warning(
+                        "Cancelled error for dsn=%r",
+                        censored_dsn,
+                        exc_info=True,
+                    )
+                    sys_connection = await self._close_sys_connection(sys_connection, censored_dsn)
+                    self._mark_pool_unavailable(pool, dsn)
+                except Exception:
+                    logger.warning(
+                        "Database is not available with exception for dsn=%r",
+                        censored_dsn,
+                        exc_info=True,
+                    )
+                    sys_connection = await self._close_sys_connection(sys_connection, censored_dsn)
+                    self._mark_pool_unavailable(pool, dsn)
+                finally:
+                    await self._notify_about_pool_has_checked(dsn)
+
+                # host is checked rarely while its role is stable and often after changes and failures,
+                # replay position and lag of replica change with every write, so replicas are always checked often
+                max_delay = self._refresh_delay if pool in self._replica_lag else self._max_refresh_delay
+                delay = next_check_delay(delay, self._refresh_delay, max_delay, stable)
+                await asyncio.sleep(delay)
+        finally:
+            await self._close_sys_connection(sys_connection, censored_dsn)
+
+    async def _connection_factory(self, dsn: Dsn) -> asyncpg.Connection:
+        return await asyncpg.connect(str(dsn), timeout=self._refresh_timeout, statement_cache_size=0)
+
+    async def _close_sys_connection(self, sys_connection, censored_dsn: str) -> None:
+        if sys_connection is None:
+            return None
+
+        try:
+            await asyncio.wait_for(sys_connection.close(), timeout=self._refresh_timeout)
+        except Exception:
+            logger.warning(
+                "Closing system connection with exception for dsn=%r",
+                censored_dsn,
+                exc_info=True,
+            )
+            sys_connection.terminate()
+        return None
 
     async def _wait_creating_pool(self, dsn: Dsn):
         while not self._closing:
@@ -488,27 +746,17 @@ class PoolManager:
                     exc_info=True,
                 )
 
-    async def _periodic_pool_check(self, pool, dsn: Dsn, sys_connection):
-        while not self._closing:
-            try:
-                async with timeout_context(self._refresh_timeout):
-                    await self._refresh_pool_role(pool, dsn, sys_connection)
-                await self._notify_about_pool_has_checked(dsn)
-            except asyncio.TimeoutError:
-                logger.warning(
-                    "Periodic pool check failed for dsn=%s",
-                    dsn.with_(password="******"),
-                )
-                self._remove_pool_from_master_set(pool, dsn)
-                self._remove_pool_from_replica_set(pool, dsn)
-                await self._notify_about_pool_has_checked(dsn)
-
-            await asyncio.sleep(self._refresh_delay)
-
     async def _notify_about_pool_has_checked(self, dsn: Dsn):
         async with self._dsn_check_cond[dsn]:
             self._dsn_check_cond[dsn].notify_all()
 
+        if dsn in self._unchecked_dsn:
+            self._unchecked_dsn.discard(dsn)
+            # requests waiting for pools start counting pool_wait_timeout
+            for cond in (self._master_cond, self._replica_cond):
+                async with cond:
+                    cond.notify_all()
+
     async def _add_pool_to_master_set(self, pool, dsn: Dsn):
         if pool in self._master_pool_set:
             return
@@ -547,17 +795,77 @@ class PoolManager:
                 dsn.with_(password="******"),
             )
 
-    async def _refresh_pool_role(self, pool, dsn: Dsn, sys_connection):
+    async def _refresh_pool_role(self, pool, dsn: Dsn, sys_connection) -> bool:
+        """Checks role of host, returns True if pool stays in the same set"""
         with self._stopwatch(pool):
             is_master = await self._is_master(sys_connection)
+
+        lag, lsn = None, None
+        if not is_master:
+            lag, lsn = await self._get_replication_state(sys_connection)
+
+        if self._shared_state is not None:
+            self._shared_state.write(
+                self._state_key(dsn), is_master, lag, lsn, self._stopwatch.get_time(pool)
+            )
+
+        return await self._apply_pool_role(pool, dsn, is_master, lag, lsn)
+
+    async def _apply_pool_role(
+            self, pool, dsn: Dsn, is_master: bool, lag: Optional[float], lsn: Optional[int]
+    ) -> bool:
+        before = (pool in self._master_pool_set, pool in self._replica_pool_set)
+
         if is_master:
+            self._replica_lag.pop(pool, None)
+            self._replica_lsn.pop(pool, None)
             await self._add_pool_to_master_set(pool, dsn)
             self._remove_pool_from_replica_set(pool, dsn)
         else:
-            await self._add_pool_to_replica_set(pool, dsn)
+            self._replica_lag[pool] = lag
+            self._replica_lsn[pool] = lsn
             self._remove_pool_from_master_set(pool, dsn)
+
+            if self._max_replica_lag is not None and lag > self._max_replica_lag:
+                if pool in self._replica_pool_set:
+                    logger.warning(
+                        "Replica %s lags for %.1f seconds, it is not used till it catches up",
+                        dsn.with_(password="******"), lag,
+                    )
+                self._remove_pool_from_replica_set(pool, dsn)
+            else:
+                await self._add_pool_to_replica_set(pool, dsn)
         self._dsn_ready_event[dsn].set()
 
+        return before == (pool in self._master_pool_set, pool in self._replica_pool_set)
+
+    def _mark_pool_unavailable(self, pool, dsn: Dsn):
+        self._remove_pool_from_master_set(pool, dsn)
+        self._remove_pool_from_replica_set(pool, dsn)
+
+        if self._shared_state is not None and self._shared_state.is_leader:
+            self._shared_state.write(self._state_key(dsn), None, None, None, None)
+
+    async def _apply_shared_state(self, pool, dsn: Dsn) -> bool:
+        """Applies result of check made by another process, returns True if pool stays in the same set"""
+        state = self._shared_state.read(self._state_key(dsn), max_age=self._max_refresh_delay * 3)
+        if state is None:
+            # leader did not check host for long, pool sets are kept till it does or this process leads
+            return False
+
+        self._shared_response_time[pool] = state['response_time']
+        if state['is_master'] is None:
+            before = (pool in self._master_pool_set, pool in self._replica_pool_set)
+            self._remove_pool_from_master_set(pool, dsn)
+            self._remove_pool_from_replica_set(pool, dsn)
+            return before == (False, False)
+
+        return await self._apply_pool_role(pool, dsn, state['is_master'], state['lag'], state['lsn'])
+
+    # noinspection PyMethodMayBeStatic
+    def _state_key(self, dsn: Dsn) -> str:
+        return str(dsn.with_(password="******"))
+
     def __iter__(self):
         return chain(iter(self._master_pool_set), iter(self._replica_pool_set))
 
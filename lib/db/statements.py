@@ -0,0 +1,232 @@
+import hashlib
+import time
+from enum import Enum
+from logging import getLogger
+from typing import Any, Iterable, Optional
+
+import asyncpg
+from asyncpg.cursor import Cursor
+from asyncpg.prepared_stmt import PreparedStatement
+
+from lib.db.metrics import observe_statement, raw_connection_of
+
+logger = getLogger('db.statements')
+
+
+class EStatementMode(str, Enum):
+    # statements are prepared on server with stable names,
+    # works with direct connections and pgbouncer >= 1.21 (max_prepared_statements > 0)
+    named = 'named'
+    # statements are not prepared by name,
+    # for pgbouncer in transaction mode without prepared statements support
+    unnamed = 'unnamed'
+
+
+class StatementStats:
+    __slots__ = (
+        'calls',
+        'errors',
+        'prepares',
+        'total_time',
+        'max_time',
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.prepares = 0
+        self.total_time = 0.
+        self.max_time = 0.
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.calls if self.calls else 0.
+
+    def record(self, elapsed: float, failed: bool):
+        self.calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        if failed:
+            self.errors += 1
+
+
+class ConnectionStatements:
+    """
+        Statements prepared on one connection, by server name of Statement.
+        asyncpg invalidates PreparedStatement objects when connection is released to pool, while statements
+        stay prepared on server, so they are wrapped again with the same low level state.
+        This class is the only user of asyncpg internals, tests check them against installed asyncpg
+    """
+    __slots__ = ('connection', '_statements', '_stale')
+
+    def __init__(self, connection: asyncpg.Connection):
+        self.connection = connection
+        self._statements: dict[str, PreparedStatement] = {}
+        # keys of statements whose names can not be used on server, they are prepared under new names
+        self._stale: set[str] = set()
+
+    def get(self, key: str, sql: str) -> Optional[PreparedStatement]:
+        if key in self._stale:
+            return None
+
+        statement = self._statements.get(key)
+        if statement is not None and self._is_released(statement):
+            # new object is attached to the state before old one is dropped, so statement is not closed on server
+            statement = self._statements[key] = self._wrap(sql, statement)
+        return statement
+
+    async def prepare(self, key: str, sql: str, name: str) -> PreparedStatement:
+        """
+            Prepares statement by name, replaced statement of key is dropped after that.
+            asyncpg closes dropped statements on server by their name, so name must differ from replaced one
+        """
+        try:
+            statement = await self.connection.prepare(sql, name=name)
+        except asyncpg.exceptions.DuplicatePreparedStatementError:
+            # prepared on server, but not by this process (e.g. server connection is shared by pgbouncer)
+            if self.connection.is_in_transaction():
+                # transaction is aborted, nothing else can be run in it
+                self._stale.add(key)
+                raise
+            logger.warning('statement %s is already prepared, using unnamed statement', name)
+            statement = await self.connection.prepare(sql)
+
+        self._statements[key] = statement
+        self._stale.discard(key)
+        return statement
+
+    def is_stale(self, key: str) -> bool:
+        return key in self._stale
+
+    def mark_stale(self, key: str):
+        """Statement was deallocated on server or its name is taken, it is prepared under a new name next time"""
+        self._stale.add(key)
+
+    def _is_released(self, statement: PreparedStatement) -> bool:
+        # noinspection PyProtectedMember
+        return statement._con_release_ctr != self.connection._pool_release_ctr
+
+    def _wrap(self, sql: str, statement: PreparedStatement) -> PreparedStatement:
+        # noinspection PyProtectedMember
+        return PreparedStatement(self.connection, sql, statement._state)
+
+
+# raw connection -> statements prepared on it, closed connections are dropped when new ones are added
+_connections: dict[asyncpg.Connection, ConnectionStatements] = {}
+
+
+def connection_statements(connection) -> ConnectionStatements:
+    raw_connection = raw_connection_of(connection)
+    statements = _connections.get(raw_connection)
+    if statements is None:
+        for closed in [conn for conn in _connections if conn.is_closed()]:
+            del _connections[closed]
+        statements = _connections[raw_connection] = ConnectionStatements(raw_connection)
+    return statements
+
+
+class Statement:
+    """
+        SQL statement declared once at module level and prepared lazily on every connection it is run on.
+        Server side name is stable (name and hash of sql), so it is the same in all processes
+    """
+
+    __slots__ = (
+        'name',
+        'sql',
+        'server_name',
+        'stats',
+        '_reprepares',
+    )
+
+    mode: EStatementMode = EStatementMode.named
+
+    def __init__(self, name: str, sql: str):
+        if name in STATEMENTS:
+            raise ValueError(f'statement {name} is already declared')
+
+        self.name = name
+        self.sql = sql
+        self.server_name = f'{name}_{hashlib.sha1(sql.encode()).hexdigest()[:8]}'
+        self.stats = StatementStats()
+        self._reprepares = 0
+
+        STATEMENTS[name] = self
+
+    async def _prepare(self, connection) -> PreparedStatement:
+        statements = connection_statements(connection)
+        statement = statements.get(self.server_name, self.sql)
+        if statement is not None:
+            return statement
+
+        name = self.server_name
+        if statements.is_stale(self.server_name):
+            # old name is closed by asyncpg when old statement is dropped, so it can not be used again
+            self._reprepares += 1
+            name = f'{self.server_name}_{self._reprepares}'
+
+        statement = await statements.prepare(self.server_name, self.sql, name)
+        self.stats.prepares += 1
+        return statement
+
+    async def _run(self, method: str, connection, args: tuple, prepared_method: Optional[str] = None) -> Any:
+        prepared_method = prepared_method or method
+        started_at = time.monotonic()
+        failed = True
+        try:
+            if self.mode == EStatementMode.unnamed:
+                result = await getattr(connection, method)(self.sql, *args)
+            else:
+                statement = await self._prepare(connection)
+                try:
+                    result = await getattr(statement, prepared_method)(*args)
+                except asyncpg.exceptions.InvalidSQLStatementNameError:
+                    # statement was deallocated on server (DEALLOCATE, pgbouncer reset), prepare it again
+                    connection_statements(connection).mark_stale(self.server_name)
+                    if connection.is_in_transaction():
+                        # transaction is aborted, statement is prepared again on the next call
+                        raise
+                    statement = await self._prepare(connection)
+                    result = await getattr(statement, prepared_method)(*args)
+
+            failed = False
+            return result
+        finally:
+            elapsed = time.monotonic() - started_at
+            self.stats.record(elapsed, failed)
+            observe_statement(connection, elapsed)
+
+    async def fetch(self, connection, *args) -> list[asyncpg.Record]:
+        return await self._run('fetch', connection, args)
+
+    async def fetchrow(self, connection, *args) -> Optional[asyncpg.Record]:
+        return await self._run('fetchrow', connection, args)
+
+    async def fetchval(self, connection, *args) -> Any:
+        return await self._run('fetchval', connection, args)
+
+    async def execute(self, connection, *args):
+        # prepared statement has no execute, rows are fetched and dropped
+        await self._run('execute', connection, args, prepared_method='fetch')
+
+    async def executemany(self, connection, args: Iterable[tuple]):
+        # rows are kept to be sent again if statement is prepared again
+        await self._run('executemany', connection, (list(args),))
+
+    async def cursor(self, connection, *args) -> Cursor:
+        """Server side cursor, must be used in transaction; time of its creation is recorded only"""
+        return await self._run('cursor', connection, args)
+
+    def __repr__(self):
+        return f'Statement({self.name!r})'
+
+
+STATEMENTS: dict[str, Statement] = {}
+
+
+def set_statement_mode(mode: EStatementMode):
+    Statement.mode = EStatementMode(mode)
+
+
+def get_statements_stats() -> dict[str, StatementStats]:
+    return {name: statement.stats for name, statement in STATEMENTS.items()}
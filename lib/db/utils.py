@@ -66,6 +66,14 @@ class Dsn:
         self._kwargs = kwargs
         self._compiled_dsn = self._compile_dsn()
 
+    @property
+    def host(self) -> str:
+        return self._host
+
+    @property
+    def port(self) -> Union[str, int]:
+        return self._port
+
     def _compile_dsn(self) -> str:
         dsn = "postgresql://"
         if self._user is not None:
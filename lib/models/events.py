@@ -96,3 +96,13 @@ class RCreateEvent(BaseModel):
     repetition: Optional[Repetition] = None
     notifications: list[Notification] = []
     participants: list[Participant] = []
+
+
+class EventsPage(BaseModel):
+    events: list[Event]
+    next_cursor: Optional[str] = None  # pass as cursor to get the next page, None on the last page
+
+
+class UsersEvents(BaseModel):
+    events: list[Event]  # every event is returned once, even if it is shared by several users
+    users: dict[str, list[int]]  # indexes of events of every user
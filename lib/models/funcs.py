@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Optional
+
+from pydantic import BaseModel, validator
 from datetime import timedelta, datetime
 
 
@@ -8,6 +10,24 @@ class RCalcFreeTime(BaseModel):
     user_logins: set[str]
 
 
+class RCalcFreeSlots(RCalcFreeTime):
+    count: int = 5
+    search_until: Optional[datetime] = None
+    granularity: Optional[timedelta] = None
+
+    @validator('count')
+    def count_interval(cls, v):
+        if not 1 <= v <= 100:
+            raise ValueError('count should be in interval [1..100]')
+        return v
+
+    @validator('granularity')
+    def granularity_positive(cls, v):
+        if v is not None and v <= timedelta(0):
+            raise ValueError('granularity should be positive')
+        return v
+
+
 class FreeTime(BaseModel):
     start: datetime = None
     end: datetime = None
@@ -1,15 +1,46 @@
+import asyncio
+from datetime import datetime, timedelta
 from logging import getLogger
 from typing import Optional
 from uuid import uuid4
 
+from lib.db import Database
 from lib.models.users import User
-from lib.sql.user import get_user_by_session, set_user_session_id
+from lib.sql.user import get_user_by_session, set_user_session_id, update_sessions_last_seen
+from lib.util.cache import LRUCache
 from lib.util.module import BaseModule, SingletonModule
 
 logger = getLogger('auth')
 
+DEFAULT_SESSION_TTL = 30 * 24 * 3600.0
+DEFAULT_CACHE_SIZE = 10_000
+DEFAULT_CACHE_TTL = 60.0
+DEFAULT_NEGATIVE_CACHE_TTL = 5.0
+DEFAULT_LAST_SEEN_DEBOUNCE = 60.0
+DEFAULT_FLUSH_INTERVAL = 10.0
+
 
 class Auth(BaseModule, metaclass=SingletonModule):
+    """
+        Authorization by session id. Sessions are cached in process memory,
+        unknown sessions are cached too (for a shorter time), so repeated requests
+        do not go to the database. Session expires if it is not used for session_ttl seconds,
+        last seen time is written with batches not more often than once in last_seen_debounce seconds.
+    """
+    CONFIG_KEY = 'auth'
+    CONFIG_SCHEME = {
+        'type': 'dict',
+        'default': {},
+        'schema': {
+            'session_ttl': {'type': 'float', 'default': DEFAULT_SESSION_TTL},  # seconds
+            'cache_size': {'type': 'integer', 'default': DEFAULT_CACHE_SIZE},
+            'cache_ttl': {'type': 'float', 'default': DEFAULT_CACHE_TTL},
+            'negative_cache_ttl': {'type': 'float', 'default': DEFAULT_NEGATIVE_CACHE_TTL},
+            'last_seen_debounce': {'type': 'float', 'default': DEFAULT_LAST_SEEN_DEBOUNCE},
+            'flush_interval': {'type': 'float', 'default': DEFAULT_FLUSH_INTERVAL},
+        }
+    }
+
     def __init__(
             self,
             config: dict = None,
@@ -17,12 +48,98 @@ class Auth(BaseModule, metaclass=SingletonModule):
     ):
         super(Auth, self).__init__(config, loop)
 
-    @staticmethod
-    async def authorize(connection, session_id: str) -> Optional[User]:
-        return await get_user_by_session(connection, session_id)
+        self.session_ttl = timedelta(seconds=self.config.get('session_ttl', DEFAULT_SESSION_TTL))
+        self.last_seen_debounce = timedelta(seconds=self.config.get('last_seen_debounce', DEFAULT_LAST_SEEN_DEBOUNCE))
+        self.flush_interval: float = self.config.get('flush_interval', DEFAULT_FLUSH_INTERVAL)
+
+        cache_size = self.config.get('cache_size', DEFAULT_CACHE_SIZE)
+        # session id -> (user, time when last seen was recorded)
+        self.sessions: LRUCache[str, tuple[User, datetime]] = LRUCache(
+            max_size=cache_size, ttl=self.config.get('cache_ttl', DEFAULT_CACHE_TTL)
+        )
+        self.unknown_sessions: LRUCache[str, bool] = LRUCache(
+            max_size=cache_size, ttl=self.config.get('negative_cache_ttl', DEFAULT_NEGATIVE_CACHE_TTL)
+        )
+        self.session_by_login: LRUCache[str, str] = LRUCache(max_size=cache_size)
+
+        # last seen times not written to database yet
+        self.pending_last_seen: dict[str, datetime] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.flush_loop())
+
+    async def on_shutdown(self):
+        if self.task is not None:
+            self.task.cancel('shutdown')
+
+    def _seen(self, session_id: str, user: User, now: datetime):
+        self.pending_last_seen[session_id] = now
+        self.sessions.set(session_id, (user, now))
+        self.session_by_login.set(user.login, session_id)
+
+    async def authorize(self, connection, session_id: str) -> Optional[User]:
+        if session_id is None or self.unknown_sessions.get(session_id):
+            return None
+
+        now = datetime.now()
+
+        cached = self.sessions.get(session_id)
+        if cached is not None:
+            user, seen_at = cached
+            if now - seen_at >= self.last_seen_debounce:
+                # cached user expires as it was, so changes of user in database are seen after cache_ttl
+                self.pending_last_seen[session_id] = now
+                self.sessions.replace(session_id, (user, now))
+            return user
 
-    @staticmethod
-    async def create_session(connection, login: str) -> str:
+        user = await get_user_by_session(connection, session_id, active_since=now - self.session_ttl)
+        if user is None:
+            self.unknown_sessions.set(session_id, True)
+            return None
+
+        self._seen(session_id, user, now)
+        return user
+
+    async def create_session(self, connection, login: str) -> str:
         session_id = str(uuid4())
         if await set_user_session_id(connection, login, session_id):
+            # previous session of user is replaced
+            previous = self.session_by_login.get(login)
+            if previous is not None:
+                self.session_by_login.invalidate(login)
+                self.sessions.invalidate(previous)
+                self.pending_last_seen.pop(previous, None)
+
+            self.unknown_sessions.invalidate(session_id)
             return session_id
+
+    async def flush_last_seen(self, connection):
+        """Writes pending last seen times of sessions with one query"""
+        if not self.pending_last_seen:
+            return
+
+        pending, self.pending_last_seen = self.pending_last_seen, {}
+        try:
+            await update_sessions_last_seen(connection, pending)
+        except Exception:
+            # keep times to write them next time, unless session was seen again
+            for session_id, last_seen in pending.items():
+                self.pending_last_seen.setdefault(session_id, last_seen)
+            raise
+
+    async def flush_loop(self):
+        logger.info(f'started loop {self.__class__.__name__}.{self.flush_loop.__name__}')
+        while True:
+            try:
+                await asyncio.sleep(self.flush_interval)
+
+                if self.pending_last_seen:
+                    async with Database().connect() as connection:
+                        await self.flush_last_seen(connection)
+
+            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                return
+
+            except Exception:
+                logger.exception('failed to write sessions last seen')
@@ -1,21 +1,55 @@
 import asyncio
+import heapq
+import itertools
 from asyncpg import Connection
 from typing import Optional
 from datetime import datetime, timedelta
 
 from lib.util.module import BaseModule, SingletonModule
 from lib.db import Database
-from lib.models.events import ERepeatType
-from lib.sql.notifications import get_pending_notifications, NotificationRecord, count_offset, update_notifications
-from lib.util.repetitions import set_start_date_due_to_interval
+from lib.models.events import EChannel
+from lib.modules.senders import BaseSender, LogSender, dispatch, DEFAULT_CONCURRENCY, DEFAULT_BATCH_SIZE
+from lib.sql.const import NOTIFICATIONS_CHANNEL
+from lib.sql.notifications import (
+    claim_pending_notifications,
+    get_notification_deadlines,
+    update_notifications,
+    NotificationRecord,
+    count_offset,
+)
+from lib.util.repetitions import seek_occurrence
 
 from logging import getLogger
 
 
 logger = getLogger('notificator')
 
+DEFAULT_CLAIM_LIMIT = 1000
+DEFAULT_LEASE = 300.0
+DEFAULT_HORIZON = 600.0
+DEFAULT_PRELOAD_LIMIT = 1000
+
+# asyncio timers may fire a bit earlier than requested, so notifications are claimed slightly ahead
+CLAIM_AHEAD = timedelta(seconds=1)
+RETRY_DELAY = 5.0
+LISTEN_CHECK_INTERVAL = 5.0
+
 
 class Notificator(BaseModule, metaclass=SingletonModule):
+    CONFIG_KEY = 'notificator'
+    CONFIG_SCHEME = {
+        'type': 'dict',
+        'default': {},
+        'schema': {
+            'concurrency': {'type': 'integer', 'default': DEFAULT_CONCURRENCY},  # batches sent at once per channel
+            'batch_size': {'type': 'integer', 'default': DEFAULT_BATCH_SIZE},
+            'claim_limit': {'type': 'integer', 'default': DEFAULT_CLAIM_LIMIT},  # notifications claimed at once
+            'lease': {'type': 'float', 'default': DEFAULT_LEASE},  # seconds claimed notifications are locked for
+            'horizon': {'type': 'float', 'default': DEFAULT_HORIZON},  # seconds of deadlines preloaded from database
+            'preload_limit': {'type': 'integer', 'default': DEFAULT_PRELOAD_LIMIT},
+        }
+    }
+
     def __init__(
             self,
             config: dict = None,
@@ -24,12 +58,72 @@ class Notificator(BaseModule, metaclass=SingletonModule):
         super().__init__(config, loop)
 
         self.task: asyncio.Task = None
+        self.listen_task: asyncio.Task = None
+        self.senders: dict[EChannel, BaseSender] = {
+            channel: LogSender(
+                channel,
+                concurrency=self.config.get('concurrency', DEFAULT_CONCURRENCY),
+                batch_size=self.config.get('batch_size', DEFAULT_BATCH_SIZE),
+            )
+            for channel in EChannel
+        }
+        self.claim_limit: int = self.config.get('claim_limit', DEFAULT_CLAIM_LIMIT)
+        self.lease = timedelta(seconds=self.config.get('lease', DEFAULT_LEASE))
+        self.horizon = timedelta(seconds=self.config.get('horizon', DEFAULT_HORIZON))
+        self.preload_limit: int = self.config.get('preload_limit', DEFAULT_PRELOAD_LIMIT)
+
+        # heap of moments when notifications become due, deadlines after loaded_until are not known yet
+        self.deadlines: list[datetime] = []
+        self.loaded_until: datetime = datetime.min
+        self.wakeup = asyncio.Event()
+
+    def register_sender(self, sender: BaseSender):
+        self.senders[sender.channel] = sender
 
     async def on_shutdown(self):
-        self.task.cancel('shutdown')
+        for task in (self.task, self.listen_task):
+            if task is not None:
+                task.cancel('shutdown')
 
     def start(self):
         self.task = asyncio.create_task(self.notification_loop())
+        self.listen_task = asyncio.create_task(self.listen_loop())
+
+    def schedule(self, moment: datetime):
+        """Adds deadline to scheduler, wakes it up if deadline is sooner than the next one"""
+        if moment > self.loaded_until:
+            # will be loaded from database when scheduler reaches it
+            return
+
+        if not self.deadlines or moment < self.deadlines[0]:
+            self.wakeup.set()
+
+        heapq.heappush(self.deadlines, moment)
+
+    async def load_deadlines(self, connection: Connection):
+        now = datetime.now()
+        loaded = await get_notification_deadlines(connection, now, now + self.horizon, self.preload_limit)
+
+        # deadlines pushed while loading are kept, duplicates are dropped
+        self.deadlines = sorted({*loaded, *(moment for moment in self.deadlines if moment > now)})
+        self.loaded_until = loaded[-1] if len(loaded) == self.preload_limit else now + self.horizon
+
+    async def wait_next_deadline(self):
+        """Sleeps until the next deadline, the end of loaded deadlines or wake up by schedule"""
+        self.wakeup.clear()
+
+        now = datetime.now()
+        while self.deadlines and self.deadlines[0] <= now:
+            heapq.heappop(self.deadlines)
+
+        wake_at = self.loaded_until
+        if self.deadlines:
+            wake_at = min(wake_at, self.deadlines[0])
+
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout=max(0., (wake_at - now).total_seconds()))
+        except asyncio.TimeoutError:
+            pass
 
     async def notification_loop(self):
         logger.info(f'started loop {self.__class__.__name__}.{self.notification_loop.__name__}')
@@ -38,58 +132,128 @@ class Notificator(BaseModule, metaclass=SingletonModule):
                 async with Database().connect() as connection:
                     await self.run_once(connection)
 
+                    if datetime.now() >= self.loaded_until:
+                        await self.load_deadlines(connection)
+
+                await self.wait_next_deadline()
+
             except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
                 return
 
-            except Exception as e:
+            except Exception:
                 logger.exception('notificator crashed')
+                await asyncio.sleep(RETRY_DELAY)
+
+    def _on_notification_inserted(self, connection: Connection, pid: int, channel: str, payload: str):
+        try:
+            self.schedule(datetime.fromisoformat(payload))
+        except ValueError:
+            logger.warning(f'bad payload in channel {channel}: {payload!r}')
+
+    async def listen_loop(self):
+        """Holds dedicated connection listening for inserted notifications"""
+        logger.info(f'started loop {self.__class__.__name__}.{self.listen_loop.__name__}')
+        while True:
+            connection = None
+            try:
+                connection = await Database().connect()
+                await connection.add_listener(NOTIFICATIONS_CHANNEL, self._on_notification_inserted)
 
-            await asyncio.sleep(30.0)
+                # notifications could be inserted while there was no listener
+                self.wakeup.set()
 
-    async def run_once(self, connection: Connection):
-        notifications = await get_pending_notifications(connection)
+                while not connection.is_closed():
+                    await asyncio.sleep(LISTEN_CHECK_INTERVAL)
+
+            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                return
+
+            except Exception:
+                logger.exception('notificator listener crashed')
+
+            finally:
+                if connection is not None:
+                    try:
+                        if not connection.is_closed():
+                            await connection.remove_listener(NOTIFICATIONS_CHANNEL, self._on_notification_inserted)
+                        await Database().pool.release(connection)
+                    except Exception:
+                        logger.warning('failed to release listener connection', exc_info=True)
+
+            await asyncio.sleep(RETRY_DELAY)
+
+    async def run_once(self, connection: Connection) -> int:
+        """Claims and sends pending notifications batch by batch, returns count of sent notifications
+
+        Notifications are claimed with lease, so several notificators (workers or hosts) never send the same one.
+        """
+        sent_count = 0
+        while True:
+            claimed_count, batch_sent_count = await self.process_batch(connection)
+            sent_count += batch_sent_count
+
+            if claimed_count < self.claim_limit:
+                return sent_count
+
+    async def process_batch(self, connection: Connection) -> tuple[int, int]:
+        """Returns count of claimed and sent notifications, not sent ones are retried after lease expires"""
+        claimed_at = datetime.now()
+        notifications = await claim_pending_notifications(
+            connection, claimed_at + CLAIM_AHEAD, self.claim_limit, self.lease
+        )
         if not notifications:
-            return
+            return 0, 0
+
+        sent = await dispatch(self.senders, notifications)
+        # notifications of channels without sender would never be sent, they are skipped till the next occurrence
+        skipped = [
+            notification for notification in notifications if EChannel(notification.channel) not in self.senders
+        ]
+        if len(sent) + len(skipped) < len(notifications):
+            # not sent notifications become claimable again when lease expires
+            self.schedule(claimed_at + self.lease)
 
+        last_send_time = datetime.now()
         to_update_times: list[tuple[int, Optional[datetime], Optional[datetime]]] = []
 
-        for notification in notifications:
-            await self.send_notification(notification)
+        # recipients of one event notification share the next time, so it is computed once per group
+        next_times: dict[tuple[int, str, datetime], Optional[datetime]] = {}
 
-            last_send_time = datetime.now()
+        for notification, last_notify_at in itertools.chain(
+                ((notification, last_send_time) for notification in sent),
+                # skipped notifications keep time when they were really sent last
+                ((notification, None) for notification in skipped),
+        ):
             next_notification_time = None
 
             if notification.repetition is not None:
-                next_notification_time = self.find_next_notification_time(notification)
+                key = (notification.event_id, notification.offset_notify, notification.next_notify_at)
+                if key not in next_times:
+                    next_times[key] = self.find_next_notification_time(notification)
+                    if next_times[key] is not None:
+                        self.schedule(next_times[key])
+
+                next_notification_time = next_times[key]
 
             to_update_times.append(
-                (notification.id, next_notification_time, last_send_time)
+                (notification.id, next_notification_time, last_notify_at)
             )
 
         await update_notifications(connection, to_update_times)
 
+        return len(notifications), len(sent)
+
     @staticmethod
     def find_next_notification_time(notification: NotificationRecord) -> Optional[datetime]:
-        start_date = notification.next_notify_at
-
+        """Returns notify time of the next event occurrence after the notified one, skipping past ones"""
         offset = count_offset(notification.offset_notify)
 
-        end_find_start_notify = timedelta(weeks=200)
-        if notification.repetition.type == ERepeatType.yearly:
-            end_find_start_notify = timedelta(weeks=70 * notification.repetition.each)
-
-        next_start_date = set_start_date_due_to_interval(
-            repetition=notification.repetition,
-            event_start_date=start_date,
-            repeat_start_date=datetime.now() + offset + timedelta(minutes=5),
-            repeat_end_date=datetime.now() + end_find_start_notify
-        )
+        # occurrences are counted from the event start, notified occurrence is used if it is not known
+        event_start = notification.event_start or notification.next_notify_at + offset
+        moment = max(datetime.now(), notification.next_notify_at) + offset + timedelta(microseconds=1)
 
-        return next_start_date
+        next_start_date = seek_occurrence(notification.repetition, event_start, moment)
+        if next_start_date is None:
+            return None
 
-    @staticmethod
-    async def send_notification(notification: NotificationRecord):
-        logger.debug(
-            f'notification: to {notification.recipient} '
-            f'via {notification.channel} about event {notification.event_id}'
-        )
+        return next_start_date - offset
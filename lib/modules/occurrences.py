@@ -0,0 +1,118 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from asyncpg import Connection
+
+from lib.db import Database
+from lib.sql.repetition import row_to_repetition
+from lib.sql.occurrences import get_events_to_materialize, materialize_occurrences
+from lib.util.module import BaseModule, SingletonModule
+
+from logging import getLogger
+
+
+logger = getLogger('occurrences')
+
+DEFAULT_HORIZON_DAYS = 365
+DEFAULT_REFRESH_INTERVAL = 3600
+DEFAULT_BATCH_SIZE = 500
+
+
+class OccurrenceMaterializer(BaseModule, metaclass=SingletonModule):
+    """
+        Keeps occurrences of repeated events materialized in event_occurrences
+        for a rolling horizon, so window queries do not expand repetitions
+    """
+    CONFIG_KEY = 'occurrences'
+    CONFIG_SCHEME = {
+        'type': 'dict',
+        'default': {},
+        'schema': {
+            'enabled': {'type': 'boolean', 'default': False},
+            'horizon_days': {'type': 'integer', 'default': DEFAULT_HORIZON_DAYS},
+            'refresh_interval': {'type': 'integer', 'default': DEFAULT_REFRESH_INTERVAL},
+            'batch_size': {'type': 'integer', 'default': DEFAULT_BATCH_SIZE},
+        }
+    }
+
+    def __init__(
+            self,
+            config: dict = None,
+            loop: asyncio.AbstractEventLoop = None
+    ):
+        super().__init__(config, loop)
+
+        self.enabled: bool = self.config.get('enabled', False)
+        self.horizon_days: int = self.config.get('horizon_days', DEFAULT_HORIZON_DAYS)
+        self.refresh_interval: int = self.config.get('refresh_interval', DEFAULT_REFRESH_INTERVAL)
+        self.batch_size: int = self.config.get('batch_size', DEFAULT_BATCH_SIZE)
+
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def horizon(self) -> Optional[datetime]:
+        """Time until occurrences should be materialized, None if materialization is disabled"""
+        if not self.enabled:
+            return None
+
+        return datetime.now() + timedelta(days=self.horizon_days)
+
+    async def on_shutdown(self):
+        if self.task is not None:
+            self.task.cancel('shutdown')
+
+    def start(self):
+        if self.enabled:
+            self.task = asyncio.create_task(self.materialize_loop())
+
+    async def materialize_loop(self):
+        logger.info(f'started loop {self.__class__.__name__}.{self.materialize_loop.__name__}')
+        while True:
+            try:
+                async with Database().connect() as connection:
+                    await self.run_once(connection)
+
+            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                return
+
+            except Exception:
+                logger.exception('occurrence materializer crashed')
+
+            await asyncio.sleep(self.refresh_interval)
+
+    async def run_once(self, connection: Connection) -> int:
+        """Extends materialized occurrences of all repeated events up to horizon, returns number of events"""
+        horizon = self.horizon
+        if horizon is None:
+            return 0
+
+        # materialize a bit further than required, so events are not picked up on every run
+        materialize_until = horizon + timedelta(seconds=self.refresh_interval)
+
+        count = 0
+        while True:
+            rows = await get_events_to_materialize(connection, horizon, self.batch_size)
+            if not rows:
+                break
+
+            for row in rows:
+                async with connection.transaction():
+                    await materialize_occurrences(
+                        connection,
+                        row['id'],
+                        row['start_time'],
+                        row['end_time'],
+                        row_to_repetition(row),
+                        row['materialized_until'] or row['start_time'],
+                        materialize_until,
+                    )
+
+            count += len(rows)
+            if len(rows) < self.batch_size:
+                break
+
+        if count:
+            logger.debug(f'materialized occurrences of {count} events until {materialize_until}')
+
+        return count
@@ -0,0 +1,109 @@
+import asyncio
+from abc import ABC, abstractmethod
+from logging import getLogger
+from typing import Iterable
+
+from lib.models.events import EChannel
+from lib.sql.notifications import NotificationRecord
+
+logger = getLogger('notificator')
+
+DEFAULT_CONCURRENCY = 10
+DEFAULT_BATCH_SIZE = 100
+
+
+class BaseSender(ABC):
+    """
+        Sends notifications of one channel in batches
+        No more than {concurrency} batches are sent at the same time
+    """
+    def __init__(
+            self,
+            channel: EChannel,
+            concurrency: int = DEFAULT_CONCURRENCY,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+    ):
+        self.channel = channel
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(self, notifications: list[NotificationRecord]) -> list[NotificationRecord]:
+        """Sends notifications concurrently by batches, returns successfully sent ones"""
+        batches = [
+            notifications[i:i + self.batch_size]
+            for i in range(0, len(notifications), self.batch_size)
+        ]
+
+        results = await asyncio.gather(
+            *(self._send_batch_limited(batch) for batch in batches),
+            return_exceptions=True,
+        )
+
+        sent = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, BaseException):
+                logger.error(
+                    f'failed to send {len(batch)} notifications via {self.channel.value}',
+                    exc_info=result,
+                )
+                continue
+
+            sent.extend(batch)
+
+        return sent
+
+    async def _send_batch_limited(self, batch: list[NotificationRecord]):
+        async with self._semaphore:
+            await self.send_batch(batch)
+
+    @abstractmethod
+    async def send_batch(self, batch: list[NotificationRecord]):
+        """Sends one batch, should raise exception if batch was not sent"""
+
+
+class LogSender(BaseSender):
+    """Writes notifications to the log instead of real channel"""
+
+    async def send_batch(self, batch: list[NotificationRecord]):
+        for notification in batch:
+            logger.debug(
+                f'notification: to {notification.recipient} '
+                f'via {notification.channel} about event {notification.event_id}'
+            )
+
+
+class StubSender(BaseSender):
+    """Keeps sent notifications in memory, for local testing"""
+
+    def __init__(self, *args, fail: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail = fail
+        self.sent: list[NotificationRecord] = []
+        self.batches_count = 0
+
+    async def send_batch(self, batch: list[NotificationRecord]):
+        if self.fail:
+            raise RuntimeError(f'{self.channel.value} is not available')
+
+        self.batches_count += 1
+        self.sent.extend(batch)
+
+
+async def dispatch(
+        senders: dict[EChannel, BaseSender], notifications: Iterable[NotificationRecord]
+) -> list[NotificationRecord]:
+    """Sends notifications via senders of their channels concurrently, returns successfully sent ones"""
+    by_channel: dict[EChannel, list[NotificationRecord]] = {}
+    for notification in notifications:
+        by_channel.setdefault(EChannel(notification.channel), []).append(notification)
+
+    channels = [channel for channel in by_channel if channel in senders]
+    for channel in by_channel.keys() - set(channels):
+        logger.error(f'no sender for channel {channel.value}')
+
+    results = await asyncio.gather(
+        *(senders[channel].send(by_channel[channel]) for channel in channels)
+    )
+
+    return [notification for sent in results for notification in sent]
@@ -0,0 +1,64 @@
+import asyncio
+from typing import Optional, Union
+
+from lib.models.users import User, UserFull
+from lib.util.cache import LRUCache
+from lib.util.module import BaseModule, SingletonModule
+
+DEFAULT_MAX_SIZE = 10_000
+DEFAULT_TTL = 60.0
+
+
+class UserCache(BaseModule, metaclass=SingletonModule):
+    """
+        Process local cache of user profiles by login, users are cached as short and full models separately.
+        Other processes may change users, so profiles expire after ttl seconds.
+    """
+    CONFIG_KEY = 'user_cache'
+    CONFIG_SCHEME = {
+        'type': 'dict',
+        'default': {},
+        'schema': {
+            'enabled': {'type': 'boolean', 'default': True},
+            'max_size': {'type': 'integer', 'default': DEFAULT_MAX_SIZE},
+            'ttl': {'type': 'float', 'default': DEFAULT_TTL},  # seconds
+        }
+    }
+
+    def __init__(
+            self,
+            config: dict = None,
+            loop: asyncio.AbstractEventLoop = None
+    ):
+        super().__init__(config, loop)
+
+        self.enabled: bool = self.config.get('enabled', True)
+        self.cache: LRUCache[tuple[str, bool], Union[User, UserFull]] = LRUCache(
+            max_size=self.config.get('max_size', DEFAULT_MAX_SIZE),
+            ttl=self.config.get('ttl', DEFAULT_TTL),
+        )
+
+    def get(self, login: str, full: bool = False) -> Optional[Union[User, UserFull]]:
+        if not self.enabled:
+            return None
+
+        return self.cache.get((login, full))
+
+    def set(self, user: Union[User, UserFull], full: bool = False):
+        if self.enabled:
+            self.cache.set((user.login, full), user)
+
+    def invalidate(self, login: str):
+        for full in (False, True):
+            self.cache.invalidate((login, full))
+
+    def clear(self):
+        self.cache.clear()
+
+    @property
+    def hits(self) -> int:
+        return self.cache.hits
+
+    @property
+    def misses(self) -> int:
+        return self.cache.misses
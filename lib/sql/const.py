@@ -4,3 +4,6 @@ USERS_TABLE = 'users'
 EVENTS_TABLE = 'events'
 PARTICIPATION_TABLE = 'participation'
 NOTIFICATION_TABLE = 'notifications'
+OCCURRENCES_TABLE = 'event_occurrences'
+SCHEMA_VERSION_TABLE = 'schema_version'
+NOTIFICATIONS_CHANNEL = 'notifications_scheduled'
@@ -1,82 +1,166 @@
+import heapq
+import itertools
 from datetime import datetime
-from typing import Optional
+from typing import AsyncIterator, Iterator, Optional
 
-from asyncpg import Connection
+from asyncpg import Connection, Record
 
-from lib.models.events import RCreateEvent, Event, Repetition, Participant, EDecision, ERepeatType
+from lib.db.statements import Statement
+from lib.models.events import RCreateEvent, Event, Participant, EDecision
 from lib.models.users import User
-from lib.models.common import EDay
-from lib.sql.user import get_one_user, get_users_from_event_rows
+from lib.sql.user import get_one_user, get_many_users, get_users_from_event_rows
 from lib.sql.participation import insert_many_participation
-from lib.sql.notifications import insert_notifications
-from lib.sql.const import PARTICIPATION_TABLE, EVENTS_TABLE, USERS_TABLE
+from lib.sql.notifications import insert_notifications, build_notification_rows, notify_scheduled, NOTIFICATION_COLUMNS
+from lib.sql.occurrences import materialize_occurrences, get_materialized_occurrences, is_materialized
+from lib.sql.repetition import row_to_repetition
+from lib.sql.const import PARTICIPATION_TABLE, EVENTS_TABLE, OCCURRENCES_TABLE, NOTIFICATION_TABLE
 from lib.util import repetitions
+from lib.util.occurrences import expand_repetitions
 
+STREAM_CHUNK_SIZE = 500
 
-async def create_table_events(connection: Connection):
-    await connection.execute(
-        f'''
-            CREATE TABLE IF NOT EXISTS {EVENTS_TABLE} (
-                id                      serial CONSTRAINT {EVENTS_TABLE}_pk primary key,
-                author                  varchar(255) CONSTRAINT event_author__fk references {USERS_TABLE}
-                                            on update cascade on delete cascade,
-                name                    text,
-                description             text,
-                start_time              timestamp,
-                end_time                timestamp,
-                repeat_type            varchar(100),
-                repeat_weekly_days     varchar(100),
-                repeat_monthly_last_week       bool,
-                repeat_due_date        timestamp,
-                repeat_each            int
-            );
-        '''
+SELECT_EVENT = Statement(
+    'select_event',
+    f'''
+        SELECT * FROM {EVENTS_TABLE} e
+        LEFT OUTER JOIN {PARTICIPATION_TABLE} p on e.id = p.event_id
+        WHERE e.id = $1
+    '''
+)
+SELECT_USERS_EVENTS = Statement(
+    'select_users_events',
+    f'''
+        SELECT * FROM {EVENTS_TABLE} e
+        LEFT OUTER JOIN {PARTICIPATION_TABLE} p on e.id = p.event_id
+        WHERE (
+                  e.author = ANY($1::text[]) OR
+                  EXISTS (
+                      SELECT 1 FROM {PARTICIPATION_TABLE} up
+                      WHERE up.event_id = e.id AND up.user_login = ANY($1::text[])
+                  )
+              ) AND
+              (
+                  e.time_range && tsrange($2, $3, '()') OR
+                  (
+                      e.repeat_type is not NULL AND e.start_time < $3 AND
+                      (e.repeat_due_date is NULL OR e.repeat_due_date >= $2) AND
+                      (e.materialized_until is NULL OR e.materialized_until < $3)
+                  ) OR
+                  (
+                      e.materialized_until >= $3 AND EXISTS (
+                          SELECT 1 FROM {OCCURRENCES_TABLE} o
+                          WHERE o.event_id = e.id AND o.time_range && tsrange($2, $3, '()')
+                      )
+                  )
+              )
+        ORDER BY e.id;
+    '''
+)
+SELECT_EVENTS_PARTICIPATION = Statement(
+    'select_events_participation',
+    f'''
+        SELECT event_id, user_login, decision FROM {PARTICIPATION_TABLE} WHERE event_id = ANY($1::int[]);
+    '''
+)
+
+# (start_time, id) of event occurrence, occurrences are ordered by it
+EventKey = tuple[datetime, int]
+
+EVENT_COLUMNS = (
+    'author',
+    'name',
+    'description',
+    'start_time',
+    'end_time',
+    'repeat_type',
+    'repeat_weekly_days',
+    'repeat_monthly_last_week',
+    'repeat_due_date',
+    'repeat_each',
+)
+
+INSERT_EVENT = Statement(
+    'insert_event',
+    f'''
+        INSERT INTO {EVENTS_TABLE} ({', '.join(EVENT_COLUMNS)}) VALUES (
+            $1, $2, $3, $4, $5, $6, $7, $8, $9, $10
+        )
+        RETURNING id;
+    '''
+)
+RESERVE_EVENT_IDS = Statement(
+    'reserve_event_ids',
+    f'''
+        SELECT array_agg(id ORDER BY id) FROM (
+            SELECT nextval(pg_get_serial_sequence('{EVENTS_TABLE}', 'id')) AS id
+                FROM generate_series(1, $1)
+        ) ids;
+    '''
+)
+SELECT_USERS_EVENTS_ORDERED = Statement(
+    'select_users_events_ordered',
+    f'''
+        SELECT * FROM {EVENTS_TABLE} e
+        WHERE (
+                  e.author = ANY($1::text[]) OR
+                  EXISTS (
+                      SELECT 1 FROM {PARTICIPATION_TABLE} p
+                      WHERE p.event_id = e.id AND p.user_login = ANY($1::text[])
+                  )
+              ) AND
+              (
+                  e.time_range && tsrange($2, $3, '()') OR
+                  (
+                      e.repeat_type is not NULL AND e.start_time < $3 AND
+                      (e.repeat_due_date is NULL OR e.repeat_due_date >= $2)
+                  )
+              ) AND
+              (
+                  (e.start_time, e.id) > ($4, $5) OR
+                  (e.repeat_type is not NULL AND (e.repeat_due_date is NULL OR e.repeat_due_date >= $4))
+              )
+        ORDER BY e.start_time, e.id;
+    '''
+)
+
+
+def event_request_to_row(request: RCreateEvent) -> tuple:
+    """Returns values of EVENT_COLUMNS for event creation request"""
+    return (
+        request.author_login,
+        request.name,
+        request.description,
+        request.start_time.replace(tzinfo=None),
+        request.end_time.replace(tzinfo=None),
+        request.repetition.type.value if request.repetition else None,
+        ','.join(request.repetition.weekly_days) if request.repetition else '',
+        request.repetition.monthly_last_week if request.repetition else None,
+        request.repetition.due_date.replace(tzinfo=None) if request.repetition and request.repetition.due_date else None,
+        request.repetition.each if request.repetition else None
+    )
+
+
+def event_from_request(event_id: int, author: User, request: RCreateEvent) -> Event:
+    return Event(
+        id=event_id,
+        author=author,
+        start_time=request.start_time.replace(tzinfo=None),
+        end_time=request.end_time.replace(tzinfo=None),
+        name=request.name,
+        description=request.description,
+        participants=request.participants,
+        repetition=request.repetition,
+        notifications=request.notifications,
     )
 
 
-async def insert_event(connection: Connection, request: RCreateEvent) -> Event:
+async def insert_event(
+        connection: Connection, request: RCreateEvent, materialize_until: Optional[datetime] = None
+) -> Event:
     async with connection.transaction():
-        base_event_id = await connection.fetchval(
-            f'''
-                INSERT INTO {EVENTS_TABLE} (
-                    author,
-                    name,
-                    description,
-                    start_time,
-                    end_time,
-                    repeat_type,
-                    repeat_weekly_days,
-                    repeat_monthly_last_week,
-                    repeat_due_date,
-                    repeat_each
-                ) VALUES (
-                    $1, $2, $3, $4, $5, $6, $7, $8, $9, $10
-                )
-                RETURNING id;
-            ''',
-            request.author_login,
-            request.name,
-            request.description,
-            request.start_time.replace(tzinfo=None),
-            request.end_time.replace(tzinfo=None),
-            request.repetition.type.value if request.repetition else None,
-            ','.join(request.repetition.weekly_days) if request.repetition else '',
-            request.repetition.monthly_last_week if request.repetition else None,
-            request.repetition.due_date.replace(tzinfo=None) if request.repetition and request.repetition.due_date else None,
-            request.repetition.each if request.repetition else None
-        )
+        base_event_id = await INSERT_EVENT.fetchval(connection, *event_request_to_row(request))
 
-        event = Event(
-            id=base_event_id,
-            author=await get_one_user(connection, request.author_login),
-            start_time=request.start_time.replace(tzinfo=None),
-            end_time=request.end_time.replace(tzinfo=None),
-            name=request.name,
-            description=request.description,
-            participants=request.participants,
-            repetition=request.repetition,
-            notifications=request.notifications,
-        )
+        event = event_from_request(base_event_id, await get_one_user(connection, request.author_login), request)
 
         if request.notifications:
             await insert_notifications(connection, event)
@@ -84,15 +168,96 @@ async def insert_event(connection: Connection, request: RCreateEvent) -> Event:
         if request.participants:
             await insert_many_participation(connection, base_event_id, request.participants)
 
+        if request.repetition and materialize_until is not None:
+            await materialize_occurrences(
+                connection,
+                base_event_id,
+                event.start_time,
+                event.end_time,
+                event.repetition,
+                event.start_time,
+                materialize_until,
+            )
+
         return event
 
 
+async def insert_many_events(
+        connection: Connection, requests: list[RCreateEvent], materialize_until: Optional[datetime] = None
+) -> list[Event]:
+    """Creates events with participants, notifications and occurrences in one transaction with COPY
+
+    Ids are reserved from the sequence beforehand, so every table is written with a single COPY,
+    events are returned in order of requests.
+    """
+    if not requests:
+        return []
+
+    async with connection.transaction():
+        event_ids = await RESERVE_EVENT_IDS.fetchval(connection, len(requests))
+
+        await connection.copy_records_to_table(
+            EVENTS_TABLE,
+            columns=('id', *EVENT_COLUMNS, 'materialized_until'),
+            records=(
+                (
+                    event_id,
+                    *event_request_to_row(request),
+                    materialize_until if request.repetition and materialize_until is not None else None,
+                )
+                for event_id, request in zip(event_ids, requests)
+            ),
+        )
+
+        authors = {
+            user.login: user
+            for user in await get_many_users(connection, [request.author_login for request in requests])
+        }
+        events = [
+            event_from_request(event_id, authors[request.author_login], request)
+            for event_id, request in zip(event_ids, requests)
+        ]
+
+        participation_rows = [
+            (event.id, participant.user.login, participant.decision.value)
+            for event in events
+            for participant in event.participants
+        ]
+        if participation_rows:
+            await connection.copy_records_to_table(
+                PARTICIPATION_TABLE, columns=('event_id', 'user_login', 'decision'), records=participation_rows
+            )
+
+        notification_rows = [row for event in events for row in build_notification_rows(event)]
+        if notification_rows:
+            await connection.copy_records_to_table(
+                NOTIFICATION_TABLE, columns=NOTIFICATION_COLUMNS, records=notification_rows
+            )
+            await notify_scheduled(connection, notification_rows)
+
+        if materialize_until is not None:
+            occurrence_rows = []
+            for event in events:
+                if event.repetition is None:
+                    continue
+
+                starts, ends = expand_repetitions(
+                    [(event.start_time, event.end_time, event.repetition)], event.start_time, materialize_until
+                )
+                occurrence_rows.extend(
+                    (event.id, start_time, end_time) for start_time, end_time in zip(starts.tolist(), ends.tolist())
+                )
+
+            if occurrence_rows:
+                await connection.copy_records_to_table(
+                    OCCURRENCES_TABLE, columns=('event_id', 'start_time', 'end_time'), records=occurrence_rows
+                )
+
+        return events
+
+
 async def get_one_event(connection: Connection, event_id: int) -> Optional[Event]:
-    result = await connection.fetch(f'''
-        SELECT * FROM {EVENTS_TABLE} e
-        LEFT OUTER JOIN {PARTICIPATION_TABLE} p on e.id = p.event_id
-        WHERE e.id = $1
-    ''', event_id)
+    result = await SELECT_EVENT.fetch(connection, event_id)
 
     if not result:
         return None
@@ -127,111 +292,266 @@ def is_event_in_interval(event: Event, time_from: datetime, time_to: datetime):
     return event.start_time < time_to and event.end_time > time_from
 
 
-def extend_with_repeats(result: list[Event], time_from: datetime, time_to: datetime) -> bool:
-    if not result:
-        return False
+def iterate_event_occurrences(
+        event: Event, time_from: datetime, time_to: datetime, after: Optional[EventKey] = None
+) -> Iterator[Event]:
+    """Lazily yields event and its repeats intersecting interval in order of start
+
+    If after is passed, only occurrences with (start_time, id) greater than it are yielded,
+    repeats are sought right from it, earlier ones are not generated.
+    """
+    if is_event_in_interval(event, time_from, time_to) and (after is None or (event.start_time, event.id) > after):
+        yield event
 
-    base_event = result[-1]
-    if not is_event_in_interval(base_event, time_from, time_to):
-        result.pop(-1)
+    if event.repetition is None:
+        return
 
-    if base_event.repetition is None:
-        return False
+    duration = event.end_time - event.start_time
 
-    repeat_until = time_to
-    if base_event.repetition.due_date is not None:
-        repeat_until = min(time_to, base_event.repetition.due_date)
+    repeat_start_date = time_from - duration
+    if after is not None:
+        repeat_start_date = max(repeat_start_date, after[0])
 
     repeat_dates = repetitions.iterate_repetitions(
-        repetition=base_event.repetition,
-        event_start_date=base_event.start_time,
-        repeat_start_date=time_from,
-        repeat_end_date=repeat_until
+        repetition=event.repetition,
+        event_start_date=event.start_time,
+        repeat_start_date=repeat_start_date,
+        repeat_end_date=time_to
     )
 
-    if not repeat_dates:
-        return False
+    for date in repeat_dates:
+        if date >= time_to or date + duration <= time_from:
+            continue
 
-    duration = base_event.end_time - base_event.start_time
+        if after is not None and (date, event.id) <= after:
+            continue
 
-    for date in repeat_dates:
-        # do not need to deepcopy, no future usage of mutable fields not supposed to happen
-        new_event = base_event.copy(deep=False)
-        new_event.start_time = date
-        new_event.end_time = date + duration
-        result.append(new_event)
+        yield event_occurrence(event, date, date + duration)
 
-    return True
+
+def expand_event(event: Event, time_from: datetime, time_to: datetime) -> list[Event]:
+    """Returns event and its repeats intersecting interval"""
+    return list(iterate_event_occurrences(event, time_from, time_to))
+
+
+class OccurrencesMerger:
+    """K-way merge of occurrences of events which are pushed in order of start time
+
+    Repeats of event never start before the event itself, so occurrences starting before
+    the last pushed event are final and may be yielded. Only one pending occurrence
+    per event is kept in memory.
+    """
+
+    def __init__(self, time_from: datetime, time_to: datetime, after: Optional[EventKey] = None):
+        self.time_from = time_from
+        self.time_to = time_to
+        self.after = after
+        self._heap: list[tuple[datetime, int, int, Event, Iterator[Event]]] = []
+        self._counter = itertools.count()
+
+    def _push_next(self, occurrences: Iterator[Event]):
+        occurrence = next(occurrences, None)
+        if occurrence is not None:
+            heapq.heappush(
+                self._heap, (occurrence.start_time, occurrence.id, next(self._counter), occurrence, occurrences)
+            )
+
+    def _pop(self) -> Event:
+        *_, occurrence, occurrences = heapq.heappop(self._heap)
+        self._push_next(occurrences)
+        return occurrence
+
+    def push(self, event: Event) -> Iterator[Event]:
+        """Adds event and yields occurrences starting before it"""
+        while self._heap and self._heap[0][0] < event.start_time:
+            yield self._pop()
+
+        self._push_next(iterate_event_occurrences(event, self.time_from, self.time_to, self.after))
+
+    def flush(self) -> Iterator[Event]:
+        while self._heap:
+            yield self._pop()
+
+
+def event_occurrence(event: Event, start_time: datetime, end_time: datetime) -> Event:
+    # do not need to deepcopy, no future usage of mutable fields not supposed to happen
+    new_event = event.copy(deep=False)
+    new_event.start_time = start_time
+    new_event.end_time = end_time
+    return new_event
 
 
 async def get_many_users_events(connection: Connection, logins: set[str], time_from: datetime, time_to: datetime) -> list[Event]:
-    response = await connection.fetch(
-        f'''
-            SELECT * FROM {EVENTS_TABLE} e
-            LEFT OUTER JOIN {PARTICIPATION_TABLE} p on e.id = p.event_id
-            WHERE (p.user_login = ANY($1::text[]) OR e.author = ANY($1::text[])) AND
-                  (
-                      (e.end_time > $2 AND e.start_time < $3) OR
-                      (e.repeat_type is not NULL AND (e.repeat_due_date is NULL OR e.repeat_due_date >= $2))
-                  );
-        ''',
-        logins, time_from.replace(tzinfo=None), time_to.replace(tzinfo=None)
-    )
+    time_from, time_to = time_from.replace(tzinfo=None), time_to.replace(tzinfo=None)
+
+    response = await SELECT_USERS_EVENTS.fetch(connection, logins, time_from, time_to)
 
     if not response:
         return []
 
     users: dict[str, User] = await get_users_from_event_rows(connection, response)
 
-    result: list[Event] = []
-    last_is_repeat = False
+    events: list[Event] = []
+    materialized_ids: set[int] = set()
     for row in response:
-        if not result or result[-1].id != row['id']:
-            if len(result) > 0:
-                was_extended = extend_with_repeats(result, time_from, time_to)
-                if not was_extended:
-                    last_is_repeat = last_is_repeat
-                else:
-                    last_is_repeat = True
-
-            event = Event(
+        if not events or events[-1].id != row['id']:
+            events.append(Event(
                 id=row['id'],
                 author=users[row['author']],
                 name=row['name'],
                 description=row['description'],
                 start_time=row['start_time'],
                 end_time=row['end_time'],
-            )
-
-            if row['repeat_type'] is not None:
-                weekly_days = []
-                for v in row['repeat_weekly_days'].split(','):
-                    if v:
-                        weekly_days.append(EDay(v))
-
-                event.repetition = Repetition(
-                    type=ERepeatType(row['repeat_type']),
-                    weekly_days=weekly_days,
-                    monthly_last_week=row['repeat_monthly_last_week'],
-                    due_date=row['repeat_due_date'],
-                    each=row['repeat_each']
-                )
+                repetition=row_to_repetition(row),
+            ))
 
-            result.append(event)
+            if events[-1].repetition is not None and is_materialized(row['materialized_until'], time_to):
+                materialized_ids.add(row['id'])
 
         if row['user_login']:
-            result[-1].participants.append(
+            events[-1].participants.append(
                 Participant(
                     user=users[row['user_login']],
                     decision=EDecision(row['decision']),
                 )
             )
 
-    if not last_is_repeat:
-        extend_with_repeats(result, time_from, time_to)
+    occurrences = {}
+    if materialized_ids:
+        occurrences = await get_materialized_occurrences(connection, materialized_ids, time_from, time_to)
+
+    result: list[Event] = []
+    for event in events:
+        if event.id in materialized_ids:
+            result.extend(
+                event_occurrence(event, start_time, end_time)
+                for start_time, end_time in occurrences.get(event.id, ())
+            )
+        else:
+            result.extend(expand_event(event, time_from, time_to))
 
     return sorted(result, key=lambda e: e.start_time)
 
 
+async def _events_from_rows(connection: Connection, rows: list[Record], users: dict[str, User]) -> list[Event]:
+    """Builds events with participants from event rows, users are looked up only if not known yet"""
+    participation = await SELECT_EVENTS_PARTICIPATION.fetch(connection, [row['id'] for row in rows])
+
+    unknown_logins = {row['author'] for row in rows} | {row['user_login'] for row in participation}
+    unknown_logins.difference_update(users)
+    if unknown_logins:
+        users.update((user.login, user) for user in await get_many_users(connection, list(unknown_logins)))
+
+    participants: dict[int, list[Participant]] = {}
+    for row in participation:
+        participants.setdefault(row['event_id'], []).append(
+            Participant(user=users[row['user_login']], decision=EDecision(row['decision']))
+        )
+
+    return [
+        Event(
+            id=row['id'],
+            author=users[row['author']],
+            name=row['name'],
+            description=row['description'],
+            start_time=row['start_time'],
+            end_time=row['end_time'],
+            repetition=row_to_repetition(row),
+            participants=participants.get(row['id'], []),
+        )
+        for row in rows
+    ]
+
+
+async def iterate_many_users_events(
+        connection: Connection,
+        logins: set[str],
+        time_from: datetime,
+        time_to: datetime,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        after: Optional[EventKey] = None,
+) -> AsyncIterator[Event]:
+    """Yields events of users intersecting interval (with repeats) in order of (start_time, id)
+
+    Events are read with server side cursor by chunks and repeats are generated lazily,
+    so memory does not depend on the interval width. Repeats are always expanded in python,
+    materialized occurrences are not used.
+    If after is passed, iteration is resumed right after occurrence with this key.
+    """
+    time_from, time_to = time_from.replace(tzinfo=None), time_to.replace(tzinfo=None)
+    after_start, after_id = after if after is not None else (datetime.min, 0)
+
+    users: dict[str, User] = {}
+    merger = OccurrencesMerger(time_from, time_to, after)
+
+    async with connection.transaction(readonly=True):
+        cursor = await SELECT_USERS_EVENTS_ORDERED.cursor(
+            connection, logins, time_from, time_to, after_start, after_id
+        )
+
+        while True:
+            rows = await cursor.fetch(chunk_size)
+            if rows:
+                for event in await _events_from_rows(connection, rows, users):
+                    for occurrence in merger.push(event):
+                        yield occurrence
+
+            if len(rows) < chunk_size:
+                break
+
+        for occurrence in merger.flush():
+            yield occurrence
+
+
+async def get_events_by_users(
+        connection: Connection, logins: set[str], time_from: datetime, time_to: datetime
+) -> tuple[list[Event], dict[str, list[int]]]:
+    """Returns events of users sorted by start and indexes of events of every user
+
+    Events shared by several users are fetched and expanded once and returned once.
+    """
+    events = await get_many_users_events(connection, logins, time_from, time_to)
+
+    by_user: dict[str, list[int]] = {login: [] for login in logins}
+    for index, event in enumerate(events):
+        for login in {event.author.login, *(participant.user.login for participant in event.participants)}:
+            if login in by_user:
+                by_user[login].append(index)
+
+    return events, by_user
+
+
 async def get_user_events(connection: Connection, login: str, time_from: datetime, time_to: datetime):
     return await get_many_users_events(connection, {login,}, time_from, time_to)
+
+
+def iterate_user_events(
+        connection: Connection, login: str, time_from: datetime, time_to: datetime, after: Optional[EventKey] = None
+) -> AsyncIterator[Event]:
+    return iterate_many_users_events(connection, {login,}, time_from, time_to, after=after)
+
+
+async def get_user_events_page(
+        connection: Connection,
+        login: str,
+        time_from: datetime,
+        time_to: datetime,
+        limit: int,
+        after: Optional[EventKey] = None,
+) -> tuple[list[Event], Optional[EventKey]]:
+    """Returns up to limit events after key and key of the last one if there are more events"""
+    events: list[Event] = []
+    iterator = iterate_many_users_events(
+        connection, {login,}, time_from, time_to, chunk_size=min(limit + 1, STREAM_CHUNK_SIZE), after=after
+    )
+    try:
+        async for event in iterator:
+            if len(events) == limit:
+                return events, (events[-1].start_time, events[-1].id)
+
+            events.append(event)
+    finally:
+        # finish cursor transaction before connection is released
+        await iterator.aclose()
+
+    return events, None
@@ -1,47 +1,106 @@
 from datetime import datetime, timedelta
+from typing import Optional
 
-from asyncpg import Connection
+from asyncpg import Connection, Record
 
-from lib.sql.event import get_many_users_events
+from lib.db.statements import Statement
+from lib.models.events import EDecision
+from lib.models.users import UserFull
+from lib.sql.const import EVENTS_TABLE, PARTICIPATION_TABLE
+from lib.sql.repetition import row_to_repetition
 from lib.sql.user import get_many_users
+from lib.util.occurrences import expand_repetitions
 
+BUSY_TIME_PERIOD = timedelta(weeks=4)
 
-async def get_users_busy_time(connection: Connection, logins: set[str], start_calc_from: datetime) -> list[tuple[datetime, datetime]]:
-    end_period = start_calc_from + timedelta(weeks=4)
+SELECT_USERS_BUSY_ROWS = Statement(
+    'select_users_busy_rows',
+    f'''
+        SELECT e.start_time, e.end_time, e.repeat_type, e.repeat_weekly_days,
+               e.repeat_monthly_last_week, e.repeat_due_date, e.repeat_each
+            FROM {EVENTS_TABLE} e
+        WHERE (
+                  e.author = ANY($1::text[]) OR
+                  EXISTS (
+                      SELECT 1 FROM {PARTICIPATION_TABLE} p
+                      WHERE p.event_id = e.id AND p.user_login = ANY($1::text[]) AND p.decision != $4
+                  )
+              ) AND
+              (
+                  e.time_range && tsrange($2, $3, '()') OR
+                  (
+                      e.repeat_type is not NULL AND e.start_time < $3 AND
+                      (e.repeat_due_date is NULL OR e.repeat_due_date >= $2)
+                  )
+              );
+    '''
+)
+
+
+def get_user_off_work_time(user: UserFull, start_calc_from: datetime, end_period: datetime) -> list[tuple[datetime, datetime]]:
     result: list[tuple[datetime, datetime]] = []
+    if not user.work_days:
+        return result
+
+    work_days = set()
+    start = user.work_days.day_from.weekday()
+    end = user.work_days.day_to.weekday()
+    work_days.update(range(start, min(7, end)))
+
+    if end < start:
+        work_days.update(range(0, end + 1))
+
+    current_date = start_calc_from.replace(second=0, microsecond=0)
+    while current_date <= end_period:
+        if current_date.weekday() in work_days:
+            if user.work_days.time_to < user.work_days.time_from:
+                result.append((
+                    current_date.replace(hour=user.work_days.time_to.hour, minute=user.work_days.time_to.minute),
+                    current_date.replace(hour=user.work_days.time_from.hour, minute=user.work_days.time_from.minute)
+                ))
+            else:
+                result.append((
+                    current_date.replace(hour=user.work_days.time_to.hour, minute=user.work_days.time_to.minute),
+                    (current_date + timedelta(days=1)).replace(hour=user.work_days.time_from.hour, minute=user.work_days.time_from.minute)
+                ))
+
+        current_date += timedelta(days=1)
+
+    return sorted(result)
+
+
+async def get_users_busy_rows(connection: Connection, logins: set[str], time_from: datetime, time_to: datetime) -> list[Record]:
+    """Returns only timing and repetition columns of events where users are authors or have not declined"""
+    return await SELECT_USERS_BUSY_ROWS.fetch(
+        connection, logins, time_from.replace(tzinfo=None), time_to.replace(tzinfo=None), EDecision.no.value
+    )
+
+
+async def get_users_busy_time(
+        connection: Connection,
+        logins: set[str],
+        start_calc_from: datetime,
+        end_period: Optional[datetime] = None,
+) -> list[list[tuple[datetime, datetime]]]:
+    """Returns streams of busy intervals sorted by start, one stream per user plus one for events"""
+    if end_period is None:
+        end_period = start_calc_from + BUSY_TIME_PERIOD
+
+    result: list[list[tuple[datetime, datetime]]] = []
 
     users = await get_many_users(connection, logins, full=True)
     for user in users:
-        if not user.work_days:
-            continue
-
-        work_days = set()
-        start = user.work_days.day_from.weekday()
-        end = user.work_days.day_to.weekday()
-        work_days.update(range(start, min(7, end)))
-
-        if end < start:
-            work_days.update(range(0, end + 1))
-
-        current_date = start_calc_from.replace(second=0, microsecond=0)
-        while current_date <= end_period:
-            if current_date.weekday() in work_days:
-                if user.work_days.time_to < user.work_days.time_from:
-                    result.append((
-                        current_date.replace(hour=user.work_days.time_to.hour, minute=user.work_days.time_to.minute),
-                        current_date.replace(hour=user.work_days.time_from.hour, minute=user.work_days.time_from.minute)
-                    ))
-                else:
-                    result.append((
-                        current_date.replace(hour=user.work_days.time_to.hour, minute=user.work_days.time_to.minute),
-                        (current_date + timedelta(days=1)).replace(hour=user.work_days.time_from.hour, minute=user.work_days.time_from.minute)
-                    ))
-
-    events = await get_many_users_events(connection, logins, start_calc_from, end_period)
-    if not events:
-        return []
-
-    for event in events:
-        result.append((event.start_time, event.end_time))
+        off_work_time = get_user_off_work_time(user, start_calc_from, end_period)
+        if off_work_time:
+            result.append(off_work_time)
+
+    rows = await get_users_busy_rows(connection, logins, start_calc_from, end_period)
+    starts, ends = expand_repetitions(
+        ((row['start_time'], row['end_time'], row_to_repetition(row)) for row in rows),
+        start_calc_from.replace(tzinfo=None),
+        end_period.replace(tzinfo=None),
+    )
+    if len(starts):
+        result.append(list(zip(starts.tolist(), ends.tolist())))
 
     return result
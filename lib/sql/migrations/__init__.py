@@ -0,0 +1,3 @@
+from .runner import migrate, get_schema_version, MIGRATIONS, LATEST_VERSION
+
+__all__ = ('migrate', 'get_schema_version', 'MIGRATIONS', 'LATEST_VERSION')
@@ -0,0 +1,82 @@
+from asyncpg import Connection
+
+from lib.sql.const import USERS_TABLE, EVENTS_TABLE, PARTICIPATION_TABLE, NOTIFICATION_TABLE
+
+
+async def upgrade(connection: Connection):
+    await connection.execute(
+        f'''CREATE TABLE IF NOT EXISTS {USERS_TABLE} (
+            login           varchar(255) CONSTRAINT {USERS_TABLE}_pk primary key,
+            first_name      varchar(255),
+            last_name       varchar(255),
+            work_day_from   varchar(3),
+            work_day_to     varchar(3),
+            work_time_from  varchar(5),
+            work_time_to    varchar(5),
+            
+            session_id      varchar(255),
+            last_seen       timestamp
+        );'''
+    )
+
+    await connection.execute(
+        f'''CREATE INDEX IF NOT EXISTS user_session_id__indx on {USERS_TABLE} (session_id);'''
+    )
+
+    await connection.execute(
+        f'''
+            CREATE TABLE IF NOT EXISTS {EVENTS_TABLE} (
+                id                      serial CONSTRAINT {EVENTS_TABLE}_pk primary key,
+                author                  varchar(255) CONSTRAINT event_author__fk references {USERS_TABLE}
+                                            on update cascade on delete cascade,
+                name                    text,
+                description             text,
+                start_time              timestamp,
+                end_time                timestamp,
+                repeat_type            varchar(100),
+                repeat_weekly_days     varchar(100),
+                repeat_monthly_last_week       bool,
+                repeat_due_date        timestamp,
+                repeat_each            int
+            );
+        '''
+    )
+
+    await connection.execute(
+        f'''
+            CREATE TABLE IF NOT EXISTS {PARTICIPATION_TABLE}
+            (
+                user_login  varchar(255)
+                    constraint user_participation__fk
+                        references {USERS_TABLE}
+                        on update cascade on delete cascade,
+                event_id    int
+                    constraint event_participation__fk
+                        references {EVENTS_TABLE}
+                        on update cascade on delete cascade,
+                decision varchar(10),
+                PRIMARY KEY (user_login, event_id)
+            );
+        '''
+    )
+
+    await connection.execute(
+        f'''
+            CREATE TABLE IF NOT EXISTS {NOTIFICATION_TABLE} (
+                id                  serial CONSTRAINT {NOTIFICATION_TABLE}_pk primary key,
+                offset_notify       varchar(50),
+                next_notify_at      timestamp,
+                last_notify_at      timestamp,
+                channel             varchar(25),
+                event_id            integer NOT NULL CONSTRAINT notification_event__fk references {EVENTS_TABLE}
+                                        on update cascade  on delete cascade,
+                
+                recipient           varchar(255) NOT NULL CONSTRAINT notification_user__fk references {USERS_TABLE}
+                                        on update cascade on delete cascade 
+            );
+        '''
+    )
+
+    await connection.execute(
+        f'''CREATE INDEX IF NOT EXISTS notification_at__indx on {NOTIFICATION_TABLE} (next_notify_at);'''
+    )
@@ -0,0 +1,22 @@
+from asyncpg import Connection
+
+from lib.sql.const import EVENTS_TABLE, OCCURRENCES_TABLE
+
+
+async def upgrade(connection: Connection):
+    # occurrences of repeated event are stored in event_occurrences up to this time
+    await connection.execute(
+        f'''ALTER TABLE {EVENTS_TABLE} ADD COLUMN IF NOT EXISTS materialized_until timestamp;'''
+    )
+
+    await connection.execute(
+        f'''
+            CREATE TABLE IF NOT EXISTS {OCCURRENCES_TABLE} (
+                event_id            integer NOT NULL CONSTRAINT occurrence_event__fk references {EVENTS_TABLE}
+                                        on update cascade on delete cascade,
+                start_time          timestamp NOT NULL,
+                end_time            timestamp NOT NULL,
+                PRIMARY KEY (event_id, start_time)
+            );
+        '''
+    )
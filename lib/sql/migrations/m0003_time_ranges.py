@@ -0,0 +1,36 @@
+from asyncpg import Connection
+
+from lib.sql.const import EVENTS_TABLE, OCCURRENCES_TABLE, PARTICIPATION_TABLE
+
+
+async def upgrade(connection: Connection):
+    # [start_time, end_time] range for window queries with overlap operator,
+    # end_time is not allowed to be less than start_time in range
+    for table in (EVENTS_TABLE, OCCURRENCES_TABLE):
+        await connection.execute(
+            f'''
+                ALTER TABLE {table} ADD COLUMN IF NOT EXISTS time_range tsrange
+                    GENERATED ALWAYS AS (tsrange(start_time, greatest(start_time, end_time), '[]')) STORED;
+            '''
+        )
+
+    await connection.execute(
+        f'''CREATE INDEX IF NOT EXISTS event_time_range__indx on {EVENTS_TABLE} USING gist (time_range);'''
+    )
+
+    await connection.execute(
+        f'''CREATE INDEX IF NOT EXISTS occurrence_time_range__indx on {OCCURRENCES_TABLE} USING gist (time_range);'''
+    )
+
+    await connection.execute(
+        f'''CREATE INDEX IF NOT EXISTS event_repeated__indx on {EVENTS_TABLE} (start_time) WHERE repeat_type IS NOT NULL;'''
+    )
+
+    await connection.execute(
+        f'''CREATE INDEX IF NOT EXISTS event_author__indx on {EVENTS_TABLE} (author);'''
+    )
+
+    # lookups by user_login are served by primary key, joins from events go by event_id
+    await connection.execute(
+        f'''CREATE INDEX IF NOT EXISTS participation_event_id__indx on {PARTICIPATION_TABLE} (event_id);'''
+    )
@@ -0,0 +1,10 @@
+from asyncpg import Connection
+
+from lib.sql.const import NOTIFICATION_TABLE
+
+
+async def upgrade(connection: Connection):
+    # notification is claimed by one notificator till locked_until, expired lease may be claimed again
+    await connection.execute(
+        f'''ALTER TABLE {NOTIFICATION_TABLE} ADD COLUMN IF NOT EXISTS locked_until timestamp;'''
+    )
@@ -0,0 +1,15 @@
+from asyncpg import Connection
+
+from lib.sql.const import NOTIFICATION_TABLE
+
+
+async def upgrade(connection: Connection):
+    # only pending notifications are searched by time, sent ones (next_notify_at is NULL) are not indexed
+    await connection.execute(
+        f'''
+            CREATE INDEX IF NOT EXISTS notification_pending__indx on {NOTIFICATION_TABLE} (next_notify_at)
+                WHERE next_notify_at IS NOT NULL;
+        '''
+    )
+
+    await connection.execute('''DROP INDEX IF EXISTS notification_at__indx;''')
@@ -0,0 +1,86 @@
+from logging import getLogger
+from typing import Optional
+
+from asyncpg import Connection
+from asyncpg import exceptions as exc
+
+from lib.sql.const import SCHEMA_VERSION_TABLE
+from lib.sql.migrations import (
+    m0001_initial,
+    m0002_event_occurrences,
+    m0003_time_ranges,
+    m0004_notification_lease,
+    m0005_pending_notifications_index,
+)
+
+logger = getLogger('migrations')
+
+# Migrations are applied in order of their numbers, new migration should be appended with next number.
+# Applied migrations should never be changed.
+MIGRATIONS = {
+    1: m0001_initial,
+    2: m0002_event_occurrences,
+    3: m0003_time_ranges,
+    4: m0004_notification_lease,
+    5: m0005_pending_notifications_index,
+}
+
+LATEST_VERSION = max(MIGRATIONS)
+
+# Any constant number, same for every process working with the database
+MIGRATIONS_LOCK_ID = 7_265_413
+
+
+async def get_schema_version(connection: Connection) -> int:
+    try:
+        version = await connection.fetchval(f'SELECT max(version) FROM {SCHEMA_VERSION_TABLE};')
+    except exc.UndefinedTableError:
+        return 0
+
+    return version or 0
+
+
+async def _create_table_schema_version(connection: Connection):
+    await connection.execute(
+        f'''
+            CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} (
+                version         int CONSTRAINT {SCHEMA_VERSION_TABLE}_pk primary key,
+                name            varchar(255),
+                applied_at      timestamp DEFAULT now()
+            );
+        '''
+    )
+
+
+async def migrate(connection: Connection, target_version: Optional[int] = None) -> int:
+    """Applies migrations up to target version (latest by default), returns current schema version
+
+    If schema is up-to-date only one query is done. Every migration is applied in its own transaction
+    under advisory lock, so several processes can call migrate at the same time.
+    """
+    if target_version is None:
+        target_version = LATEST_VERSION
+
+    version = await get_schema_version(connection)
+    while version < target_version:
+        async with connection.transaction():
+            await connection.execute('SELECT pg_advisory_xact_lock($1);', MIGRATIONS_LOCK_ID)
+            await _create_table_schema_version(connection)
+
+            # other process could apply migrations while we were waiting for lock
+            version = await get_schema_version(connection)
+            if version >= target_version:
+                break
+
+            version += 1
+            migration = MIGRATIONS[version]
+            name = migration.__name__.rsplit('.', 1)[-1]
+
+            logger.info(f'applying migration {name}')
+            await migration.upgrade(connection)
+            await connection.execute(
+                f'INSERT INTO {SCHEMA_VERSION_TABLE} (version, name) VALUES ($1, $2);',
+                version, name
+            )
+
+    return version
@@ -1,35 +1,62 @@
 from datetime import datetime, timedelta
 from typing import Optional, NamedTuple
 
-from lib.models.events import Repetition, Event, ERepeatType, EDecision
-from lib.models.common import EDay
+from lib.models.events import Repetition, Event, EDecision
 
 from asyncpg import Connection
-from lib.util.repetitions import set_start_date_due_to_interval
-from lib.sql.const import NOTIFICATION_TABLE, EVENTS_TABLE, USERS_TABLE
-
-
-async def create_table_notifications(connection: Connection):
-    await connection.execute(
-        f'''
-            CREATE TABLE IF NOT EXISTS {NOTIFICATION_TABLE} (
-                id                  serial CONSTRAINT {NOTIFICATION_TABLE}_pk primary key,
-                offset_notify       varchar(50),
-                next_notify_at      timestamp,
-                last_notify_at      timestamp,
-                channel             varchar(25),
-                event_id            integer NOT NULL CONSTRAINT notification_event__fk references {EVENTS_TABLE}
-                                        on update cascade  on delete cascade,
-                
-                recipient           varchar(255) NOT NULL CONSTRAINT notification_user__fk references {USERS_TABLE}
-                                        on update cascade on delete cascade 
-            );
-        '''
-    )
-
-    await connection.execute(
-        f'''CREATE INDEX IF NOT EXISTS notification_at__indx on {NOTIFICATION_TABLE} (next_notify_at);'''
-    )
+from lib.util.repetitions import seek_occurrence
+from lib.sql.const import NOTIFICATION_TABLE, EVENTS_TABLE, NOTIFICATIONS_CHANNEL
+from lib.sql.repetition import row_to_repetition
+from lib.util.cache import LRUCache
+from lib.db.statements import Statement
+
+REPETITIONS_CACHE_SIZE = 10_000
+
+CLAIM_PENDING_NOTIFICATIONS = Statement(
+    'claim_pending_notifications',
+    f'''
+        WITH claimed AS (
+            UPDATE {NOTIFICATION_TABLE} SET locked_until = $2
+            WHERE id IN (
+                SELECT id FROM {NOTIFICATION_TABLE}
+                WHERE next_notify_at IS NOT NULL AND next_notify_at <= $1 AND
+                      (locked_until IS NULL OR locked_until < $3)
+                ORDER BY next_notify_at
+                LIMIT $4
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, offset_notify, next_notify_at, channel, event_id, recipient
+        )
+        SELECT n.*, e.start_time AS event_start,
+               e.repeat_due_date, e.repeat_each, e.repeat_monthly_last_week, e.repeat_type, e.repeat_weekly_days
+            FROM claimed n
+        JOIN {EVENTS_TABLE} e on e.id = n.event_id;
+    '''
+)
+SELECT_NOTIFICATION_DEADLINES = Statement(
+    'select_notification_deadlines',
+    f'''
+        SELECT DISTINCT greatest(next_notify_at, locked_until) AS deadline
+            FROM {NOTIFICATION_TABLE}
+        WHERE next_notify_at IS NOT NULL AND next_notify_at <= $2 AND
+              greatest(next_notify_at, locked_until) > $1 AND
+              greatest(next_notify_at, locked_until) <= $2
+        ORDER BY deadline
+        LIMIT $3;
+    '''
+)
+UPDATE_NOTIFICATIONS = Statement(
+    'update_notifications',
+    f'''
+        UPDATE {NOTIFICATION_TABLE} n SET
+            next_notify_at = u.next_notify_at,
+            last_notify_at = coalesce(u.last_notify_at, n.last_notify_at),
+            locked_until = NULL
+        FROM unnest($1::int[], $2::timestamp[], $3::timestamp[]) AS u(id, next_notify_at, last_notify_at)
+        WHERE n.id = u.id;
+    '''
+)
+NOTIFY_SCHEDULED = Statement('notify_scheduled', 'SELECT pg_notify($1, $2);')
 
 
 def count_offset(offset: str) -> timedelta:
@@ -43,52 +70,85 @@ def count_offset(offset: str) -> timedelta:
         return timedelta(days=num)
 
 
-async def insert_notifications(connection: Connection, event: Event):
-    if event.start_time < datetime.now() and event.repetition is None:
-        return
+NOTIFICATION_COLUMNS = ('offset_notify', 'next_notify_at', 'channel', 'event_id', 'recipient')
+
+INSERT_NOTIFICATIONS = Statement(
+    'insert_notifications',
+    f'''
+        INSERT INTO {NOTIFICATION_TABLE} ({', '.join(NOTIFICATION_COLUMNS)}) VALUES ($1, $2, $3, $4, $5);
+    '''
+)
 
-    logins = {event.author.login, *(p.user.login for p in event.participants if p.decision != EDecision.no)}
 
-    start_time = event.start_time
+def build_notification_rows(event: Event) -> list[tuple]:
+    """Returns rows (NOTIFICATION_COLUMNS) of notifications about the nearest not notified occurrence of event"""
+    now = datetime.now()
+    if event.start_time < now and event.repetition is None:
+        return []
 
-    end_find_start_notify = timedelta(weeks=200)
-    if event.repetition and event.repetition.type == ERepeatType.yearly:
-        end_find_start_notify = timedelta(weeks=70 * event.repetition.each)
+    logins = {event.author.login, *(p.user.login for p in event.participants if p.decision != EDecision.no)}
 
-    params = []
+    rows = []
     for notification in event.notifications:
         offset = count_offset(notification.offset)
 
         event_start = event.start_time
-        if start_time - offset < datetime.now():
-            if event.repetition:
-                event_start = set_start_date_due_to_interval(
-                    repetition=event.repetition,
-                    event_start_date=event.start_time,
-                    repeat_start_date=datetime.now() + offset + timedelta(minutes=5),
-                    repeat_end_date=datetime.now() + end_find_start_notify,
-                )
-            else:
+        if event_start - offset < now:
+            if event.repetition is None:
+                continue
+
+            event_start = seek_occurrence(event.repetition, event.start_time, now + offset)
+            if event_start is None:
                 continue
 
-        params.extend(
+        rows.extend(
             (notification.offset, event_start - offset, notification.channel.value, event.id, login)
             for login in logins
         )
 
-    await connection.executemany(
-        f'''
-            INSERT INTO {NOTIFICATION_TABLE} (
-                offset_notify,
-                next_notify_at,
-                channel,
-                event_id,
-                recipient
-            ) VALUES ($1, $2, $3, $4, $5);
-        ''',
-        params
+    return rows
+
+
+async def notify_scheduled(connection: Connection, rows: list[tuple]):
+    """Wakes up listening notificators on commit if the notification is sooner than their next deadline"""
+    if rows:
+        await NOTIFY_SCHEDULED.execute(connection, NOTIFICATIONS_CHANNEL, min(row[1] for row in rows).isoformat())
+
+
+async def insert_notifications(connection: Connection, event: Event):
+    rows = build_notification_rows(event)
+
+    await INSERT_NOTIFICATIONS.executemany(connection, rows)
+
+    await notify_scheduled(connection, rows)
+
+
+# parsed repetitions by event id, kept together with raw repetition columns they were parsed from,
+# so if event repetition changes it is parsed again
+_repetitions: LRUCache[int, tuple[tuple, Repetition]] = LRUCache(max_size=REPETITIONS_CACHE_SIZE)
+
+
+def get_cached_repetition(row: dict) -> Optional[Repetition]:
+    """Returns repetition of notification event, parsed once for all recipients of the event"""
+    if row['repeat_type'] is None:
+        return None
+
+    raw = (
+        row['repeat_type'],
+        row['repeat_weekly_days'],
+        row['repeat_monthly_last_week'],
+        row['repeat_due_date'],
+        row['repeat_each'],
     )
 
+    cached = _repetitions.get(row['event_id'])
+    if cached is not None and cached[0] == raw:
+        return cached[1]
+
+    repetition = row_to_repetition(row)
+    _repetitions.set(row['event_id'], (raw, repetition))
+    return repetition
+
 
 class NotificationRecord(NamedTuple):
     id: int
@@ -99,47 +159,32 @@ class NotificationRecord(NamedTuple):
     recipient: str
     last_notify_at: Optional[datetime] = None
     repetition: Optional[Repetition] = None
+    event_start: Optional[datetime] = None
 
     @classmethod
     def from_row(cls, row: dict) -> 'NotificationRecord':
-        repetition = None
-        if row['repeat_type'] is not None:
-            weekly_days = []
-            for v in row['repeat_weekly_days'].split(','):
-                if v:
-                    weekly_days.append(EDay(v))
-
-            repetition = Repetition(
-                type=ERepeatType(row['repeat_type']),
-                weekly_days=weekly_days,
-                monthly_last_week=row['repeat_monthly_last_week'],
-                due_date=row['repeat_due_date'],
-                each=row['repeat_each'],
-            )
-
-        result = cls(
+        return cls(
             id=row['id'],
             offset_notify=row['offset_notify'],
             next_notify_at=row['next_notify_at'],
             channel=row['channel'],
             event_id=row['event_id'],
             recipient=row['recipient'],
-            repetition=repetition,
+            repetition=get_cached_repetition(row),
+            event_start=row.get('event_start'),
         )
 
-        return result
 
+async def claim_pending_notifications(
+        connection: Connection, until: datetime, limit: int, lease: timedelta
+) -> list[NotificationRecord]:
+    """Locks up to limit notifications pending till until for lease, rows claimed by other workers are skipped
 
-async def get_pending_notifications(connection: Connection) -> list[NotificationRecord]:
-    rows = await connection.fetch(
-        f'''
-            SELECT n.*, e.repeat_due_date, e.repeat_each, e.repeat_monthly_last_week, e.repeat_type, e.repeat_weekly_days
-                FROM {NOTIFICATION_TABLE} n
-            RIGHT JOIN {EVENTS_TABLE} e on e.id = n.event_id
-            WHERE n.next_notify_at IS NOT NULL and n.next_notify_at <= $1;
-        ''',
-        datetime.now() + timedelta(minutes=1)
-    )
+    Claimed notification is not returned again till its lease expires, so if worker dies
+    its notifications will be sent by another one.
+    """
+    now = datetime.now()
+    rows = await CLAIM_PENDING_NOTIFICATIONS.fetch(connection, until, now + lease, now, limit)
 
     result = []
     for row in rows:
@@ -148,13 +193,22 @@ async def get_pending_notifications(connection: Connection) -> list[Notification
     return result
 
 
+async def get_notification_deadlines(
+        connection: Connection, time_from: datetime, time_to: datetime, limit: int
+) -> list[datetime]:
+    """Returns sorted distinct moments in (time_from, time_to] when notifications become claimable"""
+    return [
+        row['deadline'] for row in await SELECT_NOTIFICATION_DEADLINES.fetch(connection, time_from, time_to, limit)
+    ]
+
+
 async def update_notifications(connection: Connection, params: list[tuple[int, Optional[datetime], Optional[datetime]]]):
-    await connection.executemany(
-        f'''
-            UPDATE {NOTIFICATION_TABLE} SET 
-                next_notify_at = $2,
-                last_notify_at = $3
-            WHERE id = $1;
-        ''',
-        params
-    )
+    """Sets next and last notify times of (id, next_notify_at, last_notify_at) and releases lease in one query
+
+    If last_notify_at is None, the previous one is kept.
+    """
+    if not params:
+        return
+
+    ids, next_notify_times, last_notify_times = zip(*params)
+    await UPDATE_NOTIFICATIONS.execute(connection, list(ids), list(next_notify_times), list(last_notify_times))
@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import Optional, Iterable
+
+from asyncpg import Connection, Record
+
+from lib.db.statements import Statement
+from lib.models.events import Repetition
+from lib.sql.const import OCCURRENCES_TABLE, EVENTS_TABLE
+from lib.util.occurrences import expand_repetitions
+
+SELECT_MATERIALIZED_OCCURRENCES = Statement(
+    'select_materialized_occurrences',
+    f'''
+        SELECT event_id, start_time, end_time FROM {OCCURRENCES_TABLE}
+        WHERE event_id = ANY($1::int[]) AND time_range && tsrange($2, $3, '()')
+        ORDER BY start_time;
+    '''
+)
+INSERT_OCCURRENCES = Statement(
+    'insert_occurrences',
+    f'''
+        INSERT INTO {OCCURRENCES_TABLE} (event_id, start_time, end_time)
+            SELECT $1, o.start_time, o.end_time FROM unnest($2::timestamp[], $3::timestamp[]) AS o(start_time, end_time)
+        ON CONFLICT DO NOTHING;
+    '''
+)
+UPDATE_MATERIALIZED_UNTIL = Statement(
+    'update_materialized_until',
+    f'''UPDATE {EVENTS_TABLE} SET materialized_until = $2 WHERE id = $1;'''
+)
+SELECT_EVENTS_TO_MATERIALIZE = Statement(
+    'select_events_to_materialize',
+    f'''
+        SELECT id, start_time, end_time, materialized_until, repeat_type, repeat_weekly_days,
+               repeat_monthly_last_week, repeat_due_date, repeat_each
+            FROM {EVENTS_TABLE}
+        WHERE repeat_type IS NOT NULL AND
+              (materialized_until IS NULL OR materialized_until < $1) AND
+              (repeat_due_date IS NULL OR repeat_due_date >= coalesce(materialized_until, start_time))
+        ORDER BY materialized_until NULLS FIRST
+        LIMIT $2;
+    '''
+)
+
+
+async def materialize_occurrences(
+        connection: Connection,
+        event_id: int,
+        start_time: datetime,
+        end_time: datetime,
+        repetition: Repetition,
+        time_from: datetime,
+        time_to: datetime,
+):
+    """Stores occurrences (with the event itself) starting before time_to and marks event materialized until time_to"""
+    starts, ends = expand_repetitions([(start_time, end_time, repetition)], time_from, time_to)
+
+    if len(starts):
+        await INSERT_OCCURRENCES.execute(connection, event_id, starts.tolist(), ends.tolist())
+
+    await UPDATE_MATERIALIZED_UNTIL.execute(connection, event_id, time_to)
+
+
+async def get_events_to_materialize(connection: Connection, horizon: datetime, limit: int) -> list[Record]:
+    return await SELECT_EVENTS_TO_MATERIALIZE.fetch(connection, horizon, limit)
+
+
+async def get_materialized_occurrences(
+        connection: Connection, event_ids: Iterable[int], time_from: datetime, time_to: datetime
+) -> dict[int, list[tuple[datetime, datetime]]]:
+    rows = await SELECT_MATERIALIZED_OCCURRENCES.fetch(
+        connection, list(event_ids), time_from.replace(tzinfo=None), time_to.replace(tzinfo=None)
+    )
+
+    result: dict[int, list[tuple[datetime, datetime]]] = {}
+    for row in rows:
+        result.setdefault(row['event_id'], []).append((row['start_time'], row['end_time']))
+
+    return result
+
+
+def is_materialized(materialized_until: Optional[datetime], time_to: datetime) -> bool:
+    return materialized_until is not None and materialized_until >= time_to.replace(tzinfo=None)
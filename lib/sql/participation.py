@@ -1,38 +1,30 @@
 from asyncpg import Connection
 
+from lib.db.statements import Statement
 from lib.models.events import Participant, EDecision
-from lib.sql.const import USERS_TABLE, EVENTS_TABLE, PARTICIPATION_TABLE
+from lib.sql.const import PARTICIPATION_TABLE
 
-
-async def create_table_participation(connection: Connection):
-    await connection.execute(
-        f'''
-            CREATE TABLE IF NOT EXISTS {PARTICIPATION_TABLE}
-            (
-                user_login  varchar(255)
-                    constraint user_participation__fk
-                        references {USERS_TABLE}
-                        on update cascade on delete cascade,
-                event_id    int
-                    constraint event_participation__fk
-                        references {EVENTS_TABLE}
-                        on update cascade on delete cascade,
-                decision varchar(10),
-                PRIMARY KEY (user_login, event_id)
-            );
-        '''
-    )
+INSERT_PARTICIPATION = Statement(
+    'insert_participation',
+    f'''
+        INSERT INTO {PARTICIPATION_TABLE} (
+            event_id,
+            user_login,
+            decision
+        ) VALUES ($1, $2, $3);
+    '''
+)
+UPDATE_PARTICIPATION_DECISION = Statement(
+    'update_participation_decision',
+    f'''
+        UPDATE {PARTICIPATION_TABLE} SET decision = $1 WHERE event_id = $2 AND user_login = $3;
+    '''
+)
 
 
 async def insert_many_participation(connection: Connection, event_id: int, participants: list[Participant]):
-    await connection.executemany(
-        f'''
-            INSERT INTO {PARTICIPATION_TABLE} (
-                event_id,
-                user_login,
-                decision
-            ) VALUES ($1, $2, $3);
-        ''',
+    await INSERT_PARTICIPATION.executemany(
+        connection,
         (
             (event_id, participant.user.login, participant.decision.value)
             for participant in participants
@@ -41,9 +33,4 @@ async def insert_many_participation(connection: Connection, event_id: int, parti
 
 
 async def accept_participation(connection: Connection, event_id: int, user_login: str, decision: EDecision):
-    await connection.execute(
-        f'''
-            UPDATE {PARTICIPATION_TABLE} SET decision = $1 WHERE event_id = $2 AND user_login = $3;
-        ''',
-        decision.value, event_id, user_login
-    )
+    await UPDATE_PARTICIPATION_DECISION.execute(connection, decision.value, event_id, user_login)
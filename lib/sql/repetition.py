@@ -0,0 +1,22 @@
+from typing import Optional
+
+from lib.models.common import EDay
+from lib.models.events import Repetition, ERepeatType
+
+
+def row_to_repetition(row: dict) -> Optional[Repetition]:
+    if row['repeat_type'] is None:
+        return None
+
+    weekly_days = []
+    for v in (row['repeat_weekly_days'] or '').split(','):
+        if v:
+            weekly_days.append(EDay(v))
+
+    return Repetition(
+        type=ERepeatType(row['repeat_type']),
+        weekly_days=weekly_days,
+        monthly_last_week=row['repeat_monthly_last_week'],
+        due_date=row['repeat_due_date'],
+        each=row['repeat_each']
+    )
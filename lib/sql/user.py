@@ -2,28 +2,55 @@ from lib.models.users import UserFull, User, Name
 from lib.models.common import EDay, Time
 from asyncpg import Connection
 from lib.sql.const import USERS_TABLE
+from lib.db.statements import Statement
+from lib.modules.user_cache import UserCache
 from typing import Union, Iterable, Optional
-
-
-async def create_table_users(connection: Connection):
-    await connection.execute(
-        f'''CREATE TABLE IF NOT EXISTS {USERS_TABLE} (
-            login           varchar(255) CONSTRAINT {USERS_TABLE}_pk primary key,
-            first_name      varchar(255),
-            last_name       varchar(255),
-            work_day_from   varchar(3),
-            work_day_to     varchar(3),
-            work_time_from  varchar(5),
-            work_time_to    varchar(5),
-            
-            session_id      varchar(255),
-            last_seen       timestamp
-        );'''
-    )
-
-    await connection.execute(
-        f'''CREATE INDEX IF NOT EXISTS user_session_id__indx on {USERS_TABLE} (session_id);'''
-    )
+from datetime import datetime
+
+SELECT_USERS_BY_LOGINS = Statement(
+    'select_users_by_logins',
+    f'''SELECT * FROM {USERS_TABLE} WHERE login = ANY($1::text[]);'''
+)
+SELECT_USER = Statement(
+    'select_user',
+    f'''SELECT * FROM {USERS_TABLE} WHERE login = $1;'''
+)
+SELECT_USER_BY_SESSION = Statement(
+    'select_user_by_session',
+    f'''
+        SELECT * FROM {USERS_TABLE}
+        WHERE session_id = $1 AND ($2::timestamp IS NULL OR coalesce(last_seen, $2) >= $2)
+        LIMIT 1;
+    '''
+)
+INSERT_USER = Statement(
+    'insert_user',
+    f'''
+        INSERT INTO {USERS_TABLE} (
+            login,
+            first_name,
+            last_name,
+            work_day_from,
+            work_day_to,
+            work_time_from,
+            work_time_to
+        ) VALUES (
+            $1, $2, $3, $4, $5, $6, $7
+        ) RETURNING *;
+    '''
+)
+UPDATE_USER_SESSION = Statement(
+    'update_user_session',
+    f'''UPDATE {USERS_TABLE} SET session_id = $1, last_seen = $3 WHERE login = $2 RETURNING 1;'''
+)
+UPDATE_SESSIONS_LAST_SEEN = Statement(
+    'update_sessions_last_seen',
+    f'''
+        UPDATE {USERS_TABLE} u SET last_seen = greatest(u.last_seen, s.last_seen)
+        FROM unnest($1::text[], $2::timestamp[]) AS s(session_id, last_seen)
+        WHERE u.session_id = s.session_id;
+    '''
+)
 
 
 def user_row_to_model(row: dict, full: False):
@@ -56,26 +83,43 @@ async def insert_user(connection: Connection, user: UserFull) -> UserFull:
             user.work_days.time_to,
         )
 
-    result = await connection.fetchrow(
-        f'''
-            INSERT INTO {USERS_TABLE} (
-                login, 
-                first_name, 
-                last_name,
-                work_day_from,
-                work_day_to,
-                work_time_from,
-                work_time_to
-            ) VALUES (
-                $1, $2, $3, $4, $5, $6, $7
-            ) RETURNING *;
-        ''',
-        user.login, user.name.first, user.name.last, *time_kwargs
+    result = await INSERT_USER.fetchrow(
+        connection, user.login, user.name.first, user.name.last, *time_kwargs
     )
+    UserCache().invalidate(user.login)
 
     return user_row_to_model(result, full=True)
 
 
+async def get_users_by_logins(
+        connection: Connection, logins: Iterable[str], full=False
+) -> dict[str, Union[UserFull, User]]:
+    """Returns found users by login, only users missing in cache are fetched from database"""
+    cache = UserCache()
+
+    result = {}
+    missing = set()
+    for login in logins:
+        if login is None:
+            continue
+
+        user = cache.get(login, full)
+        if user is None:
+            missing.add(login)
+        else:
+            result[login] = user
+
+    if missing:
+        rows = await SELECT_USERS_BY_LOGINS.fetch(connection, missing)
+
+        for row in rows:
+            user = user_row_to_model(row, full=full)
+            cache.set(user, full)
+            result[user.login] = user
+
+    return result
+
+
 async def get_users_from_event_rows(connection: Connection, event_rows: Iterable[dict]) -> dict[str, User]:
     logins = set()
 
@@ -83,47 +127,38 @@ async def get_users_from_event_rows(connection: Connection, event_rows: Iterable
         logins.add(row['author'])
         logins.add(row['user_login'])
 
-    rows = await connection.fetch(
-        f'''
-            SELECT * FROM {USERS_TABLE} WHERE login = ANY($1::text[]);
-        ''',
-        logins
-    )
-
-    return {
-        row['login']: user_row_to_model(row, full=False)
-        for row in rows
-    }
+    return await get_users_by_logins(connection, logins)
 
 
 async def get_one_user(
         connection: Connection, login: str, full=False
 ) -> Union[UserFull, User]:
-    row = await connection.fetchrow(
-        f'SELECT * FROM {USERS_TABLE} WHERE login = $1',
-        login
-    )
+    user = UserCache().get(login, full)
+    if user is not None:
+        return user
 
-    return user_row_to_model(row, full=full)
+    row = await SELECT_USER.fetchrow(connection, login)
 
+    user = user_row_to_model(row, full=full)
+    UserCache().set(user, full)
+    return user
 
-async def get_many_users(connection: Connection, logins: list[str], full=False) -> list[Union[UserFull, User]]:
-    rows = await connection.fetch(
-        f'SELECT * FROM {USERS_TABLE} WHERE login = ANY($1::text[])',
-        set(logins)
-    )
 
-    return [user_row_to_model(row, full=full) for row in rows]
+async def get_many_users(connection: Connection, logins: list[str], full=False) -> list[Union[UserFull, User]]:
+    return list((await get_users_by_logins(connection, set(logins), full=full)).values())
 
 
-async def get_user_by_session(connection: Connection, session_id: str) -> Optional[User]:
+async def get_user_by_session(
+        connection: Connection, session_id: str, active_since: Optional[datetime] = None
+) -> Optional[User]:
+    """Returns user of session, if active_since is passed sessions not used since then are expired"""
     if session_id is None:
         return
 
-    row = await connection.fetchrow(
-        f'''SELECT * FROM {USERS_TABLE} WHERE session_id = $1 LIMIT 1;''',
-        session_id
-    )
+    row = await SELECT_USER_BY_SESSION.fetchrow(connection, session_id, active_since)
+
+    if row is None:
+        return None
 
     return user_row_to_model(row, full=False)
 
@@ -132,9 +167,14 @@ async def set_user_session_id(connection: Connection, login: str, session_id: st
     if session_id is None:
         raise ValueError('session_id is empty')
 
-    row = await connection.fetch(
-        f'''UPDATE {USERS_TABLE} SET session_id = $1 WHERE login = $2 RETURNING 1;''',
-        session_id, login
-    )
+    row = await UPDATE_USER_SESSION.fetch(connection, session_id, login, datetime.now())
 
     return bool(row)
+
+
+async def update_sessions_last_seen(connection: Connection, last_seen: dict[str, datetime]):
+    """Sets last seen time of many sessions in one query"""
+    if not last_seen:
+        return
+
+    await UPDATE_SESSIONS_LAST_SEEN.execute(connection, list(last_seen), list(last_seen.values()))
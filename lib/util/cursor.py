@@ -0,0 +1,19 @@
+import base64
+import binascii
+from datetime import datetime
+
+
+def encode_cursor(start_time: datetime, event_id: int) -> str:
+    """Returns opaque token of (start_time, event_id) key for keyset pagination"""
+    raw = f'{start_time.isoformat()}|{event_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> tuple[datetime, int]:
+    """Returns (start_time, event_id) key of token, raises ValueError if token is not valid"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        start_time, event_id = raw.split('|')
+        return datetime.fromisoformat(start_time), int(event_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('cursor is not valid') from None
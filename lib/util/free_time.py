@@ -0,0 +1,104 @@
+import heapq
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+
+Interval = tuple[datetime, datetime]
+
+
+def merge_busy_intervals(streams: Iterable[Iterable[Interval]]) -> Iterator[Interval]:
+    """Merges sorted by start busy interval streams into sorted non-overlapping intervals.
+
+    Every stream should be sorted by interval start (e.g. one stream per user),
+    streams are merged with a heap, so the whole merge is O(n log k).
+    """
+    current_start, current_end = None, None
+
+    for start, end in heapq.merge(*streams):
+        if current_start is None:
+            current_start, current_end = start, end
+            continue
+
+        if start <= current_end:
+            current_end = max(current_end, end)
+            continue
+
+        yield current_start, current_end
+        current_start, current_end = start, end
+
+    if current_start is not None:
+        yield current_start, current_end
+
+
+def iterate_free_intervals(busy: Iterable[Interval], time_from: datetime, time_to: datetime) -> Iterator[Interval]:
+    """Yields gaps between merged busy intervals inside [time_from, time_to]."""
+    cursor = time_from
+
+    for start, end in busy:
+        if start >= time_to:
+            break
+
+        if start > cursor:
+            yield cursor, start
+
+        cursor = max(cursor, end)
+
+    if cursor < time_to:
+        yield cursor, time_to
+
+
+def find_free_slot(
+        streams: Iterable[Iterable[Interval]],
+        duration: timedelta,
+        time_from: datetime,
+        time_to: datetime,
+) -> Optional[Interval]:
+    """Returns first slot of given duration free in every stream, or None if there is no such slot."""
+    busy = merge_busy_intervals(streams)
+
+    for start, end in iterate_free_intervals(busy, time_from, time_to):
+        if end - start >= duration:
+            return start, start + duration
+
+    return None
+
+
+def align_to_granularity(moment: datetime, granularity: timedelta) -> datetime:
+    """Rounds moment up to the nearest multiple of granularity counted from the start of its day."""
+    day_start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    steps = -((day_start - moment) // granularity)
+    return day_start + steps * granularity
+
+
+def find_free_slots(
+        streams: Iterable[Iterable[Interval]],
+        duration: timedelta,
+        time_from: datetime,
+        time_to: datetime,
+        count: int,
+        granularity: Optional[timedelta] = None,
+) -> list[Interval]:
+    """Returns up to count first free slots of given duration.
+
+    Without granularity every gap gives one slot starting at the gap start,
+    with granularity every aligned start inside a gap is a candidate.
+    """
+    result: list[Interval] = []
+    if count <= 0:
+        return result
+
+    busy = merge_busy_intervals(streams)
+    for start, end in iterate_free_intervals(busy, time_from, time_to):
+        if granularity is not None:
+            start = align_to_granularity(start, granularity)
+
+        while start + duration <= end:
+            result.append((start, start + duration))
+            if len(result) >= count:
+                return result
+
+            if granularity is None:
+                break
+
+            start += granularity
+
+    return result
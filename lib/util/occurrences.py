@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+import numpy as np
+
+from lib.models.events import ERepeatType, Repetition
+from lib.util import date
+from lib.util.repetitions import get_week_days, get_occurrence_index
+
+DATETIME_DTYPE = 'datetime64[us]'
+_ONE_DAY = np.timedelta64(1, 'D')
+_EPOCH_MONTH = np.datetime64('1970-01', 'M')
+_EPOCH_WEEKDAY = 3  # 1970-01-01 is thursday
+_ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def _weekday(days: np.ndarray) -> np.ndarray:
+    return (days.astype('int64') + _EPOCH_WEEKDAY) % 7
+
+
+def _time_of_day(moment: datetime) -> np.timedelta64:
+    return np.timedelta64(moment - moment.replace(hour=0, minute=0, second=0, microsecond=0), 'us')
+
+
+def _month_starts(event_start_date: datetime, month_offsets: np.ndarray) -> np.ndarray:
+    base_month = (event_start_date.year - 1970) * 12 + event_start_date.month - 1
+    return _EPOCH_MONTH + (base_month + month_offsets)
+
+
+def _days_in_month(months: np.ndarray) -> np.ndarray:
+    return ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype('int64')
+
+
+def _month_days(months: np.ndarray, days: np.ndarray) -> np.ndarray:
+    return months.astype('datetime64[D]') + (days - 1) * _ONE_DAY
+
+
+def _occurrence_days(repetition: Repetition, event_start_date: datetime, indexes: np.ndarray) -> np.ndarray:
+    """Vectorized version of lib.util.repetitions.get_occurrence, returns only dates (datetime64[D])"""
+    each = 1 if repetition.type == ERepeatType.workday else repetition.each or 1
+    event_day = np.datetime64(event_start_date.date(), 'D')
+
+    week_days = get_week_days(repetition)
+    if week_days is not None:
+        periods, day_indexes = np.divmod(indexes, len(week_days))
+        week_start = event_day - event_start_date.weekday() * _ONE_DAY
+        return week_start + (periods * each * 7 + np.asarray(week_days)[day_indexes]) * _ONE_DAY
+
+    if repetition.type == ERepeatType.daily:
+        return event_day + indexes * each * _ONE_DAY
+
+    elif repetition.type == ERepeatType.weakly:
+        return event_day + indexes * each * 7 * _ONE_DAY
+
+    elif repetition.type in (ERepeatType.monthly_number, ERepeatType.yearly):
+        step = each if repetition.type == ERepeatType.monthly_number else 12 * each
+        months = _month_starts(event_start_date, indexes * step)
+        return _month_days(months, np.minimum(event_start_date.day, _days_in_month(months)))
+
+    elif repetition.type == ERepeatType.monthly_day_weekno:
+        months = _month_starts(event_start_date, indexes * each)
+        event_weekday = event_start_date.weekday()
+
+        if repetition.monthly_last_week:
+            last_days = (months + 1).astype('datetime64[D]') - _ONE_DAY
+            result = last_days - ((_weekday(last_days) - event_weekday) % 7) * _ONE_DAY
+        else:
+            first_weekday = _weekday(months.astype('datetime64[D]'))
+            first_week_no = np.where(event_weekday >= first_weekday, 1, 2)
+            week_no = date.week_of_month(event_start_date)
+
+            days = 1 + (event_weekday - first_weekday) % 7 + 7 * np.maximum(0, week_no - first_week_no)
+            days_in_month = _days_in_month(months)
+            days -= 7 * -(-np.maximum(0, days - days_in_month) // 7)
+            result = _month_days(months, days)
+
+        # occurrence with index 0 is the event itself
+        return np.where(indexes == 0, event_day, result)
+
+    raise ValueError('Unknown repetition type')
+
+
+def expand_repetitions(
+    events: Iterable[tuple[datetime, datetime, Optional[Repetition]]],
+    time_from: datetime,
+    time_to: datetime,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Expands many (start, end, repetition) rows into occurrences overlapping [time_from, time_to).
+
+    Returns arrays of starts and ends (datetime64[us]) sorted by start,
+    the event itself is returned as well as its repeats if it overlaps the interval.
+    """
+    starts: list[np.ndarray] = []
+    durations: list[np.ndarray] = []
+
+    for start_time, end_time, repetition in events:
+        duration = end_time - start_time
+
+        if start_time < time_to and end_time > time_from:
+            starts.append(np.array([start_time], dtype=DATETIME_DTYPE))
+            durations.append(np.array([duration], dtype='timedelta64[us]'))
+
+        if repetition is None:
+            continue
+
+        # repeat overlaps interval if it starts after (time_from - duration) and before time_to,
+        # the event itself is already added above, so repeats should start after it
+        first_index = get_occurrence_index(
+            repetition, start_time, max(start_time, time_from - duration) + _ONE_MICROSECOND
+        )
+        last_index = get_occurrence_index(repetition, start_time, max(start_time, time_to))
+        if repetition.due_date is not None:
+            last_index = min(
+                last_index,
+                get_occurrence_index(repetition, start_time, repetition.due_date + _ONE_MICROSECOND)
+            )
+
+        if last_index <= first_index:
+            continue
+
+        indexes = np.arange(first_index, last_index, dtype='int64')
+        occurrences = (
+            _occurrence_days(repetition, start_time, indexes).astype(DATETIME_DTYPE) + _time_of_day(start_time)
+        )
+
+        starts.append(occurrences)
+        durations.append(np.full(len(occurrences), np.timedelta64(duration, 'us')))
+
+    if not starts:
+        return np.array([], dtype=DATETIME_DTYPE), np.array([], dtype=DATETIME_DTYPE)
+
+    result_starts = np.concatenate(starts)
+    result_ends = result_starts + np.concatenate(durations)
+
+    order = np.argsort(result_starts, kind='stable')
+    return result_starts[order], result_ends[order]
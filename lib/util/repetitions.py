@@ -1,6 +1,6 @@
+import calendar
 from datetime import datetime, timedelta
-from typing import Optional
-from lib.models.common import EDay
+from typing import Optional, Iterator
 
 from dateutil._common import weekday
 from dateutil.relativedelta import relativedelta
@@ -8,166 +8,191 @@ from dateutil.relativedelta import relativedelta
 from lib.models.events import ERepeatType, Repetition
 from lib.util import date
 
+WORKDAYS = (0, 1, 2, 3, 4)
 
-def create_weekly_increment(each: int):
 
-    def increment(d: datetime):
-        if d.weekday() == 6 and each > 1:
-            return d + timedelta(weeks=each) - timedelta(days=6)
-        else:
-            return d + timedelta(days=1)
+def get_week_days(repetition: Repetition) -> Optional[tuple[int, ...]]:
+    """Returns sorted weekdays for repetitions that repeat on exact days of week, otherwise None."""
+    if repetition.type == ERepeatType.workday:
+        return WORKDAYS
 
-    return increment
+    if repetition.type == ERepeatType.weakly and repetition.weekly_days:
+        return tuple(sorted({day.weekday() for day in repetition.weekly_days}))
 
+    return None
 
-def set_start_date_due_to_interval(
-    repetition: Repetition,
-    event_start_date: datetime,
-    repeat_start_date: datetime,
-    repeat_end_date: datetime,
-) -> Optional[datetime]:
-    start_date = event_start_date
 
-    if event_start_date > repeat_end_date or event_start_date > repetition.due_date:
-        return None
+def _get_each(repetition: Repetition) -> int:
+    if repetition.type == ERepeatType.workday:
+        return 1
+    return repetition.each or 1
 
-    if event_start_date >= repeat_start_date:
-        return start_date
 
-    if repetition.type == ERepeatType.daily:
-        if event_start_date + timedelta(days=repetition.each) > repeat_end_date:
-            return None
+def _month_exact_week_day(event_start_date: datetime, year: int, month: int, week_no: int) -> datetime:
+    """Return day of the same weekday as event start in {week_no} week of month (or the last one in month)."""
+    first_day = event_start_date.replace(year=year, month=month, day=1)
+    offset = (event_start_date.weekday() - first_day.weekday()) % 7
+    first_week_no = 1 if event_start_date.weekday() >= first_day.weekday() else 2
 
-        start_at_repeat_count = abs((repeat_start_date - event_start_date).days) // repetition.each
-        result = start_date + timedelta(days=start_at_repeat_count * repetition.each)
-        while result < repeat_start_date:
-            result += timedelta(days=repetition.each)
+    day = 1 + offset + 7 * max(0, week_no - first_week_no)
+    days_in_month = calendar.monthrange(year, month)[1]
+    while day > days_in_month:
+        day -= 7
 
-        return result if result <= repeat_end_date else None
+    return first_day.replace(day=day)
 
-    elif repetition.type == ERepeatType.weakly:
-        if repetition.weekly_days:
-            result = event_start_date + timedelta(weeks=repetition.each - 1, days=1)
-            inc = create_weekly_increment(repetition.each)
-            while result < repeat_start_date or EDay.from_datetime(result) not in repetition.weekly_days:
-                result = inc(result)
 
-            return result if result <= repeat_end_date else None
-        else:
-            result = event_start_date + timedelta(weeks=relativedelta(repeat_start_date, event_start_date).weeks - 1)
-            # result = event_start_date + timedelta(weeks=repetition.each)
-            while result < repeat_start_date:
-                result += timedelta(weeks=repetition.each)
+def get_occurrence(repetition: Repetition, event_start_date: datetime, index: int) -> datetime:
+    """Returns occurrence with given index, does not take due date into account.
 
-            return result if result <= repeat_end_date else None
+    For repetitions on exact days of week occurrences are counted from monday
+    of the event week (so first of them may be earlier than event start),
+    for other types occurrence with index 0 is the event itself.
+    """
+    each = _get_each(repetition)
 
-    elif repetition.type == ERepeatType.monthly_number:
-        skip_periods = relativedelta(repeat_start_date, event_start_date).months // repetition.each
-        result = event_start_date + relativedelta(months=skip_periods * repetition.each)
-        while result < repeat_start_date:
-            result += relativedelta(months=+repetition.each)
+    week_days = get_week_days(repetition)
+    if week_days is not None:
+        period, day_index = divmod(index, len(week_days))
+        week_start = event_start_date - timedelta(days=event_start_date.weekday())
+        return week_start + timedelta(weeks=period * each, days=week_days[day_index])
+
+    if index == 0:
+        return event_start_date
 
-        return result if result <= repeat_end_date else None
+    if repetition.type == ERepeatType.daily:
+        return event_start_date + timedelta(days=index * each)
+
+    elif repetition.type == ERepeatType.weakly:
+        return event_start_date + timedelta(weeks=index * each)
+
+    elif repetition.type == ERepeatType.monthly_number:
+        return event_start_date + relativedelta(months=index * each)
 
     elif repetition.type == ERepeatType.monthly_day_weekno:
         if repetition.monthly_last_week:
-            skip_periods = relativedelta(repeat_start_date, event_start_date).months // repetition.each
-            result = event_start_date + relativedelta(months=repetition.each * skip_periods, day=31, weekday=weekday(start_date.weekday())(-1))
-            if result > repeat_end_date:
-                return None
+            return event_start_date + relativedelta(
+                months=index * each, day=31, weekday=weekday(event_start_date.weekday())(-1)
+            )
+
+        year, month = divmod(event_start_date.month - 1 + index * each, 12)
+        return _month_exact_week_day(
+            event_start_date, event_start_date.year + year, month + 1, date.week_of_month(event_start_date)
+        )
+
+    elif repetition.type == ERepeatType.yearly:
+        return event_start_date + relativedelta(years=index * each)
+
+    raise ValueError('Unknown repetition type')
+
 
-            while result < event_start_date:
-                result += relativedelta(months=repetition.each, day=31, weekday=weekday(start_date.weekday())(-1))
+def get_occurrence_index(repetition: Repetition, event_start_date: datetime, moment: datetime) -> int:
+    """Returns index of the first occurrence at or after moment in constant time."""
+    if moment <= get_occurrence(repetition, event_start_date, 0):
+        return 0
 
-            return result if result <= repeat_end_date else None
-        else:
-            week_no = date.week_of_month(start_date)
+    each = _get_each(repetition)
 
-            skip_periods = relativedelta(repeat_start_date, event_start_date).months // repetition.each
-            result = date.get_next_month_exact_week_day(start_date, week_no, repetition.each * skip_periods)
-            if result > repeat_end_date:
-                return None
+    week_days = get_week_days(repetition)
+    if week_days is not None:
+        event_week_start = event_start_date.date() - timedelta(days=event_start_date.weekday())
+        moment_week_start = moment.date() - timedelta(days=moment.weekday())
+        weeks = (moment_week_start - event_week_start).days // 7
 
-            while result < event_start_date:
-                result = date.get_next_month_exact_week_day(result, week_no, repetition.each)
+        period = -(-weeks // each)
+        if period * each == weeks:
+            for day_index in range(len(week_days)):
+                index = period * len(week_days) + day_index
+                if get_occurrence(repetition, event_start_date, index) >= moment:
+                    return index
+            period += 1
 
-            return result if result <= repeat_end_date else None
+        return period * len(week_days)
+
+    if repetition.type == ERepeatType.daily:
+        step = timedelta(days=each)
+        return -((event_start_date - moment) // step)
+
+    elif repetition.type == ERepeatType.weakly:
+        step = timedelta(weeks=each)
+        return -((event_start_date - moment) // step)
+
+    elif repetition.type in (ERepeatType.monthly_number, ERepeatType.monthly_day_weekno):
+        months = (moment.year - event_start_date.year) * 12 + moment.month - event_start_date.month
+        index = max(0, months // each)
 
     elif repetition.type == ERepeatType.yearly:
-        skip_periods = (relativedelta(repeat_start_date, event_start_date).years - 1) // repetition.each
-        result = event_start_date + relativedelta(years=repetition.each * skip_periods)
-        if result > repeat_end_date:
-            return None
+        index = max(0, (moment.year - event_start_date.year) // each)
+
+    else:
+        raise ValueError('Unknown repetition type')
+
+    # found index points to the period of moment (or earlier), so next period is always after it
+    while get_occurrence(repetition, event_start_date, index) < moment:
+        index += 1
 
-        while result < repeat_start_date:
-            result += relativedelta(years=+repetition.each)
+    return index
 
-        return result if result <= repeat_end_date else None
 
-    elif repetition.type == ERepeatType.workday:
-        result = repeat_start_date
-        while result.weekday() not in (0, 1, 2, 3, 4):
-            result += timedelta(days=1)
+def seek_occurrence(
+    repetition: Repetition,
+    event_start_date: datetime,
+    moment: datetime,
+    k: int = 0,
+) -> Optional[datetime]:
+    """Returns k-th occurrence at or after moment (and not earlier than event start) or None after due date."""
+    index = get_occurrence_index(repetition, event_start_date, max(moment, event_start_date)) + k
+    result = get_occurrence(repetition, event_start_date, index)
+
+    if repetition.due_date is not None and result > repetition.due_date:
+        return None
 
-        return result if result <= repeat_end_date else None
+    return result
 
 
-def iterate_repetitions(
+def iterate_occurrences(
     repetition: Repetition,
     event_start_date: datetime,
     repeat_start_date: datetime,
     repeat_end_date: datetime,
-) -> datetime:
-    should_create = lambda d: True
-    start_date = set_start_date_due_to_interval(
-        repetition,
-        event_start_date,
-        repeat_start_date,
-        repeat_end_date
-    )
+) -> Iterator[datetime]:
+    """Yields occurrences from interval [repeat_start_date, repeat_end_date] not earlier than event start."""
+    if repetition.due_date is not None:
+        repeat_end_date = min(repeat_end_date, repetition.due_date)
 
-    if start_date is None:
-        return
+    index = get_occurrence_index(repetition, event_start_date, max(repeat_start_date, event_start_date))
+    result = get_occurrence(repetition, event_start_date, index)
+    while result <= repeat_end_date:
+        yield result
 
-    if start_date > event_start_date:
-        yield start_date
+        index += 1
+        result = get_occurrence(repetition, event_start_date, index)
 
-    if start_date > repetition.due_date:
-        return
 
-    if repetition.type == ERepeatType.daily:
-        increment = lambda d: d + timedelta(days=repetition.each)
-    elif repetition.type == ERepeatType.weakly:
-        if repetition.weekly_days:
-            increment = create_weekly_increment(repetition.each)
-            should_create = lambda d: EDay.from_datetime(d) in repetition.weekly_days
-        else:
-            increment = lambda d: d + timedelta(weeks=repetition.each)
-    elif repetition.type == ERepeatType.monthly_number:
-        increment = lambda d: d + relativedelta(months=+repetition.each)
-    elif repetition.type == ERepeatType.monthly_day_weekno:
-        if repetition.monthly_last_week:
-            increment = lambda d: d + relativedelta(months=repetition.each, day=31, weekday=weekday(event_start_date.weekday())(-1))
-        else:
-            week_no = date.week_of_month(event_start_date)
-            increment = lambda d: date.get_next_month_exact_week_day(d, week_no, repetition.each)
-    elif repetition.type == ERepeatType.yearly:
-        increment = lambda d: d + relativedelta(years=+repetition.each)
-    elif repetition.type == ERepeatType.workday:
-        increment = lambda d: d + relativedelta(days=1)
-        should_create = lambda d: d.weekday() in range(5)
-    else:
-        raise ValueError('Unknown repetition type')
+def set_start_date_due_to_interval(
+    repetition: Repetition,
+    event_start_date: datetime,
+    repeat_start_date: datetime,
+    repeat_end_date: datetime,
+) -> Optional[datetime]:
+    """Returns first date of event (the event itself or its repeat) in interval [repeat_start_date, repeat_end_date]"""
+    if event_start_date >= repeat_start_date:
+        return event_start_date if event_start_date <= repeat_end_date else None
 
-    next_date = increment(start_date)
-    while next_date <= repeat_end_date:
-        if next_date < repeat_start_date:
-            continue
+    result = seek_occurrence(repetition, event_start_date, repeat_start_date)
+    if result is None or result > repeat_end_date:
+        return None
 
-        if not should_create(next_date):
-            next_date = increment(next_date)
-            continue
+    return result
 
-        yield next_date
 
-        next_date = increment(next_date)
+def iterate_repetitions(
+    repetition: Repetition,
+    event_start_date: datetime,
+    repeat_start_date: datetime,
+    repeat_end_date: datetime,
+) -> Iterator[datetime]:
+    """Yields repeats of event (without the event itself) in interval [repeat_start_date, repeat_end_date]"""
+    for result in iterate_occurrences(repetition, event_start_date, repeat_start_date, repeat_end_date):
+        if result > event_start_date:
+            yield result
@@ -1,18 +1,25 @@
 import argparse
+import asyncio
 import logging.config
+from logging import getLogger
 
 import uvicorn
 import uvloop
 from fastapi import FastAPI
 
-from lib.api import auth, events, funcs, users
+from lib.api import auth, consistency, events, funcs, metrics, shedding, users
 from lib.config import parse_config
 from lib.db import Database
+from lib.db.breaker import PoolUnavailableError
 from lib.modules.notificator import Notificator  # noqa
 from lib.modules.auth import Auth  # noqa
-from lib.sql import create_tables
+from lib.modules.occurrences import OccurrenceMaterializer  # noqa
+from lib.modules.user_cache import UserCache  # noqa
+from lib.sql import migrate
 from lib.util.module import get_all_module_classes
 
+logger = getLogger('main')
+
 uvloop.install()
 
 app = FastAPI(title='Calendar')
@@ -21,6 +28,10 @@ app.include_router(events.router)
 app.include_router(funcs.router)
 app.include_router(users.router)
 app.include_router(auth.router)
+app.include_router(metrics.router)
+
+app.middleware('http')(consistency.read_your_writes)
+app.exception_handler(PoolUnavailableError)(shedding.pool_unavailable)
 
 
 @app.on_event("shutdown")
@@ -44,9 +55,26 @@ async def on_start():
             module(None)
 
     async with Database().connect() as connection:
-        await create_tables(connection)
+        await migrate(connection)
 
     Notificator().start()
+    Auth().start()
+    OccurrenceMaterializer().start()
+
+
+async def run_migrations(config_filename: str):
+    config = parse_config(config_filename)
+
+    logging.config.dictConfig(config['logging'])
+
+    database = Database(config['database'])
+    try:
+        async with database.connect() as connection:
+            version = await migrate(connection)
+    finally:
+        await database.close()
+
+    logger.info(f'schema version: {version}')
 
 
 if __name__ == '__main__':
@@ -56,7 +84,12 @@ if __name__ == '__main__':
     parser.add_argument('--reload', '-r', action='store_true', default=False)
 
     parser.add_argument('--config', '-c', type=str, help='Path to configuration yaml file')
+    parser.add_argument('--migrate', action='store_true', default=False, help='Apply database migrations and exit')
     args = parser.parse_args()
 
+    if args.migrate:
+        asyncio.run(run_migrations(args.config or 'config.yaml'))
+        exit(0)
+
     # TODO: set uvicorn server log config from file
     uvicorn.run('main:app', host=args.host, port=args.port, reload=True, loop="uvloop")
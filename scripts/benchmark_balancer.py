@@ -0,0 +1,114 @@
+"""
+Compares balancer policies on simulated replicas with different round trip times
+
+Every pool has a limited number of connections, a request takes a free connection (or waits for it)
+and holds it for several round trips with jitter. Round trip times are measured with the same Stopwatch as in PoolManager.
+
+Usage: PYTHONPATH=. python scripts/benchmark_balancer.py [--requests 5000] [--concurrency 40]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections import Counter
+
+from lib.db.balancer_policy import BALANCER_POLICIES, BalancerPolicy
+from lib.db.utils import Stopwatch
+
+# round trip times of replicas in different availability zones, seconds
+DEFAULT_RTTS = (0.001, 0.003, 0.01)
+DEFAULT_POOL_SIZE = 10
+ROUND_TRIPS_PER_REQUEST = 3
+
+
+class SimulatedPool:
+    def __init__(self, name: str, rtt: float, size: int):
+        self.name = name
+        self.rtt = rtt
+        self.free = asyncio.Semaphore(size)
+
+    async def query(self, stopwatch: Stopwatch):
+        async with self.free:
+            # like periodic pool check, only server response time is measured, not waiting for connection
+            with stopwatch(self):
+                await asyncio.sleep(self.rtt * random.uniform(0.8, 1.2))
+            for _ in range(ROUND_TRIPS_PER_REQUEST - 1):
+                await asyncio.sleep(self.rtt * random.uniform(0.8, 1.2))
+
+
+class SimulatedPoolManager:
+    """Implements part of PoolManager used by balancer policies"""
+    def __init__(self, pools: list[SimulatedPool]):
+        self.pools = pools
+        self.stopwatch = Stopwatch(window_size=128)
+
+    @property
+    def master_pool_count(self):
+        return 0
+
+    async def get_master_pools(self):
+        return []
+
+    async def get_replica_pools(self, fallback_master: bool = False):
+        return list(self.pools)
+
+    # noinspection PyProtectedMember
+    def get_pool_freesize(self, pool: SimulatedPool):
+        return pool.free._value
+
+    def get_last_response_time(self, pool: SimulatedPool):
+        return self.stopwatch.get_time(pool)
+
+
+async def run(policy_cls: type[BalancerPolicy], rtts: tuple[float, ...], requests: int, concurrency: int):
+    manager = SimulatedPoolManager([
+        SimulatedPool(f'replica-{index}', rtt, DEFAULT_POOL_SIZE)
+        for index, rtt in enumerate(rtts)
+    ])
+    policy = policy_cls(manager)
+    latencies = []
+    used = Counter()
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            started_at = time.monotonic()
+            pool = await policy.get_pool(read_only=True)
+            used[pool.name] += 1
+            await pool.query(manager.stopwatch)
+            latencies.append(time.monotonic() - started_at)
+
+    started_at = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.monotonic() - started_at
+
+    latencies.sort()
+    return {
+        'rps': requests / elapsed,
+        'mean': statistics.mean(latencies),
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[int(len(latencies) * 0.99)],
+        'used': used,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=40)
+    parser.add_argument('--rtt', type=float, nargs='+', default=DEFAULT_RTTS, help='round trip times in seconds')
+    args = parser.parse_args()
+
+    print(f'{"policy":<15}{"rps":>10}{"mean ms":>10}{"p50 ms":>10}{"p99 ms":>10}  requests per pool')
+    for name, policy_cls in BALANCER_POLICIES.items():
+        result = await run(policy_cls, tuple(args.rtt), args.requests, args.concurrency)
+        used = ', '.join(f'{pool}: {count}' for pool, count in sorted(result['used'].items()))
+        print(
+            f'{name:<15}{result["rps"]:>10.0f}{result["mean"] * 1000:>10.2f}'
+            f'{result["p50"] * 1000:>10.2f}{result["p99"] * 1000:>10.2f}  {used}'
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
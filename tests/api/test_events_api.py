@@ -1,7 +1,8 @@
 import pytest
+from fastapi import HTTPException
 from tests.full_wait import full_wait_pending
 
-from lib.api.events import create_event, accept_event_by_user
+from lib.api.events import create_event, create_many_events, accept_event_by_user
 from lib.api.users import create_user
 from lib.models.events import RCreateEvent, Repetition, ERepeatType, EDecision, Participant, Notification, EChannel
 from lib.models.common import EDay
@@ -236,3 +237,47 @@ async def test_complex_notifications(db):
                 assert r.next_notify_at == event_start_time - timedelta(days=30)
             elif r.channel == EChannel.sms:
                 assert r.next_notify_at == event_start_time - timedelta(hours=1)
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_create_many_events(db):
+    await create_user(TEST_USER)
+    await create_user(TEST_USER_TWO)
+
+    now = datetime.now()
+    requests = [
+        RCreateEvent(
+            author_login=TEST_USER.login,
+            start_time=now + timedelta(days=i + 1),
+            end_time=now + timedelta(days=i + 1, hours=1),
+            name=f'event {i}',
+            participants=[Participant(user=User(login=TEST_USER_TWO.login, name=TEST_USER_TWO.name.copy()))],
+            notifications=[Notification(channel=EChannel.email, offset='30m')],
+            repetition=Repetition(type=ERepeatType.daily) if i % 2 else None,
+        )
+        for i in range(10)
+    ]
+
+    events = await create_many_events(requests)
+    assert [event.name for event in events] == [request.name for request in requests]
+    assert len({event.id for event in events}) == 10
+
+    async with db.connect(read_only=True) as connection:
+        from_db = await get_one_event(connection, events[3].id)
+        notifications_count = await connection.fetchval(f'SELECT count(*) FROM {NOTIFICATION_TABLE}')
+
+    assert from_db.name == 'event 3'
+    assert from_db.author == events[3].author
+    assert len(from_db.participants) == 1
+    assert notifications_count == 20
+
+    # nothing is created if any event is invalid
+    with pytest.raises(HTTPException):
+        await create_many_events([
+            requests[0],
+            RCreateEvent(author_login='unknown', start_time=now, end_time=now + timedelta(hours=1)),
+        ])
+
+    async with db.connect(read_only=True) as connection:
+        assert await connection.fetchval(f'SELECT count(*) FROM {EVENTS_TABLE}') == 10
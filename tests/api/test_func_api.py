@@ -3,10 +3,10 @@ from tests.full_wait import full_wait_pending
 
 from lib.models.users import UserFull, Name
 from lib.api.users import create_user
-from lib.api.events import create_event
-from lib.api.funcs import calculate_free_slot
-from lib.models.funcs import RCalcFreeTime
-from lib.models.events import RCreateEvent
+from lib.api.events import create_event, accept_event_by_user
+from lib.api.funcs import calculate_free_slot, calculate_free_slots
+from lib.models.funcs import RCalcFreeTime, RCalcFreeSlots
+from lib.models.events import RCreateEvent, Repetition, ERepeatType, Participant, EDecision
 from datetime import datetime, timedelta
 
 USER_ONE = UserFull(login='one', name=Name(first='one', last='one'))
@@ -70,3 +70,74 @@ async def test_calc_users_free_time(db):
     result = await calculate_free_slot(request)
     assert result.start == datetime(2022, 6, 26, 14)
     assert result.end == datetime(2022, 6, 26, 15)
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_calc_users_free_slots(db):
+    await create_user(USER_ONE)
+    await create_user(USER_TWO)
+    await create_user(USER_THREE)
+
+    for login, times in EVENTS:
+        for start_time, duration in times:
+            await create_event(RCreateEvent(
+                author_login=login,
+                start_time=start_time,
+                end_time=start_time + duration,
+                name=f'{login} Встречка',
+                description='Я занят, не звонить!',
+            ))
+
+    request = RCalcFreeSlots(
+        event_duration=timedelta(minutes=30),
+        user_logins={USER_ONE.login, USER_TWO.login, USER_THREE.login},
+        start_calc_from=datetime(2022, 6, 26, 16),
+        count=2,
+    )
+
+    result = await calculate_free_slots(request)
+    assert [(slot.start, slot.end) for slot in result] == [
+        (datetime(2022, 6, 26, 23, 30), datetime(2022, 6, 27, 0)),
+        (datetime(2022, 6, 27, 6, 30), datetime(2022, 6, 27, 7)),
+    ]
+
+    request.granularity = timedelta(minutes=20)
+    request.search_until = datetime(2022, 6, 27, 1)
+    result = await calculate_free_slots(request)
+    assert [(slot.start, slot.end) for slot in result] == [
+        (datetime(2022, 6, 26, 23, 40), datetime(2022, 6, 27, 0, 10)),
+        (datetime(2022, 6, 27, 0), datetime(2022, 6, 27, 0, 30)),
+    ]
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_calc_free_time_skips_declined_and_expands_repeats(db):
+    await create_user(USER_ONE)
+    await create_user(USER_TWO)
+
+    declined = await create_event(RCreateEvent(
+        author_login=USER_ONE.login,
+        start_time=datetime(2022, 6, 26, 10),
+        end_time=datetime(2022, 6, 26, 12),
+        participants=[Participant(user=USER_TWO, decision=EDecision.undecided)],
+    ))
+    await accept_event_by_user(declined.id, USER_TWO.login, EDecision.no)
+
+    await create_event(RCreateEvent(
+        author_login=USER_TWO.login,
+        start_time=datetime(2022, 6, 20, 12),
+        end_time=datetime(2022, 6, 20, 13),
+        repetition=Repetition(type=ERepeatType.daily),
+    ))
+
+    request = RCalcFreeTime(
+        event_duration=timedelta(hours=1, minutes=30),
+        user_logins={USER_TWO.login},
+        start_calc_from=datetime(2022, 6, 26, 11),
+    )
+
+    result = await calculate_free_slot(request)
+    assert result.start == datetime(2022, 6, 26, 13)
+    assert result.end == datetime(2022, 6, 26, 14, 30)
@@ -0,0 +1,17 @@
+import json
+
+import pytest
+
+from lib.api.shedding import pool_unavailable
+from lib.db.breaker import PoolUnavailableError
+from tests.full_wait import full_wait_pending
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_pool_unavailable_is_503_with_retry_after():
+    response = await pool_unavailable(None, PoolUnavailableError('No available master pool', retry_after=2.5))
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '3'
+    assert json.loads(response.body) == {'detail': 'No available master pool'}
@@ -2,12 +2,14 @@ import datetime
 
 import pytest
 from fastapi import HTTPException
-from lib.api.users import create_user, get_user_events
+from lib.api.users import create_user, get_user_events, get_users_events
 from lib.api.events import create_event
 from lib.models.users import UserFull, Name
 from lib.models.events import RCreateEvent, Repetition, Participant, ERepeatType
 from lib.models.common import EDay
+from lib.modules.occurrences import OccurrenceMaterializer
 from lib.sql.const import USERS_TABLE
+from lib.sql.event import iterate_many_users_events
 from tests.full_wait import full_wait_pending
 from dateutil.relativedelta import relativedelta
 from datetime import datetime, timedelta
@@ -223,3 +225,144 @@ async def test_get_user_events_yearly(db):
     events = await get_user_events(TEST_USER.login, datetime(2022, 7, 27), datetime(2030, 7, 27))
     assert len(events) == 3
     assert events[0].start_time == datetime(2024, 6, 26, 15)
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_get_user_events_materialized(db):
+    await create_user(TEST_USER)
+
+    materializer = OccurrenceMaterializer({'enabled': True, 'horizon_days': 30, 'refresh_interval': 60})
+
+    event = SIMPLE_EVENT_REQ.copy(deep=True)
+    event.repetition = Repetition(
+        type=ERepeatType.weakly,
+        each=2,
+        weekly_days=[EDay.wed, EDay.sun],
+    )
+    await create_event(event)
+
+    events = await get_user_events(TEST_USER.login, datetime(2022, 6, 20), datetime(2022, 7, 12))
+    assert [e.start_time for e in events] == [
+        datetime(2022, 6, 26, 15), datetime(2022, 7, 6, 15), datetime(2022, 7, 10, 15)
+    ]
+
+    # horizon is not reached yet, but is extended by the background module
+    far_from = datetime.now() + timedelta(days=60)
+    expected = await get_user_events(TEST_USER.login, far_from, far_from + timedelta(weeks=4))
+    assert expected
+
+    materializer.horizon_days = 90
+    async with db.connect() as connection:
+        assert await materializer.run_once(connection) == 1
+        assert await materializer.run_once(connection) == 0
+
+    events = await get_user_events(TEST_USER.login, far_from, far_from + timedelta(weeks=4))
+    assert [(e.start_time, e.end_time) for e in events] == [(e.start_time, e.end_time) for e in expected]
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_iterate_user_events(db):
+    await create_user(TEST_USER)
+
+    daily = SIMPLE_EVENT_REQ.copy(deep=True)
+    daily.repetition = Repetition(type=ERepeatType.daily)
+    await create_event(daily)
+
+    weekly = SIMPLE_EVENT_REQ.copy(deep=True)
+    weekly.start_time, weekly.end_time = datetime(2022, 6, 27, 9), datetime(2022, 6, 27, 10)
+    weekly.repetition = Repetition(type=ERepeatType.weakly, weekly_days=[EDay.mon, EDay.fri])
+    await create_event(weekly)
+
+    await create_event(SIMPLE_EVENT_REQ.copy(deep=True))
+
+    time_from, time_to = datetime(2022, 6, 20), datetime(2022, 9, 1)
+    events = await get_user_events(TEST_USER.login, time_from, time_to)
+
+    async with db.connect(read_only=True) as connection:
+        streamed = [
+            event async for event in iterate_many_users_events(
+                connection, {TEST_USER.login}, time_from, time_to, chunk_size=1
+            )
+        ]
+
+    assert [(e.id, e.start_time) for e in streamed] == [(e.id, e.start_time) for e in events]
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_get_user_events_pages(db):
+    await create_user(TEST_USER)
+
+    daily = SIMPLE_EVENT_REQ.copy(deep=True)
+    daily.repetition = Repetition(type=ERepeatType.daily)
+    await create_event(daily)
+    await create_event(SIMPLE_EVENT_REQ.copy(deep=True))
+
+    time_from, time_to = datetime(2022, 6, 20), datetime(2022, 7, 20)
+    events = await get_user_events(TEST_USER.login, time_from, time_to)
+
+    paged = []
+    cursor = None
+    while True:
+        page = await get_user_events(TEST_USER.login, time_from, time_to, limit=7, cursor=cursor)
+        assert len(page.events) <= 7
+        paged.extend(page.events)
+
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+
+    assert [(e.id, e.start_time) for e in paged] == [(e.id, e.start_time) for e in events]
+
+    with pytest.raises(HTTPException):
+        await get_user_events(TEST_USER.login, time_from, time_to, cursor='not a cursor')
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_get_events_of_reversed_interval(db):
+    await create_user(TEST_USER)
+    await create_event(SIMPLE_EVENT_REQ.copy(deep=True))
+
+    time_from, time_to = SIMPLE_EVENT_REQ.end_time, SIMPLE_EVENT_REQ.start_time
+    with pytest.raises(HTTPException) as error:
+        await get_user_events(TEST_USER.login, time_from, time_to)
+    assert error.value.status_code == 400
+
+    with pytest.raises(HTTPException) as error:
+        await get_users_events(time_from, time_to, logins=[TEST_USER.login])
+    assert error.value.status_code == 400
+
+    assert await get_user_events(TEST_USER.login, time_from, time_from) == []
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_get_users_events(db):
+    await create_user(TEST_USER)
+    await create_user(OTHER_USER)
+
+    await create_event(SIMPLE_EVENT_REQ.copy(deep=True))
+
+    shared = SIMPLE_EVENT_REQ.copy(deep=True)
+    shared.participants.append(Participant(user=OTHER_USER))
+    shared.repetition = Repetition(type=ERepeatType.daily, due_date=datetime(2022, 6, 28, 16))
+    await create_event(shared)
+
+    result = await get_users_events(
+        SIMPLE_EVENT_REQ.start_time - timedelta(days=1),
+        SIMPLE_EVENT_REQ.end_time + timedelta(days=5),
+        logins=[TEST_USER.login, OTHER_USER.login, 'unknown'],
+    )
+
+    # shared event 26.6, 27.6 and 28.6 is returned once for both users
+    assert len(result.events) == 4
+    assert len(result.users[TEST_USER.login]) == 4
+    assert len(result.users[OTHER_USER.login]) == 3
+    assert result.users['unknown'] == []
+    assert all(len(result.events[i].participants) == 1 for i in result.users[OTHER_USER.login])
+
+    with pytest.raises(HTTPException):
+        await get_users_events(SIMPLE_EVENT_REQ.start_time, SIMPLE_EVENT_REQ.end_time, logins=[])
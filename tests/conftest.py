@@ -4,7 +4,15 @@ import pytest
 
 from lib.util.module import SingletonModule
 from lib.db import Database
-from lib.sql import create_tables
+from lib.sql import migrate
+
+
+@pytest.fixture(scope='function')
+def modules():
+    """Drops instances of singleton modules, so every test creates modules with its own config"""
+    SingletonModule._instances.clear()
+    yield
+    SingletonModule._instances.clear()
 
 
 @pytest.fixture(scope='function')
@@ -30,7 +38,7 @@ async def db():
 
     async with database.connect() as connection:
         await connection.execute('CREATE SCHEMA IF NOT EXISTS public;')
-        await create_tables(connection)
+        await migrate(connection)
 
     try:
         yield database
@@ -0,0 +1,128 @@
+import asyncio
+from typing import Callable, Optional
+
+from async_timeout import timeout as timeout_context
+
+from lib.db.pool import PoolManager
+from lib.db.utils import Dsn
+
+
+class FakeHost:
+    """State of database host, tests change it to simulate failures"""
+
+    def __init__(self, is_master: bool = True, lag: float = 0., lsn: int = 0):
+        self.is_master = is_master
+        self.lag = lag
+        self.lsn = lsn
+        # host does not answer checks and new connections
+        self.available = True
+        # raised when connection is acquired from pool of host
+        self.acquire_error: Optional[BaseException] = None
+        self.acquire_delay = 0.
+        # time of creating pool of host, e.g. remote host or host which is still starting
+        self.create_delay = 0.
+        self.connects = 0
+        self.log: list[str] = []
+
+
+class FakeConnection:
+    def __init__(self, host: FakeHost):
+        self.host = host
+        self.closed = False
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+    def terminate(self):
+        self.closed = True
+
+    async def fetchrow(self, query: str):
+        if not self.host.available:
+            self.closed = True
+            raise ConnectionResetError('host is not available')
+
+        if 'transaction_read_only' in query:
+            return ['off' if self.host.is_master else 'on']
+        return {'replayed_all': False, 'receiving': True, 'replay_age': self.host.lag, 'lsn': self.host.lsn}
+
+
+class FakeAcquireContext:
+    def __init__(self, host: FakeHost):
+        self.host = host
+
+    async def __aenter__(self):
+        self.host.log.append('enter')
+        if self.host.acquire_delay:
+            await asyncio.sleep(self.host.acquire_delay)
+        if self.host.acquire_error is not None:
+            raise self.host.acquire_error
+        return FakeConnection(self.host)
+
+    async def __aexit__(self, *exc):
+        self.host.log.append('exit')
+
+    def __await__(self):
+        return self.__aenter__().__await__()
+
+
+class FakePool:
+    def __init__(self, host: FakeHost, size: int = 10):
+        self.host = host
+        self.size = size
+        self._queue = asyncio.Queue()
+        for _ in range(size):
+            self._queue.put_nowait(None)
+
+    def acquire(self, **kwargs):
+        return FakeAcquireContext(self.host)
+
+    async def release(self, connection, **kwargs):
+        pass
+
+    async def close(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def get_size(self):
+        return self.size
+
+    def get_idle_size(self):
+        return self._queue.qsize()
+
+    def get_max_size(self):
+        return self.size
+
+
+class FakePoolManager(PoolManager):
+    """Pool manager of fake hosts, hosts are checked with fake connections"""
+
+    def __init__(self, hosts: dict[str, FakeHost], **kwargs):
+        self.hosts = hosts
+        kwargs.setdefault('refresh_delay', 0.01)
+        kwargs.setdefault('refresh_timeout', 0.1)
+        super().__init__(f'postgresql://user:password@{",".join(hosts)}/db', **kwargs)
+
+    async def _pool_factory(self, dsn: Dsn):
+        host = self.hosts[f'{dsn.host}:{dsn.port}']
+        if host.create_delay:
+            await asyncio.sleep(host.create_delay)
+        return FakePool(host)
+
+    async def _connection_factory(self, dsn: Dsn):
+        host = self.hosts[f'{dsn.host}:{dsn.port}']
+        host.connects += 1
+        if not host.available:
+            raise ConnectionRefusedError('host is not available')
+        return FakeConnection(host)
+
+
+async def wait_for(predicate: Callable[[], bool], timeout: float = 1.):
+    """Waits till checks of hosts bring pool manager to expected state"""
+    async with timeout_context(timeout):
+        while not predicate():
+            await asyncio.sleep(0.005)
@@ -0,0 +1,101 @@
+from datetime import timedelta
+
+import pytest
+
+from lib.models.users import User, Name
+from lib.modules import auth
+from lib.modules.auth import Auth
+from lib.util import cache
+from tests.full_wait import full_wait_pending
+
+USER = User(login='test', name=Name(first='vova', last='last'))
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """Emulates sessions table, counts queries"""
+    table = {'session': USER}
+    queries = []
+
+    async def get_user_by_session(connection, session_id, active_since=None):
+        queries.append(session_id)
+        return table.get(session_id)
+
+    async def set_user_session_id(connection, login, session_id):
+        table[session_id] = USER
+        return True
+
+    monkeypatch.setattr(auth, 'get_user_by_session', get_user_by_session)
+    monkeypatch.setattr(auth, 'set_user_session_id', set_user_session_id)
+    return table, queries
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_authorize_cached(sessions, modules):
+    table, queries = sessions
+    module = Auth()
+
+    assert await module.authorize(None, 'session') == USER
+    assert await module.authorize(None, 'session') == USER
+    assert queries == ['session']
+
+    # unknown sessions are cached too
+    assert await module.authorize(None, 'unknown') is None
+    assert await module.authorize(None, 'unknown') is None
+    assert queries == ['session', 'unknown']
+
+    assert await module.authorize(None, None) is None
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_last_seen_debounce(sessions, modules):
+    module = Auth({'last_seen_debounce': 60})
+
+    await module.authorize(None, 'session')
+    first_seen = module.pending_last_seen['session']
+
+    module.pending_last_seen.clear()
+    await module.authorize(None, 'session')
+    assert module.pending_last_seen == {}
+
+    # debounce passed
+    user, _ = module.sessions.get('session')
+    module.sessions.set('session', (user, first_seen - timedelta(seconds=61)))
+    await module.authorize(None, 'session')
+    assert module.pending_last_seen['session'] >= first_seen
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_last_seen_does_not_prolong_cache(sessions, monkeypatch, modules):
+    table, queries = sessions
+    now = [1000.]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    module = Auth({'cache_ttl': 60, 'last_seen_debounce': 0})
+
+    await module.authorize(None, 'session')
+    now[0] += 40
+    await module.authorize(None, 'session')
+    now[0] += 40
+    await module.authorize(None, 'session')
+
+    # cached user expired after cache_ttl since it was loaded
+    assert queries == ['session', 'session']
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_create_session_invalidates_previous(sessions, modules):
+    table, queries = sessions
+    module = Auth()
+
+    await module.authorize(None, 'session')
+
+    new_session = await module.create_session(None, USER.login)
+    del table['session']
+
+    assert await module.authorize(None, 'session') is None
+    assert await module.authorize(None, new_session) == USER
+    assert 'session' not in module.pending_last_seen
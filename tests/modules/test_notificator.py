@@ -0,0 +1,149 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from dateutil.relativedelta import relativedelta
+
+from lib.api.events import create_event
+from lib.api.users import create_user
+from lib.models.events import RCreateEvent, Repetition, ERepeatType, Notification, EChannel
+from lib.models.users import UserFull, Name
+from lib.modules.notificator import Notificator
+from lib.modules.senders import StubSender
+from lib.util.module import SingletonModule
+from tests.full_wait import full_wait_pending
+
+TEST_USER = UserFull(login='test', name=Name(first='vova', last='last'))
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_notificator(db):
+    await create_user(TEST_USER)
+
+    now = datetime.now()
+
+    event_start_time = now + timedelta(minutes=15, seconds=1)
+    simple_event = RCreateEvent(
+        author_login=TEST_USER.login,
+        start_time=event_start_time,
+        end_time=now + timedelta(days=60, hours=1),
+        name='ВВВ',
+        description='Hello',
+        notifications=[
+            Notification(channel=EChannel.email, offset='15m'),
+        ],
+    )
+    simple = await create_event(simple_event)
+    assert simple.notifications
+
+    complex_event = RCreateEvent(
+        author_login=TEST_USER.login,
+        start_time=event_start_time,
+        end_time=now + timedelta(days=60, hours=1),
+        name='AAA',
+        description='Hello',
+        notifications=[
+            Notification(channel=EChannel.telegram, offset='15m'),
+        ],
+        repetition=Repetition(
+            type=ERepeatType.yearly,
+            each=2,
+            due_date=now + relativedelta(years=8) + timedelta(hours=16)
+        ),
+    )
+    complex = await create_event(complex_event)
+    assert complex.notifications
+
+    notificator = Notificator(None)
+    email, telegram = StubSender(EChannel.email), StubSender(EChannel.telegram)
+    notificator.register_sender(email)
+    notificator.register_sender(telegram)
+
+    await asyncio.sleep(1)
+    async with db.connect() as connection:
+        await notificator.run_once(connection)
+
+    assert len(email.sent) == 1
+    assert len(telegram.sent) == 1
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_notificators_do_not_duplicate(db):
+    await create_user(TEST_USER)
+
+    now = datetime.now()
+    for i in range(10):
+        await create_event(RCreateEvent(
+            author_login=TEST_USER.login,
+            start_time=now + timedelta(minutes=15, seconds=1),
+            end_time=now + timedelta(hours=1),
+            name=f'event {i}',
+            notifications=[
+                Notification(channel=EChannel.email, offset='15m'),
+            ],
+        ))
+
+    senders = []
+    notificators = []
+    for _ in range(2):
+        # every worker has its own notificator
+        SingletonModule._instances.pop(Notificator, None)
+        notificator = Notificator({'claim_limit': 3})
+        sender = StubSender(EChannel.email)
+        notificator.register_sender(sender)
+        senders.append(sender)
+        notificators.append(notificator)
+
+    await asyncio.sleep(1)
+
+    async def run(notificator: Notificator):
+        async with db.connect() as connection:
+            await notificator.run_once(connection)
+
+    await asyncio.gather(*(run(notificator) for notificator in notificators))
+
+    sent_ids = [notification.id for sender in senders for notification in sender.sent]
+    assert len(sent_ids) == 10
+    assert len(set(sent_ids)) == 10
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_notification_without_sender_is_skipped(db):
+    await create_user(TEST_USER)
+
+    now = datetime.now()
+    event = await create_event(RCreateEvent(
+        author_login=TEST_USER.login,
+        start_time=now + timedelta(minutes=15, seconds=1),
+        end_time=now + timedelta(hours=1),
+        name='event',
+        notifications=[
+            Notification(channel=EChannel.email, offset='15m'),
+            Notification(channel=EChannel.sms, offset='15m'),
+        ],
+        repetition=Repetition(type=ERepeatType.daily),
+    ))
+
+    # db fixture drops instances of modules, so notificator is created with default senders
+    notificator = Notificator(None)
+    email = StubSender(EChannel.email)
+    notificator.senders = {EChannel.email: email}
+
+    await asyncio.sleep(1)
+    async with db.connect() as connection:
+        assert await notificator.process_batch(connection) == (2, 1)
+        rows = await connection.fetch(
+            'SELECT channel, next_notify_at, last_notify_at, locked_until FROM notifications WHERE event_id = $1',
+            event.id,
+        )
+
+    assert len(email.sent) == 1
+    rows = {row['channel']: row for row in rows}
+    # notification is not claimed again till the next occurrence, it is not marked as sent
+    assert rows['sms']['next_notify_at'] == rows['email']['next_notify_at'] > now + timedelta(days=1)
+    assert rows['sms']['locked_until'] is None
+    assert rows['sms']['last_notify_at'] is None
+    assert rows['email']['last_notify_at'] is not None
@@ -0,0 +1,106 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from lib.models.events import EChannel, ERepeatType, Repetition
+from lib.modules.notificator import Notificator
+from lib.sql.notifications import NotificationRecord, get_cached_repetition
+from tests.full_wait import full_wait_pending
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_schedule(modules):
+    notificator = Notificator(None)
+    now = datetime.now()
+
+    # nothing loaded yet, deadline will be loaded from database
+    notificator.schedule(now + timedelta(minutes=1))
+    assert notificator.deadlines == []
+
+    notificator.loaded_until = now + timedelta(minutes=10)
+    notificator.schedule(now + timedelta(minutes=5))
+    assert notificator.wakeup.is_set()
+
+    notificator.wakeup.clear()
+    notificator.schedule(now + timedelta(minutes=7))
+    assert not notificator.wakeup.is_set()
+
+    notificator.schedule(now + timedelta(minutes=1))
+    assert notificator.wakeup.is_set()
+
+    notificator.schedule(now + timedelta(minutes=11))
+    assert notificator.deadlines[0] == now + timedelta(minutes=1)
+    assert len(notificator.deadlines) == 3
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_wait_next_deadline(modules):
+    notificator = Notificator(None)
+    now = datetime.now()
+    notificator.loaded_until = now + timedelta(minutes=10)
+    notificator.deadlines = [now - timedelta(seconds=1), now + timedelta(milliseconds=100), now + timedelta(minutes=5)]
+
+    started = asyncio.get_running_loop().time()
+    await notificator.wait_next_deadline()
+    elapsed = asyncio.get_running_loop().time() - started
+
+    assert 0.05 < elapsed < 1
+    assert notificator.deadlines[0] == now + timedelta(milliseconds=100)
+
+    # sooner deadline wakes scheduler up
+    async def schedule_soon():
+        await asyncio.sleep(0.05)
+        notificator.schedule(datetime.now())
+
+    started = asyncio.get_running_loop().time()
+    notificator.deadlines = [now + timedelta(minutes=5)]
+    await asyncio.gather(notificator.wait_next_deadline(), schedule_soon())
+    assert asyncio.get_running_loop().time() - started < 1
+
+
+def test_find_next_notification_time():
+    now = datetime.now().replace(second=0, microsecond=0)
+    event_start = now - timedelta(days=10)
+    notification = NotificationRecord(
+        id=1,
+        offset_notify='1d',
+        next_notify_at=now,
+        channel=EChannel.email.value,
+        event_id=1,
+        recipient='test',
+        repetition=Repetition(type=ERepeatType.daily, each=1),
+        event_start=event_start,
+    )
+
+    # daily event is notified a day before, occurrence of tomorrow is notified now, the next one tomorrow
+    assert Notificator.find_next_notification_time(notification) == now + timedelta(days=1)
+
+    ended = notification._replace(
+        repetition=Repetition(type=ERepeatType.daily, each=1, due_date=now + timedelta(days=1, hours=2))
+    )
+    assert Notificator.find_next_notification_time(ended) is None
+
+
+def test_cached_repetition():
+    row = {
+        'event_id': 1,
+        'repeat_type': ERepeatType.weakly.value,
+        'repeat_weekly_days': 'mon,fri',
+        'repeat_monthly_last_week': False,
+        'repeat_due_date': None,
+        'repeat_each': 2,
+    }
+
+    repetition = get_cached_repetition(row)
+    assert repetition.each == 2
+    assert get_cached_repetition(dict(row)) is repetition
+
+    # changed event is parsed again
+    changed = get_cached_repetition({**row, 'repeat_each': 3})
+    assert changed is not repetition
+    assert changed.each == 3
+
+    assert get_cached_repetition({**row, 'repeat_type': None}) is None
@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from lib.models.events import EChannel
+from lib.modules.senders import BaseSender, StubSender, dispatch
+from lib.sql.notifications import NotificationRecord
+from tests.full_wait import full_wait_pending
+
+
+def make_notifications(channel: EChannel, count: int, start_id: int = 0) -> list[NotificationRecord]:
+    return [
+        NotificationRecord(
+            id=start_id + i,
+            offset_notify='15m',
+            next_notify_at=datetime(2022, 6, 26, 15),
+            channel=channel.value,
+            event_id=1,
+            recipient=f'user{i}',
+        )
+        for i in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_dispatch_by_channels():
+    email = StubSender(EChannel.email, batch_size=10)
+    slack = StubSender(EChannel.slack, batch_size=3)
+    sms = StubSender(EChannel.sms, fail=True)
+
+    notifications = (
+        make_notifications(EChannel.email, 25) +
+        make_notifications(EChannel.slack, 7, start_id=100) +
+        make_notifications(EChannel.sms, 2, start_id=200) +
+        make_notifications(EChannel.telegram, 1, start_id=300)
+    )
+
+    sent = await dispatch({sender.channel: sender for sender in (email, slack, sms)}, notifications)
+
+    assert sorted(n.id for n in sent) == list(range(25)) + list(range(100, 107))
+    assert email.batches_count == 3
+    assert slack.batches_count == 3
+    assert len(email.sent) == 25
+    assert not sms.sent
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_sender_concurrency_limit():
+    class SlowSender(StubSender):
+        active = 0
+        max_active = 0
+
+        async def send_batch(self, batch):
+            SlowSender.active += 1
+            SlowSender.max_active = max(SlowSender.max_active, SlowSender.active)
+            await asyncio.sleep(0.01)
+            SlowSender.active -= 1
+            await super().send_batch(batch)
+
+    sender = SlowSender(EChannel.email, concurrency=2, batch_size=1)
+    sent = await sender.send(make_notifications(EChannel.email, 6))
+
+    assert len(sent) == 6
+    assert SlowSender.max_active == 2
+
+
+def test_sender_without_send_batch_is_not_created():
+    class NoBatchSender(BaseSender):
+        pass
+
+    with pytest.raises(TypeError):
+        NoBatchSender(EChannel.email)
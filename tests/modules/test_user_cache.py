@@ -0,0 +1,35 @@
+import pytest
+
+from lib.models.users import User, UserFull, Name
+from lib.modules.user_cache import UserCache
+from tests.full_wait import full_wait_pending
+
+USER = UserFull(login='test', name=Name(first='vova', last='last'))
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_user_cache(modules):
+    cache = UserCache()
+    short = User(login=USER.login, name=USER.name)
+
+    cache.set(short)
+    cache.set(USER, full=True)
+
+    assert cache.get(USER.login) is short
+    assert cache.get(USER.login, full=True) is USER
+    assert cache.get('other') is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    cache.invalidate(USER.login)
+    assert cache.get(USER.login) is None
+    assert cache.get(USER.login, full=True) is None
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_user_cache_disabled(modules):
+    cache = UserCache({'enabled': False})
+    cache.set(USER, full=True)
+
+    assert cache.get(USER.login, full=True) is None
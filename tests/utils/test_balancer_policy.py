@@ -0,0 +1,99 @@
+import pytest
+
+from lib.db.balancer_policy import (
+    BalancerPolicy, GreedyBalancerPolicy, LeastLatencyBalancerPolicy, PowerOfTwoChoicesBalancerPolicy,
+    RoundRobinBalancerPolicy,
+)
+from tests.full_wait import full_wait_pending
+
+
+class FakePoolManager:
+    def __init__(self, pools: dict[str, tuple[int, float]], masters: tuple[str, ...] = (), lsn: dict[str, int] = None):
+        # pool -> (free size, response time)
+        self.pools = pools
+        self.masters = list(masters)
+        self.lsn = lsn or {}
+
+    @property
+    def master_pool_count(self):
+        return len(self.masters)
+
+    async def get_master_pools(self):
+        return self.masters
+
+    async def get_replica_pools(self, fallback_master: bool = False):
+        return list(self.pools)
+
+    def get_pool_freesize(self, pool):
+        return self.pools[pool][0]
+
+    def get_last_response_time(self, pool):
+        return self.pools[pool][1]
+
+    def pool_has_replayed(self, pool, lsn):
+        return pool in self.masters or self.lsn.get(pool, 0) >= lsn
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_greedy_policy_chooses_most_free_pool():
+    policy = GreedyBalancerPolicy(FakePoolManager({'near': (1, 0.001), 'far': (5, 0.01)}))
+    assert await policy.get_pool(read_only=True) == 'far'
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_least_latency_policy_skips_busy_pools():
+    manager = FakePoolManager({'near': (1, 0.001), 'far': (5, 0.01), 'unknown': (0, None)})
+    policy = LeastLatencyBalancerPolicy(manager)
+    assert await policy.get_pool(read_only=True) == 'near'
+
+    manager.pools['near'] = (0, 0.001)
+    assert await policy.get_pool(read_only=True) == 'far'
+
+    manager.pools['far'] = (0, 0.01)
+    assert await policy.get_pool(read_only=True) == 'unknown'
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_power_of_two_policy_weights_latency_by_free_size():
+    policy = PowerOfTwoChoicesBalancerPolicy(FakePoolManager({'near': (0, 0.002), 'far': (9, 0.01)}))
+    assert await policy.get_pool(read_only=True) == 'far'
+
+    policy = PowerOfTwoChoicesBalancerPolicy(FakePoolManager({'near': (4, 0.002), 'far': (9, 0.01)}))
+    assert await policy.get_pool(read_only=True) == 'near'
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_round_robin_policy():
+    policy = RoundRobinBalancerPolicy(FakePoolManager({'a': (1, 0.001), 'b': (1, 0.001), 'c': (1, 0.001)}))
+    assert [await policy.get_pool(read_only=True) for _ in range(4)] == ['a', 'b', 'c', 'a']
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_policy_skips_replicas_behind_min_lsn():
+    manager = FakePoolManager(
+        {'master': (1, 0.001), 'fresh': (1, 0.001), 'stale': (9, 0.001)},
+        masters=('master',), lsn={'fresh': 100, 'stale': 50},
+    )
+
+    async def get_replica_pools(fallback_master: bool = False):
+        return ['fresh', 'stale']
+
+    manager.get_replica_pools = get_replica_pools
+    policy = GreedyBalancerPolicy(manager)
+
+    assert await policy.get_pool(read_only=True) == 'stale'
+    assert await policy.get_pool(read_only=True, min_lsn=100) == 'fresh'
+    assert await policy.get_pool(read_only=True, min_lsn=200) == 'master'
+
+
+def test_policy_without_choose_is_not_created():
+    class NoChoosePolicy(BalancerPolicy):
+        pass
+
+    with pytest.raises(TypeError):
+        NoChoosePolicy(FakePoolManager({}))
@@ -0,0 +1,191 @@
+import asyncio
+import time
+
+import pytest
+
+from lib.db import breaker
+from lib.db.breaker import CircuitBreaker, PoolUnavailableError
+from tests.fake_pool import FakeHost, FakePoolManager
+from tests.full_wait import full_wait_pending
+
+
+def test_breaker_opens_after_failures_in_a_row(monkeypatch):
+    now = [100.]
+    monkeypatch.setattr(breaker.time, 'monotonic', lambda: now[0])
+
+    circuit = CircuitBreaker(failure_threshold=2, reset_timeout=5.)
+    circuit.record_failure()
+    circuit.record_success()
+    circuit.record_failure()
+    assert not circuit.is_open
+
+    circuit.record_failure()
+    assert circuit.is_open
+    assert not circuit.allow_request()
+    assert circuit.retry_in() == 5.
+
+    now[0] += 3.
+    assert circuit.retry_in() == 2.
+
+
+def test_half_open_breaker_lets_one_trial_request_through(monkeypatch):
+    now = [100.]
+    monkeypatch.setattr(breaker.time, 'monotonic', lambda: now[0])
+
+    circuit = CircuitBreaker(failure_threshold=2, reset_timeout=5.)
+    circuit.record_failure()
+    circuit.record_failure()
+
+    now[0] += 5.
+    assert not circuit.is_open
+    assert circuit.allow_request()
+    assert circuit.trial
+    assert circuit.is_open
+    assert not circuit.allow_request()
+
+    # trial request failed, breaker is open again
+    circuit.record_failure()
+    assert circuit.is_open
+    assert circuit.retry_in() == 5.
+
+    # trial request timed out, next request is the trial one
+    now[0] += 5.
+    assert circuit.allow_request()
+    circuit.cancel_trial()
+    assert circuit.allow_request()
+
+    circuit.record_success()
+    assert circuit.is_closed
+    assert circuit.allow_request()
+    assert circuit.allow_request()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_no_master_fails_fast():
+    host = FakeHost()
+    host.available = False
+    manager = FakePoolManager({'db1:5432': host}, pool_wait_timeout=0.05)
+    try:
+        started_at = time.monotonic()
+        with pytest.raises(PoolUnavailableError) as error:
+            async with manager.acquire(timeout=5):
+                pass
+
+        assert time.monotonic() - started_at < 1
+        assert error.value.retry_after == 1.
+        assert manager.metrics.select_timeouts == 0
+    finally:
+        await manager.close()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_requests_wait_for_first_check_of_hosts():
+    host = FakeHost()
+    host.create_delay = 0.2
+    manager = FakePoolManager({'db1:5432': host}, pool_wait_timeout=0.05, refresh_timeout=1.)
+    try:
+        # pool is created longer than pool_wait_timeout, e.g. on start of server
+        async with manager.acquire(timeout=5):
+            pass
+        assert host.log.count('enter') == 1
+    finally:
+        await manager.close()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_open_breaker_fails_fast_with_retry_after():
+    host = FakeHost()
+    manager = FakePoolManager(
+        {'db1:5432': host}, pool_wait_timeout=0.05, breaker_failures=2, breaker_reset_timeout=30.
+    )
+    try:
+        await manager.ready(timeout=1)
+
+        host.acquire_error = ConnectionRefusedError('host is not available')
+        for _ in range(2):
+            with pytest.raises(ConnectionRefusedError):
+                async with manager.acquire(timeout=5):
+                    pass
+
+        pool = manager.pools[0]
+        assert not manager.pool_is_allowed(pool)
+        with pytest.raises(PoolUnavailableError) as error:
+            async with manager.acquire(timeout=5):
+                pass
+        assert 29 < error.value.retry_after <= 30
+        assert host.log.count('enter') == 2
+    finally:
+        await manager.close()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_busy_pool_timeouts_do_not_open_breaker():
+    host = FakeHost()
+    manager = FakePoolManager({'db1:5432': host}, breaker_failures=1)
+    try:
+        await manager.ready(timeout=1)
+
+        host.acquire_delay = 1.
+        with pytest.raises(asyncio.TimeoutError):
+            async with manager.acquire(timeout=0.05):
+                pass
+
+        assert manager.pool_is_allowed(manager.pools[0])
+        assert manager.metrics.host('db1:5432').acquire_timeouts == 1
+    finally:
+        await manager.close()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_half_open_pool_waits_for_trial_request():
+    host = FakeHost()
+    manager = FakePoolManager(
+        {'db1:5432': host}, pool_wait_timeout=1., breaker_failures=1, breaker_reset_timeout=0.05
+    )
+
+    async def query():
+        async with manager.acquire(timeout=5):
+            await asyncio.sleep(0.02)
+
+    try:
+        await manager.ready(timeout=1)
+
+        host.acquire_error = ConnectionRefusedError('host is not available')
+        with pytest.raises(ConnectionRefusedError):
+            await query()
+
+        host.acquire_error = None
+        host.log.clear()
+        await asyncio.gather(query(), query(), query())
+
+        # the trial request finished before others were sent
+        assert host.log[:2] == ['enter', 'exit']
+        assert host.log.count('enter') == 3
+        assert manager.pool_is_allowed(manager.pools[0])
+    finally:
+        await manager.close()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_requests_are_shed_when_too_many_wait():
+    host = FakeHost()
+    manager = FakePoolManager({'db1:5432': host}, max_waiting=1)
+    try:
+        await manager.ready(timeout=1)
+
+        host.acquire_delay = 0.05
+        first = asyncio.create_task(manager.acquire(timeout=5).__aenter__())
+        await asyncio.sleep(0.01)
+        with pytest.raises(PoolUnavailableError):
+            await manager.acquire(timeout=5)
+        await first
+
+        assert manager.metrics.host('db1:5432').shed == 1
+    finally:
+        await manager.close()
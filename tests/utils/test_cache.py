@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from lib.util.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+
+    assert cache.get('a') == 1
+
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_invalidate():
+    cache = LRUCache(max_size=2)
+    cache.set('a', 1)
+    cache.invalidate('a')
+    cache.invalidate('missing')
+
+    assert cache.get('a') is None
+    assert cache.get('a', 0) == 0
+
+    cache.set('a', 1)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_lru_cache_size():
+    with pytest.raises(ValueError):
+        LRUCache(max_size=0)
+
+
+def test_lru_cache_ttl(monkeypatch):
+    now = 1000.
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+
+    cache = LRUCache(max_size=2, ttl=10)
+    cache.set('a', 1)
+
+    now += 5
+    assert cache.get('a') == 1
+
+    now += 6
+    assert cache.get('a') is None
+    assert 'a' not in cache
+
+
+def test_lru_cache_replace_keeps_ttl(monkeypatch):
+    now = 1000.
+    monkeypatch.setattr(time, 'monotonic', lambda: now)
+
+    cache = LRUCache(max_size=2, ttl=10)
+    cache.set('a', 1)
+
+    now += 5
+    cache.replace('a', 2)
+    cache.replace('b', 3)
+    assert cache.get('a') == 2
+    assert 'b' not in cache
+
+    now += 6
+    assert cache.get('a') is None
+
+
+def test_lru_cache_counters():
+    cache = LRUCache(max_size=2)
+    assert cache.hit_rate == 0.
+
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+
+    assert cache.hits == 2
+    assert cache.misses == 1
+    assert cache.hit_rate == 2 / 3
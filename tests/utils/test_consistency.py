@@ -0,0 +1,30 @@
+import pytest
+
+from lib.db.consistency import parse_lsn, format_lsn, ReadYourWrites, request_consistency, get_min_lsn
+
+
+def test_parse_lsn():
+    assert parse_lsn('0/0') == 0
+    assert parse_lsn('16/B374D848') == (0x16 << 32) | 0xB374D848
+    assert parse_lsn(' 1/a ') == (1 << 32) | 10
+
+    for value in ('', '16', '/1', '1/', 'x/1', '1/100000000', '-1/1'):
+        with pytest.raises(ValueError):
+            parse_lsn(value)
+
+
+def test_format_lsn():
+    assert format_lsn(0) == '0/0'
+    assert format_lsn(parse_lsn('16/B374D848')) == '16/B374D848'
+
+
+def test_min_lsn_of_request():
+    assert get_min_lsn() is None
+
+    token = request_consistency.set(ReadYourWrites(min_lsn=42))
+    try:
+        assert get_min_lsn() == 42
+    finally:
+        request_consistency.reset(token)
+
+    assert get_min_lsn() is None
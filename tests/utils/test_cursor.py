@@ -0,0 +1,16 @@
+from datetime import datetime
+
+import pytest
+
+from lib.util.cursor import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    key = (datetime(2022, 6, 26, 15, 30, 0, 123), 42)
+    assert decode_cursor(encode_cursor(*key)) == key
+
+
+@pytest.mark.parametrize('token', ['', 'not a cursor', encode_cursor(datetime(2022, 6, 26), 1)[:-3]])
+def test_cursor_not_valid(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta
+
+from lib.util.free_time import (
+    merge_busy_intervals, iterate_free_intervals, find_free_slot, find_free_slots, align_to_granularity
+)
+
+START = datetime(2022, 6, 26, 16)
+
+
+def hours(h: float) -> datetime:
+    return START + timedelta(hours=h)
+
+
+def test_merge_busy_intervals():
+    streams = [
+        [(hours(0), hours(1)), (hours(3), hours(4))],
+        [(hours(0.5), hours(2)), (hours(5), hours(6))],
+        [(hours(2), hours(2.5))],
+    ]
+
+    assert list(merge_busy_intervals(streams)) == [
+        (hours(0), hours(2.5)),
+        (hours(3), hours(4)),
+        (hours(5), hours(6)),
+    ]
+
+    assert list(merge_busy_intervals([])) == []
+    assert list(merge_busy_intervals([[], []])) == []
+
+
+def test_iterate_free_intervals():
+    busy = [(hours(-1), hours(1)), (hours(3), hours(4)), (hours(10), hours(11))]
+
+    assert list(iterate_free_intervals(busy, hours(0), hours(8))) == [
+        (hours(1), hours(3)),
+        (hours(4), hours(8)),
+    ]
+
+
+def test_find_free_slot():
+    streams = [
+        [(hours(0), hours(1)), (hours(1.5), hours(3))],
+        [(hours(3), hours(4)), (hours(4.5), hours(6))],
+    ]
+
+    assert find_free_slot(streams, timedelta(minutes=30), hours(0), hours(8)) == (hours(1), hours(1.5))
+    assert find_free_slot(streams, timedelta(hours=1), hours(0), hours(8)) == (hours(6), hours(7))
+    assert find_free_slot(streams, timedelta(hours=1), hours(-2), hours(8)) == (hours(-2), hours(-1))
+    assert find_free_slot(streams, timedelta(hours=3), hours(0), hours(8)) is None
+    assert find_free_slot([], timedelta(hours=3), hours(0), hours(8)) == (hours(0), hours(3))
+
+
+def test_align_to_granularity():
+    assert align_to_granularity(datetime(2022, 6, 26, 16, 10), timedelta(minutes=15)) == datetime(2022, 6, 26, 16, 15)
+    assert align_to_granularity(datetime(2022, 6, 26, 16, 15), timedelta(minutes=15)) == datetime(2022, 6, 26, 16, 15)
+    assert align_to_granularity(datetime(2022, 6, 26, 23, 50), timedelta(minutes=30)) == datetime(2022, 6, 27)
+
+
+def test_find_free_slots():
+    streams = [
+        [(hours(0), hours(1)), (hours(1.5), hours(3))],
+        [(hours(3), hours(4)), (hours(4.5), hours(6))],
+    ]
+
+    assert find_free_slots(streams, timedelta(minutes=30), hours(0), hours(8), count=3) == [
+        (hours(1), hours(1.5)),
+        (hours(4), hours(4.5)),
+        (hours(6), hours(6.5)),
+    ]
+
+    assert find_free_slots(streams, timedelta(hours=1), hours(0), hours(8), count=5, granularity=timedelta(minutes=30)) == [
+        (hours(6), hours(7)),
+        (hours(6.5), hours(7.5)),
+        (hours(7), hours(8)),
+    ]
+
+    streams = [[(hours(0), hours(1) + timedelta(minutes=10))]]
+    assert find_free_slots(streams, timedelta(hours=1), hours(0), hours(4), count=1, granularity=timedelta(minutes=15)) == [
+        (hours(1.25), hours(2.25)),
+    ]
+
+    assert find_free_slots(streams, timedelta(hours=1), hours(0), hours(4), count=0) == []
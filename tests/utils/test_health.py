@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from lib.db.health import SharedCheckState, next_check_delay, replica_lag
+from tests.fake_pool import FakeHost, FakePoolManager, wait_for
+from tests.full_wait import full_wait_pending
+
+
+def test_next_check_delay_backs_off_while_stable():
+    delay = 1.
+    delays = []
+    for _ in range(6):
+        delay = next_check_delay(delay, min_delay=1., max_delay=10., stable=True)
+        delays.append(delay)
+
+    assert delays == [2., 4., 8., 10., 10., 10.]
+    assert next_check_delay(delay, min_delay=1., max_delay=10., stable=False) == 1.
+
+
+def test_shared_check_state_has_one_leader(tmp_path):
+    path = str(tmp_path / 'health.json')
+    leader, follower = SharedCheckState(path), SharedCheckState(path)
+
+    assert leader.try_lead()
+    assert leader.try_lead()
+    assert not follower.try_lead()
+    assert follower.read('host', max_age=10) is None
+
+    leader.write('host', is_master=False, lag=0.5, lsn=42, response_time=0.001)
+    state = follower.read('host', max_age=10)
+    assert (state['is_master'], state['lag'], state['lsn'], state['response_time']) == (False, 0.5, 42, 0.001)
+    assert follower.read('host', max_age=-1) is None
+    assert follower.read('other', max_age=10) is None
+
+    leader.close()
+    assert follower.try_lead()
+    follower.close()
+
+
+def test_replica_lag():
+    # master has no writes, replica replayed all it received
+    assert replica_lag(replayed_all=True, receiving=True, replay_age=600.) == 0.
+    assert replica_lag(replayed_all=False, receiving=True, replay_age=3.) == 3.
+    assert replica_lag(replayed_all=False, receiving=True, replay_age=None) == 0.
+
+
+def test_replica_lag_of_stalled_replica():
+    # WAL receiver is disconnected, so replica has replayed all it received, but master may have gone far ahead
+    assert replica_lag(replayed_all=True, receiving=False, replay_age=600.) == 600.
+    assert replica_lag(replayed_all=True, receiving=False, replay_age=None) == float('inf')
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_check_connection_is_reconnected_after_failure():
+    host = FakeHost()
+    manager = FakePoolManager({'db1:5432': host}, max_refresh_delay=0.05)
+    try:
+        await manager.ready(timeout=1)
+        await asyncio.sleep(0.1)
+        # one connection is used for all checks while host is available
+        assert host.connects == 1
+
+        host.available = False
+        await wait_for(lambda: manager.master_pool_count == 0)
+        await wait_for(lambda: host.connects >= 3)
+
+        host.available = True
+        await wait_for(lambda: manager.master_pool_count == 1)
+        connects = host.connects
+        await asyncio.sleep(0.1)
+        assert host.connects == connects
+    finally:
+        await manager.close()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_replica_state_is_refreshed_while_stable():
+    master, replica = FakeHost(), FakeHost(is_master=False, lsn=1)
+    manager = FakePoolManager(
+        {'db1:5432': master, 'db2:5432': replica}, max_refresh_delay=10., max_replica_lag=1.
+    )
+    try:
+        await manager.ready(timeout=1)
+        # roles are stable, so master is checked more and more rarely
+        await asyncio.sleep(0.3)
+        pool = next(pool for pool in manager.pools if manager.pool_is_replica(pool))
+
+        replica.lsn = 5
+        await wait_for(lambda: manager.pool_has_replayed(pool, 5), timeout=0.1)
+
+        replica.lag = 5.
+        await wait_for(lambda: not manager.pool_is_replica(pool), timeout=0.1)
+    finally:
+        await manager.close()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_follower_applies_state_checked_by_leader(tmp_path):
+    path = str(tmp_path / 'health.json')
+    # follower would see master if it checked host itself
+    leader_host, follower_host = FakeHost(is_master=False, lag=0.5, lsn=42), FakeHost()
+    leader = FakePoolManager(
+        {'db1:5432': leader_host}, shared_state_path=path, max_refresh_delay=0.05, max_replica_lag=1.
+    )
+    follower = None
+    try:
+        await leader.ready(timeout=1)
+        follower = FakePoolManager(
+            {'db1:5432': follower_host}, shared_state_path=path, max_refresh_delay=0.05, max_replica_lag=1.
+        )
+        await follower.ready(timeout=1)
+
+        pool = follower.pools[0]
+        assert follower.pool_is_replica(pool)
+        assert follower.get_replica_lag(pool) == 0.5
+        assert follower.pool_has_replayed(pool, 42)
+        assert follower.get_last_response_time(pool) is not None
+
+        leader_host.lag = 5.
+        await wait_for(lambda: not follower.pool_is_replica(pool))
+
+        leader_host.lag = 0.
+        await wait_for(lambda: follower.pool_is_replica(pool))
+
+        leader_host.available = False
+        await wait_for(lambda: follower.replica_pool_count == 0)
+        assert follower_host.connects == 0
+    finally:
+        if follower is not None:
+            await follower.close()
+        await leader.close()
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_follower_keeps_pool_sets_on_stale_state(tmp_path):
+    path = str(tmp_path / 'health.json')
+    leader = SharedCheckState(path)
+    assert leader.try_lead()
+
+    host = FakeHost()
+    manager = FakePoolManager({'db1:5432': host}, shared_state_path=path, max_refresh_delay=0.05)
+    key = manager._state_key(manager.dsn[0])
+    try:
+        leader.write(key, is_master=True, lag=None, lsn=None, response_time=0.001)
+        await manager.ready(timeout=1)
+        assert manager.master_pool_count == 1
+
+        # leader stopped checking hosts, its last result is too old to be applied
+        await asyncio.sleep(0.3)
+        assert manager.master_pool_count == 1
+        assert host.connects == 0
+
+        leader.write(key, is_master=None, lag=None, lsn=None, response_time=None)
+        await wait_for(lambda: manager.master_pool_count == 0)
+    finally:
+        await manager.close()
+        leader.close()
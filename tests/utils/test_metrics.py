@@ -0,0 +1,105 @@
+from lib.db.metrics import Histogram, PoolMetrics, PrometheusWriter, render_metrics, observe_statement
+from lib.db.statements import StatementStats
+
+
+class FakePool:
+    def get_size(self):
+        return 4
+
+    def get_idle_size(self):
+        return 1
+
+    def get_max_size(self):
+        return 10
+
+
+class FakeConnection:
+    pass
+
+
+class FakePoolManager:
+    def __init__(self):
+        self.metrics = PoolMetrics()
+        self.pools = (FakePool(), None)
+
+    def get_pool_host(self, pool):
+        return 'db1:5432'
+
+    def get_pool_freesize(self, pool):
+        return 6
+
+    def pool_is_master(self, pool):
+        return True
+
+    def pool_is_replica(self, pool):
+        return False
+
+    def get_replica_lag(self, pool):
+        return None
+
+    def get_last_response_time(self, pool):
+        return 0.002
+
+    def pool_is_allowed(self, pool):
+        return True
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram(buckets=(0.1, 1.))
+    for value in (0.05, 0.1, 0.5, 3.):
+        histogram.observe(value)
+
+    assert list(histogram.cumulative()) == [('0.1', 2), ('1.0', 3), ('+Inf', 4)]
+    assert histogram.count == 4
+    assert histogram.sum == 3.65
+
+
+def test_prometheus_writer_groups_and_escapes():
+    writer = PrometheusWriter()
+    writer.counter('requests_total', 'Requests', 1, path='/a"b')
+    writer.counter('requests_total', 'Requests', 2, path='/c')
+    writer.gauge('missing', 'Not measured', None)
+
+    assert writer.render() == (
+        '# HELP requests_total Requests\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{path="/a\\"b"} 1\n'
+        'requests_total{path="/c"} 2\n'
+        '# HELP missing Not measured\n'
+        '# TYPE missing gauge\n'
+    )
+
+
+def test_render_pool_metrics():
+    manager = FakePoolManager()
+    connection = FakeConnection()
+    manager.metrics.select_time.observe(0.0001)
+    manager.metrics.connection_acquired('db1:5432', connection, 0.003)
+    observe_statement(connection, 0.02)
+    manager.metrics.connection_released('db1:5432', connection)
+    manager.metrics.host('db1:5432').acquire_timeouts += 1
+    manager.metrics.host('db1:5432').shed += 2
+
+    stats = StatementStats()
+    stats.record(0.02, failed=False)
+
+    text = render_metrics(manager, {'select_user': stats})
+
+    assert 'db_pool_select_seconds_count 1\n' in text
+    assert 'db_pool_connections{host="db1:5432",state="used"} 3\n' in text
+    assert 'db_pool_connections{host="db1:5432",state="idle"} 1\n' in text
+    assert 'db_pool_free{host="db1:5432"} 6\n' in text
+    assert 'db_pool_available{host="db1:5432",role="master"} 1\n' in text
+    assert 'db_pool_acquire_timeouts_total{host="db1:5432"} 1\n' in text
+    assert 'db_pool_shed_total{host="db1:5432"} 2\n' in text
+    assert 'db_pool_breaker_open{host="db1:5432"} 0\n' in text
+    assert 'db_pool_acquire_seconds_bucket{host="db1:5432",le="0.005"} 1\n' in text
+    assert 'db_pool_hold_seconds_count{host="db1:5432"} 1\n' in text
+    assert 'db_statement_seconds_bucket{host="db1:5432",le="0.01"} 0\n' in text
+    assert 'db_statement_seconds_bucket{host="db1:5432",le="0.025"} 1\n' in text
+    assert 'db_statement_calls_total{statement="select_user"} 1\n' in text
+    assert 'db_replica_lag_seconds{' not in text
+
+    # every metric is described once and its samples follow the description
+    names = [line.split()[2] for line in text.splitlines() if line.startswith('# TYPE')]
+    assert len(names) == len(set(names))
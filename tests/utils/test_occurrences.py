@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from lib.models.common import EDay
+from lib.models.events import Repetition, ERepeatType
+from lib.util.occurrences import expand_repetitions
+from lib.util.repetitions import get_occurrence
+
+START_DATE = datetime(2022, 6, 26, 15, 0, 0)  # 26.06.2022 15:00
+
+REPETITIONS = [
+    Repetition(type=ERepeatType.daily, each=2),
+    Repetition(type=ERepeatType.weakly, each=3),
+    Repetition(type=ERepeatType.weakly, each=2, weekly_days=[EDay.tue, EDay.sat]),
+    Repetition(type=ERepeatType.monthly_number, each=1),
+    Repetition(type=ERepeatType.monthly_day_weekno, each=2),
+    Repetition(type=ERepeatType.monthly_day_weekno, each=1, monthly_last_week=True),
+    Repetition(type=ERepeatType.yearly, each=1),
+    Repetition(type=ERepeatType.workday, due_date=START_DATE + timedelta(weeks=30)),
+]
+
+
+def expected_intervals(start_time, end_time, repetition, time_from, time_to):
+    duration = end_time - start_time
+    result = []
+    if start_time < time_to and end_time > time_from:
+        result.append(start_time)
+
+    for index in range(2000):
+        occurrence = get_occurrence(repetition, start_time, index)
+        if occurrence >= time_to or (repetition.due_date and occurrence > repetition.due_date):
+            break
+        if occurrence > start_time and occurrence + duration > time_from:
+            result.append(occurrence)
+
+    return [(start, start + duration) for start in result]
+
+
+def to_list(starts: np.ndarray, ends: np.ndarray):
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def test_expand_single_repetition():
+    windows = [
+        (START_DATE - timedelta(days=10), START_DATE + timedelta(days=3)),
+        (START_DATE + timedelta(days=40, hours=15, minutes=30), START_DATE + timedelta(weeks=10)),
+        (datetime(2025, 1, 1), datetime(2025, 3, 1)),
+    ]
+
+    for repetition in REPETITIONS:
+        for start_time, duration in ((START_DATE, timedelta(hours=1)), (datetime(2022, 1, 31, 23), timedelta(hours=2))):
+            for time_from, time_to in windows:
+                starts, ends = expand_repetitions([(start_time, start_time + duration, repetition)], time_from, time_to)
+                assert to_list(starts, ends) == expected_intervals(
+                    start_time, start_time + duration, repetition, time_from, time_to
+                ), (repetition, start_time, time_from)
+
+
+def test_expand_many_repetitions():
+    time_from, time_to = START_DATE + timedelta(days=1), START_DATE + timedelta(weeks=4)
+    rows = [(START_DATE, START_DATE + timedelta(minutes=30), repetition) for repetition in REPETITIONS]
+    rows.append((START_DATE + timedelta(days=2), START_DATE + timedelta(days=2, hours=1), None))
+    rows.append((START_DATE, START_DATE + timedelta(hours=1), None))
+
+    starts, ends = expand_repetitions(rows, time_from, time_to)
+    expected = sorted(
+        interval
+        for row in rows
+        for interval in (
+            expected_intervals(*row, time_from, time_to) if row[2] else
+            [row[:2]] if row[0] < time_to and row[1] > time_from else []
+        )
+    )
+
+    assert starts.dtype == np.dtype('datetime64[us]')
+    assert to_list(starts, ends) == expected
+
+    starts, ends = expand_repetitions([], time_from, time_to)
+    assert len(starts) == len(ends) == 0
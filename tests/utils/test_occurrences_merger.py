@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+
+from lib.models.common import EDay
+from lib.models.events import Event, Repetition, ERepeatType
+from lib.models.users import User, Name
+from lib.sql.event import OccurrencesMerger, expand_event
+
+AUTHOR = User(login='test', name=Name(first='vova', last='last'))
+
+
+def make_event(event_id: int, start_time: datetime, hours: int = 1, repetition: Repetition = None) -> Event:
+    return Event(
+        id=event_id,
+        author=AUTHOR,
+        start_time=start_time,
+        end_time=start_time + timedelta(hours=hours),
+        repetition=repetition,
+    )
+
+
+def test_merger_yields_sorted_occurrences():
+    time_from, time_to = datetime(2022, 7, 1), datetime(2022, 8, 1)
+    events = sorted([
+        make_event(1, datetime(2022, 6, 1, 10), repetition=Repetition(type=ERepeatType.daily)),
+        make_event(2, datetime(2022, 6, 15, 9), repetition=Repetition(
+            type=ERepeatType.weakly, weekly_days=[EDay.mon, EDay.thu]
+        )),
+        make_event(3, datetime(2022, 6, 30, 23), hours=2),
+        make_event(4, datetime(2022, 7, 10, 10, 30)),
+        make_event(5, datetime(2022, 7, 20, 8), repetition=Repetition(type=ERepeatType.workday, each=1)),
+    ], key=lambda e: e.start_time)
+
+    merger = OccurrencesMerger(time_from, time_to)
+    result = []
+    for event in events:
+        result.extend(merger.push(event))
+    result.extend(merger.flush())
+
+    expected = sorted(
+        (occurrence for event in events for occurrence in expand_event(event, time_from, time_to)),
+        key=lambda e: (e.start_time, e.id)
+    )
+
+    assert [(e.id, e.start_time) for e in result] == [(e.id, e.start_time) for e in expected]
+    assert result[0].id == 3
+
+
+def test_merger_keeps_one_pending_occurrence_per_event():
+    time_from, time_to = datetime(2022, 1, 1), datetime(2023, 1, 1)
+    merger = OccurrencesMerger(time_from, time_to)
+
+    yielded = list(merger.push(make_event(1, datetime(2021, 1, 1, 10), repetition=Repetition(type=ERepeatType.daily))))
+    assert yielded == []
+    assert len(merger._heap) == 1
+
+    yielded = list(merger.push(make_event(2, datetime(2022, 1, 3, 12))))
+    assert [e.start_time for e in yielded] == [datetime(2022, 1, day, 10) for day in (1, 2, 3)]
+    assert len(merger._heap) == 2
+
+    assert len(list(merger.flush())) == 365 - 3 + 1
+
+
+def test_merger_resumes_after_key():
+    time_from, time_to = datetime(2022, 7, 1), datetime(2022, 8, 1)
+    events = [
+        make_event(1, datetime(2022, 6, 1, 10), repetition=Repetition(type=ERepeatType.daily)),
+        make_event(2, datetime(2022, 6, 1, 10), repetition=Repetition(type=ERepeatType.weakly)),
+        make_event(3, datetime(2022, 7, 15, 12)),
+    ]
+
+    def merge(after=None) -> list[Event]:
+        merger = OccurrencesMerger(time_from, time_to, after)
+        result = []
+        for event in events:
+            result.extend(merger.push(event))
+        return result + list(merger.flush())
+
+    full = merge()
+    for index in (0, 5, 6, len(full) - 1):
+        key = (full[index].start_time, full[index].id)
+        assert [(e.id, e.start_time) for e in merge(key)] == [(e.id, e.start_time) for e in full[index + 1:]]
@@ -1,7 +1,7 @@
 from lib.models.events import Repetition, ERepeatType
 from lib.models.common import EDay
 from lib.util.date import _get_next_month_num
-from lib.util.repetitions import iterate_repetitions
+from lib.util.repetitions import iterate_repetitions, get_occurrence, get_occurrence_index, seek_occurrence
 from datetime import datetime, timedelta
 from itertools import chain
 from dateutil.relativedelta import relativedelta
@@ -213,3 +213,69 @@ def test_workday_repetition():
         for i in range(1, 13, 1)
         if (START_DATE + timedelta(days=i)).weekday() in (0, 1, 2, 3, 4)
     ]
+
+
+def test_seek_daily_repetition_started_long_ago():
+    repetition = Repetition(type=ERepeatType.daily, each=3)
+    event_start = datetime(2015, 1, 1, 10)
+
+    result = seek_occurrence(repetition, event_start, START_DATE)
+    assert result == datetime(2022, 6, 29, 10)
+    assert (result - event_start).days % 3 == 0
+
+    assert seek_occurrence(repetition, event_start, START_DATE, k=2) == datetime(2022, 7, 5, 10)
+    assert seek_occurrence(repetition, event_start, datetime(2022, 6, 29, 10)) == datetime(2022, 6, 29, 10)
+
+    repetition.due_date = datetime(2022, 6, 1)
+    assert seek_occurrence(repetition, event_start, START_DATE) is None
+
+
+def test_seek_weekly_days_repetition():
+    repetition = Repetition(type=ERepeatType.weakly, each=2, weekly_days=[EDay.fri, EDay.mon])
+    event_start = datetime(2022, 6, 1, 12)  # wednesday
+
+    assert seek_occurrence(repetition, event_start, event_start) == datetime(2022, 6, 3, 12)
+    assert seek_occurrence(repetition, event_start, datetime(2022, 6, 3, 13)) == datetime(2022, 6, 13, 12)
+    assert seek_occurrence(repetition, event_start, datetime(2022, 6, 8)) == datetime(2022, 6, 13, 12)
+    assert seek_occurrence(repetition, event_start, datetime(2022, 6, 13, 12)) == datetime(2022, 6, 13, 12)
+    assert seek_occurrence(repetition, event_start, datetime(2022, 6, 13, 12), k=1) == datetime(2022, 6, 17, 12)
+
+
+def test_seek_monthly_repetition_does_not_drift():
+    repetition = Repetition(type=ERepeatType.monthly_number)
+    event_start = datetime(2022, 1, 31, 9)
+
+    result = [get_occurrence(repetition, event_start, i) for i in range(4)]
+    assert result == [
+        datetime(2022, 1, 31, 9),
+        datetime(2022, 2, 28, 9),
+        datetime(2022, 3, 31, 9),
+        datetime(2022, 4, 30, 9),
+    ]
+
+    assert seek_occurrence(repetition, event_start, datetime(2022, 3, 1)) == datetime(2022, 3, 31, 9)
+
+
+def test_occurrence_index_matches_enumeration():
+    repetitions = [
+        Repetition(type=ERepeatType.daily, each=2),
+        Repetition(type=ERepeatType.weakly, each=3),
+        Repetition(type=ERepeatType.weakly, each=2, weekly_days=[EDay.tue, EDay.sat]),
+        Repetition(type=ERepeatType.monthly_number, each=1),
+        Repetition(type=ERepeatType.monthly_day_weekno, each=2),
+        Repetition(type=ERepeatType.monthly_day_weekno, each=1, monthly_last_week=True),
+        Repetition(type=ERepeatType.yearly, each=1),
+        Repetition(type=ERepeatType.workday),
+    ]
+
+    for repetition in repetitions:
+        occurrences = [get_occurrence(repetition, START_DATE, i) for i in range(60)]
+        assert occurrences == sorted(occurrences)
+
+        moment = START_DATE - timedelta(days=3)
+        while moment < occurrences[-1]:
+            index = get_occurrence_index(repetition, START_DATE, moment)
+            assert occurrences[index] >= moment
+            assert index == 0 or occurrences[index - 1] < moment
+
+            moment += timedelta(hours=13)
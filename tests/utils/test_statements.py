@@ -0,0 +1,171 @@
+import inspect
+
+import asyncpg
+import pytest
+from asyncpg.connresource import ConnectionResource
+from asyncpg.prepared_stmt import PreparedStatement
+
+from lib.db.metrics import raw_connection_of
+from lib.db.statements import Statement, EStatementMode, STATEMENTS, get_statements_stats, set_statement_mode
+from tests.full_wait import full_wait_pending
+
+
+class FakePrepared:
+    def __init__(self, connection, sql, name):
+        self._con_release_ctr = connection._pool_release_ctr
+        self.connection = connection
+        self.sql = sql
+        self.name = name
+
+    async def fetch(self, *args):
+        if self.name in self.connection.deallocated:
+            raise asyncpg.exceptions.InvalidSQLStatementNameError(f'prepared statement "{self.name}" does not exist')
+        return [('prepared', self.sql, args)]
+
+
+class FakeConnection:
+    def __init__(self):
+        self._pool_release_ctr = 0
+        self.prepared = []
+        self.fetched = []
+        # names of statements deallocated on server or prepared by other clients of server connection
+        self.deallocated = set()
+        self.taken = set()
+        self.in_transaction = False
+
+    def is_closed(self):
+        return False
+
+    def is_in_transaction(self):
+        return self.in_transaction
+
+    async def prepare(self, sql, name=None):
+        self.prepared.append(name)
+        if name in self.taken:
+            raise asyncpg.exceptions.DuplicatePreparedStatementError(f'prepared statement "{name}" already exists')
+        return FakePrepared(self, sql, name)
+
+    async def fetch(self, sql, *args):
+        self.fetched.append(sql)
+        return [('plain', sql, args)]
+
+
+@pytest.fixture
+def statement():
+    statement = Statement('test_statement', 'SELECT $1::int')
+    yield statement
+    STATEMENTS.pop(statement.name)
+    set_statement_mode(EStatementMode.named)
+
+
+def test_statement_declared_once(statement):
+    with pytest.raises(ValueError):
+        Statement('test_statement', 'SELECT 1')
+
+    assert statement.server_name.startswith('test_statement_')
+    assert get_statements_stats()['test_statement'] is statement.stats
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_statement_prepared_once_per_connection(statement):
+    first, second = FakeConnection(), FakeConnection()
+
+    assert await statement.fetch(first, 1) == [('prepared', 'SELECT $1::int', (1,))]
+    assert await statement.fetch(first, 2) == [('prepared', 'SELECT $1::int', (2,))]
+    assert await statement.fetch(second, 3) == [('prepared', 'SELECT $1::int', (3,))]
+
+    assert first.prepared == [statement.server_name]
+    assert second.prepared == [statement.server_name]
+    assert statement.stats.calls == 3
+    assert statement.stats.prepares == 2
+    assert statement.stats.errors == 0
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_statement_unnamed_mode(statement):
+    set_statement_mode(EStatementMode.unnamed)
+    connection = FakeConnection()
+
+    assert await statement.fetch(connection, 1) == [('plain', 'SELECT $1::int', (1,))]
+    assert connection.prepared == []
+    assert connection.fetched == ['SELECT $1::int']
+    assert statement.stats.calls == 1
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_deallocated_statement_is_not_prepared_in_aborted_transaction(statement):
+    connection = FakeConnection()
+    await statement.fetch(connection, 1)
+
+    connection.deallocated.add(statement.server_name)
+    connection.in_transaction = True
+    with pytest.raises(asyncpg.exceptions.InvalidSQLStatementNameError):
+        await statement.fetch(connection, 2)
+    assert connection.prepared == [statement.server_name]
+
+    # next call prepares statement under a new name
+    assert await statement.fetch(connection, 3) == [('prepared', 'SELECT $1::int', (3,))]
+    assert connection.prepared == [statement.server_name, f'{statement.server_name}_1']
+    assert statement.stats.prepares == 2
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_taken_statement_name_in_transaction(statement):
+    connection = FakeConnection()
+    connection.taken.add(statement.server_name)
+    connection.in_transaction = True
+
+    with pytest.raises(asyncpg.exceptions.DuplicatePreparedStatementError):
+        await statement.fetch(connection, 1)
+    assert connection.prepared == [statement.server_name]
+
+    assert await statement.fetch(connection, 2) == [('prepared', 'SELECT $1::int', (2,))]
+    assert connection.prepared == [statement.server_name, f'{statement.server_name}_1']
+
+
+def test_asyncpg_internals():
+    # ConnectionStatements wraps state of prepared statement again after connection is released to pool
+    assert '_pool_release_ctr' in asyncpg.Connection.__slots__
+    assert '_con_release_ctr' in ConnectionResource.__slots__
+    assert '_state' in PreparedStatement.__slots__
+    assert list(inspect.signature(PreparedStatement.__init__).parameters) == ['self', 'connection', 'query', 'state']
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_statement_prepared_again_after_deallocate(db, statement):
+    other = Statement('test_other_statement', 'SELECT $1::int + 2')
+    try:
+        async with db.connect() as connection:
+            assert await statement.fetchval(connection, 1) == 1
+            await connection.execute('DEALLOCATE ALL')
+            assert await statement.fetchval(connection, 2) == 2
+
+            # asyncpg closes dropped statements on server when next statement is prepared
+            assert await other.fetchval(connection, 1) == 3
+            names = {row['name'] for row in await connection.fetch('SELECT name FROM pg_prepared_statements')}
+            assert any(name.startswith(statement.server_name) for name in names)
+
+            assert await statement.fetchval(connection, 3) == 3
+    finally:
+        STATEMENTS.pop(other.name)
+
+    assert statement.stats.prepares == 2
+    assert statement.stats.errors == 0
+
+
+@pytest.mark.asyncio
+@full_wait_pending
+async def test_statement_kept_prepared_after_release(db, statement):
+    connections = set()
+    # more acquires than connections in pool, so some of connections are acquired again
+    for value in range(db.max_size * 2):
+        async with db.connect() as connection:
+            connections.add(raw_connection_of(connection))
+            assert await statement.fetchval(connection, value) == value
+
+    assert statement.stats.prepares == len(connections)